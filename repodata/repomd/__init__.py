@@ -35,8 +35,19 @@ Example:
 >     print patch.description
 """
 
+import threading
+
 from repomdxml import RepoMdXml
 from repository import Repository
+from snapshot import SnapshotCache
+from patchstore import PatchStore
+from downloader import BulkDownloader
+from repodata.retry import Deadline, HostLimiter
+from prefetch import Future
+from verifier import MirrorVerifier
+from updateindex import UpdateInfoIndex
+from applicability import ApplicabilityEngine
+from rpmver import getLatestPackages
 # pyflakes=ignore
 from errors import RepoMdError, ParseError, UnknownElementError, DownloadError
 
@@ -45,30 +56,232 @@ __all__ = ('Client', 'RepoMdError', 'ParseError', 'UnknownElementError')
 class Client(object):
     """
     Client object for extracting information from repository metadata.
+
+    A client can be shared by several threads. repomd.xml is fetched once,
+    by the first thread to need it, and every call that parses a data file
+    sets up its own parser state.
     """
 
     RepositoryFactory = Repository
     RepoMdXmlFactory = RepoMdXml
+    SnapshotCacheFactory = SnapshotCache
+    PatchStoreFactory = PatchStore
+    BulkDownloaderFactory = BulkDownloader
+    MirrorVerifierFactory = MirrorVerifier
+    UpdateInfoIndexFactory = UpdateInfoIndex
+    ApplicabilityEngineFactory = ApplicabilityEngine
+
+    def __init__(self, repoUrl, proxyMap=None, snapshotDir=None,
+            metrics=None, fileListStore=None, mirrorList=None,
+            metalink=None, hedgeDelay=None, retryPolicy=None,
+            syncTimeout=None, cacheDir=None, prefetch=None, storage=None,
+            hedgeThroughput=None):
+        """
+        @param snapshotDir: optional directory for caching parsed package
+        data between runs
+        @type snapshotDir: string
+        @param metrics: optional receiver of download, decompress and parse
+        statistics
+        @type metrics: repomd.instrument.MetricsSink
+        @param fileListStore: optional store of parsed file lists, shared
+        with the clients of other repositories
+        @type fileListStore: repomd.fileliststore.FileListStore
+        @param mirrorList: optional url of a list of mirrors to download from
+        instead of repoUrl, ranked by their measured speed. repoUrl is used
+        when all mirrors fail.
+        @type mirrorList: string
+        @param metalink: optional url of a metalink listing mirrors, used
+        like mirrorList
+        @type metalink: string
+        @param hedgeDelay: optional seconds after which metadata that has
+        not started arriving from one mirror is also requested from the
+        next one. Requires mirrorList or metalink. Packages are not hedged.
+        @type hedgeDelay: float
+        @param retryPolicy: optional policy for retrying failed downloads
+        @type retryPolicy: repodata.retry.RetryPolicy
+        @param syncTimeout: optional number of seconds the downloads of each
+        call of this client have to finish in, failed downloads are not
+        retried past it
+        @type syncTimeout: float
+        @param cacheDir: optional directory of downloaded metadata shared
+        by all processes on the host. Each metadata file is downloaded once
+        per change, by whichever process asks for it first.
+        @type cacheDir: string
+        @param prefetch: optional data types to download in the background,
+        for example ('primary', 'updateinfo'). repomd.xml is fetched as
+        soon as the client is created and the data files as soon as their
+        locations are known. Each prefetched file is used by the first
+        method that reads it, later calls download it again. Data types
+        loaded from a snapshot are not prefetched, files nobody reads are
+        closed after Repository.PREFETCH_TTL seconds.
+        @param storage: optional backend to read the repository from, for
+        example an in-memory or tar archive copy. repoUrl is still used to
+        name the repository.
+        @type storage: repomd.storage.Storage
+        @param hedgeThroughput: optional bytes per second metadata has to
+        arrive with after hedgeDelay to not be requested from the next
+        mirror as well
+        @type hedgeThroughput: float
+        """
 
-    def __init__(self, repoUrl, proxyMap=None):
         self._repoUrl = repoUrl
+        self._proxyMap = proxyMap
+        self._mirrorList = mirrorList
+        self._metalink = metalink
+        self._storage = storage
+
+        self._retryPolicy = retryPolicy
+        self._syncTimeout = syncTimeout
 
         self._baseMdPath = '/repodata/repomd.xml'
-        self._repo = self.RepositoryFactory(self._repoUrl, proxyMap)
+        self._repo = self.RepositoryFactory(self._repoUrl, proxyMap,
+            metrics=metrics, mirrorList=mirrorList, metalink=metalink,
+            hedgeDelay=hedgeDelay, hedgeThroughput=hedgeThroughput,
+            retryPolicy=retryPolicy, cacheDir=cacheDir, storage=storage)
         self._repomdXml = None
+        self._repomdFuture = None
+        # Guards fetching repomd.xml
+        self._repomdLock = threading.RLock()
+
+        self._fileListStore = fileListStore
+
+        self._snapshots = None
+        if snapshotDir is not None:
+            self._snapshots = self.SnapshotCacheFactory(snapshotDir)
+
+        if prefetch:
+            self._repomdFuture = Future(self._prefetch, tuple(prefetch))
 
     @property
     def repomdXml(self):
-        if self._repomdXml is None:
-            self._repomdXml = self.RepoMdXmlFactory(self._repo, self._baseMdPath).parse()
-        return self._repomdXml
+        return self._getRepoMdXml(self._repo)
+
+    def _getRepoMdXml(self, repository):
+        repomdXml = self._repomdXml
+        if repomdXml is not None:
+            return repomdXml
+
+        self._repomdLock.acquire()
+        try:
+            if self._repomdXml is None:
+                if self._repomdFuture is not None:
+                    future, self._repomdFuture = self._repomdFuture, None
+                    self._repomdXml = future.result()
+                else:
+                    self._repomdXml = self._parseRepoMd(repository)
+            return self._repomdXml
+        finally:
+            self._repomdLock.release()
+
+    def _startSync(self):
+        """
+        Set up the downloads of one call. Each call gets its own deadline,
+        so calls running in other threads do not extend or cut short its
+        sync timeout.
+        @return repository to download through during the call
+        """
+
+        if self._syncTimeout is None:
+            return self._repo
+        return self._repo.withDeadline(Deadline(self._syncTimeout))
+
+    def _parseRepoMd(self, repository=None):
+        return self.RepoMdXmlFactory(self._repo,
+            self._baseMdPath).parse(repository)
+
+    def refresh(self):
+        """
+        Fetch repomd.xml again, later calls read the data files it lists.
+        @return True if the metadata changed since repomd.xml was last
+        fetched, or if it had not been fetched yet
+        """
+
+        repo = self._startSync()
+        self._repomdLock.acquire()
+        try:
+            old = self._repomdXml
+            if old is None:
+                self._getRepoMdXml(repo)
+                return True
+            # Other threads keep using the old metadata until the new one
+            # is parsed
+            new = self._repomdXml = self._parseRepoMd(repo)
+        finally:
+            self._repomdLock.release()
+        if old.getFingerprint() == new.getFingerprint():
+            return False
+        # Files prefetched for the old metadata would never be used
+        self._repo.dropPrefetched()
+        return True
+
+    def _prefetch(self, dataTypes):
+        """
+        Parse repomd.xml and start downloading the data files of dataTypes.
+        Runs in the background.
+        @return repomd.repomdxml._RepoMd
+        """
+
+        repomdXml = self._parseRepoMd()
+        for dataType in dataTypes:
+            node = repomdXml.getRepoData(dataType)
+            if node is None:
+                continue
+            # The file would never be read
+            if (self._snapshots is not None and
+                    self._snapshots.has(node.type, node.checksum)):
+                continue
+            self._repo.prefetch(node.location, node.checksum,
+                node.checksumType)
+        return repomdXml
 
     def download(self, relativePath, computeShaDigest=False):
         """
         Download a file from the repository.
         @return file object
         """
-        return self._repo.get(relativePath, computeShaDigest=computeShaDigest)
+        repo = self._startSync()
+        return repo.get(relativePath, computeShaDigest=computeShaDigest)
+
+    def downloadPackages(self, packages, destDir, maxWorkers=None,
+            maxPerHost=None):
+        """
+        Download the files of many packages in parallel. Files that already
+        exist in destDir with the checksum from the metadata are skipped,
+        downloaded files are verified against it.
+        @param packages: iterable of repomd.packagexml._Package
+        @param destDir: directory to download to, locations of the packages
+        are kept relative to it
+        @type destDir: string
+        @param maxWorkers: number of download threads
+        @param maxPerHost: number of concurrent requests to one host
+        @return repomd.downloader.DownloadReport
+        """
+
+        deadline = None
+        if self._syncTimeout is not None:
+            deadline = Deadline(self._syncTimeout)
+        # One repository for all workers, so the mirror list is fetched once
+        repository = self.RepositoryFactory(self._repoUrl, self._proxyMap,
+            mirrorList=self._mirrorList, metalink=self._metalink,
+            retryPolicy=self._retryPolicy, deadline=deadline,
+            storage=self._storage, hostLimiter=HostLimiter(maxPerHost))
+        downloader = self.BulkDownloaderFactory(repository,
+            maxWorkers=maxWorkers)
+        return downloader.download(packages, destDir)
+
+    def verifyMirror(self, mirrorDir, processes=None):
+        """
+        Check that every package in the repository exists in a local mirror
+        with the size and checksum from the metadata.
+        @param mirrorDir: root directory of the mirror
+        @type mirrorDir: string
+        @param processes: number of hashing processes, defaults to the
+        number of CPUs
+        @return repomd.verifier.VerifyReport
+        """
+
+        verifier = self.MirrorVerifierFactory(processes=processes)
+        return verifier.verify(self.getPackageDetail(lazy=True), mirrorDir)
 
     def getRepos(self):
         """
@@ -79,7 +292,8 @@ class Client(object):
         return self._repo
 
     def getPrimaryDetail(self):
-        node = self.repomdXml.getRepoData('primary')
+        repo = self._startSync()
+        node = self._getRepoMdXml(repo).getRepoData('primary')
         return node
 
     def getPatchDetail(self):
@@ -88,33 +302,86 @@ class Client(object):
         @return [repomd.patchxml._Patch, ...]
         """
 
-        node = self.repomdXml.getRepoData('patches')
+        repo = self._startSync()
+        node = self._getRepoMdXml(repo).getRepoData('patches')
 
         if node is None:
             return []
 
-        ret = []
-        for sn in node.iterSubnodes():
-            sn._parser._repository = self._repo
-            ret.append(sn.parseChildren())
-        return ret
+        return [ self._fetchPatch(x, repo) for x in node.iterSubnodes(repo) ]
+
+    def _fetchPatch(self, element, repository=None):
+        # W0212 - Access to a protected member _parser of a client class
+        # pylint: disable-msg=W0212
+
+        # Patch packages use the package class of the other metadata. The
+        # element and its parser are new for every parse of patches.xml.
+        parser = element._parser
+        factory = self.repomdXml.PackageFactory
+        if parser.PackageFactory is not factory:
+            parser.PackageFactory = factory
+            parser._compileTypes()
+        return parser.parse(repository or self._repo)
 
-    def getPackageDetail(self):
+    def syncPatchDetail(self, storePath):
+        """
+        Get all patches in the repository, only downloading the patch files
+        that changed since the last sync against the same store.
+        @param storePath: file the parsed patches are kept in between runs
+        @type storePath: string
+        @return repomd.patchstore.PatchSyncResult
+        """
+
+        repo = self._startSync()
+        repomdXml = self._getRepoMdXml(repo)
+        store = self.PatchStoreFactory(storePath, repomdXml.PackageFactory)
+        fetch = lambda x: self._fetchPatch(x, repo)
+        node = repomdXml.getRepoData('patches')
+        if node is None:
+            return store.sync([], fetch)
+        return store.sync(node.iterSubnodes(repo), fetch)
+
+    def getPackageDetail(self, lazy=False):
         """
         Get a list instances representing all packages in the repository.
+        @param lazy: only decode name, epoch, version, release, arch,
+        checksum and location while parsing, other attributes are decoded
+        on first access. Ignored when a snapshot directory is configured.
+        @type lazy: boolean
         @ return [repomd.packagexml._Package, ...]
         """
 
-        node = self.repomdXml.getRepoData('primary')
-        return node.iterSubnodes()
+        repo = self._startSync()
+        repomdXml = self._getRepoMdXml(repo)
+        node = repomdXml.getRepoData('primary')
+        if self._snapshots is not None:
+            return self._snapshots.iterPackages(node,
+                repomdXml.PackageFactory, repo)
+        if lazy:
+            return node._parser.parseLazy(repo)
+        return node.iterSubnodes(repo)
+
+    def getLatestPackages(self, lazy=True):
+        """
+        Get the newest package for each name and arch in the repository.
+        @param lazy: passed to getPackageDetail(), by default only the
+        fields needed for the comparison are decoded while parsing
+        @type lazy: boolean
+        @return dictionary of (name, arch) to repomd.packagexml._Package
+        """
+
+        return getLatestPackages(self.getPackageDetail(lazy=lazy))
 
     def getFileLists(self):
         """
         Get a list instances representing filelists in the repository.
         @ return [repomd.filelistsxml._Package, ...]
         """
-        node = self.repomdXml.getRepoData('filelists')
-        return node.iterSubnodes()
+        repo = self._startSync()
+        node = self._getRepoMdXml(repo).getRepoData('filelists')
+        if self._fileListStore is not None:
+            return node._parser.parseShared(self._fileListStore, repo)
+        return node.iterSubnodes(repo)
 
     def getUpdateInfo(self):
         """
@@ -123,9 +390,39 @@ class Client(object):
         @return [ repomd.userinfoxml._Update ]
         """
 
-        node = self.repomdXml.getRepoData('updateinfo')
+        return self._getUpdateInfo(self._startSync())
+
+    def _getUpdateInfo(self, repository):
+        node = self._getRepoMdXml(repository).getRepoData('updateinfo')
 
         if not node:
             return []
 
-        return node.iterSubnodes()
+        if self._snapshots is not None:
+            return self._snapshots.iterUpdates(node, repository)
+        return node.iterSubnodes(repository)
+
+    def getUpdateIndex(self):
+        """
+        Get an index of all updates by advisory id, reference and package.
+        The parsed updates and the index persist in the snapshot directory,
+        if one is configured, keyed by the updateinfo checksum.
+        @return repomd.updateindex.UpdateInfoIndex
+        """
+
+        repo = self._startSync()
+        node = self._getRepoMdXml(repo).getRepoData('updateinfo')
+
+        if node and self._snapshots is not None:
+            return self._snapshots.getUpdateIndex(node,
+                self.UpdateInfoIndexFactory, repo)
+        return self.UpdateInfoIndexFactory(self._getUpdateInfo(repo))
+
+    def getApplicabilityEngine(self):
+        """
+        Get an engine for evaluating which updates apply to installed
+        package sets.
+        @return repomd.applicability.ApplicabilityEngine
+        """
+
+        return self.ApplicabilityEngineFactory(self.getUpdateInfo())
@@ -0,0 +1,104 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Evaluate which updateinfo advisories apply to sets of installed packages.
+
+An advisory applies to a host when it lists a package with the name and a
+compatible arch of an installed package, at a newer epoch, version and
+release.
+
+Example:
+> engine = client.getApplicabilityEngine()
+> results = engine.evaluate({
+>     'host1': [ ('curl', '0', '7.19.0', '11.20.1', 'i586'), ... ],
+>     'host2': [ ... ],
+> })
+> for update in results['host1']:
+>     print update.id
+"""
+
+__all__ = ('ApplicabilityEngine', )
+
+from rpmver import evrKey
+
+
+class ApplicabilityEngine(object):
+    """
+    Name-keyed index of advisory packages. Results per installed package are
+    cached, so evaluating many hosts that share package versions only costs
+    a dictionary lookup per installed package.
+    """
+
+    def __init__(self, updates):
+        # name -> [ (arch, evr key, update ordinal), ... ]
+        self._byName = {}
+        self._updates = []
+        # installed nevra -> tuple of update ordinals
+        self._cache = {}
+
+        for update in updates:
+            ordinal = len(self._updates)
+            self._updates.append(update)
+            for pkg in update.pkglist or ():
+                key = evrKey(pkg.epoch, pkg.version, pkg.release)
+                self._byName.setdefault(pkg.name, []).append(
+                    (pkg.arch, key, ordinal))
+
+    @classmethod
+    def _isCompatibleArch(cls, installedArch, updateArch):
+        return (installedArch == updateArch or installedArch == 'noarch'
+                or updateArch == 'noarch')
+
+    def _getApplicableOrdinals(self, nevra):
+        ordinals = self._cache.get(nevra)
+        if ordinals is not None:
+            return ordinals
+
+        name, epoch, version, release, arch = nevra
+        installedKey = evrKey(epoch, version, release)
+        ordinals = tuple(ordinal
+            for updateArch, key, ordinal in self._byName[name]
+            if key > installedKey and
+                self._isCompatibleArch(arch, updateArch))
+        self._cache[nevra] = ordinals
+        return ordinals
+
+    def getApplicable(self, installed):
+        """
+        Get the advisories that apply to one set of installed packages.
+        @param installed: iterable of (name, epoch, version, release, arch)
+        @return list of updates, in updateinfo order
+        """
+
+        byName = self._byName
+        ordinals = set()
+        for nevra in installed:
+            if nevra[0] in byName:
+                ordinals.update(self._getApplicableOrdinals(tuple(nevra)))
+        return [ self._updates[x] for x in sorted(ordinals) ]
+
+    def evaluate(self, hosts):
+        """
+        Get the applicable advisories for many hosts.
+        @param hosts: dictionary of host id to iterable of installed
+        (name, epoch, version, release, arch) tuples
+        @return dictionary of host id to list of updates
+        """
+
+        return dict((hostId, self.getApplicable(installed))
+                    for hostId, installed in hosts.iteritems())
@@ -0,0 +1,114 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Checksums of repository files, as listed in the metadata.
+"""
+
+__all__ = ('getDigest', 'fileChecksum', 'verifyFile',
+    'UnsupportedChecksumError', 'ChecksumMismatchError', )
+
+from conary.lib import digestlib
+
+from errors import RepoMdError
+
+# Map of checksum type used in the metadata to digestlib constructor. Old
+# yum metadata uses sha for sha1. Types conary does not provide a digest
+# for are unsupported.
+CHECKSUM_TYPES = {
+    'md5': 'md5',
+    'sha': 'sha1',
+    'sha1': 'sha1',
+    'sha224': 'sha224',
+    'sha256': 'sha256',
+    'sha384': 'sha384',
+    'sha512': 'sha512',
+}
+
+# Large sequential reads keep hashing of big files close to disk speed
+BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class UnsupportedChecksumError(RepoMdError):
+    """
+    Raised for checksum types that are not supported.
+    """
+
+    def __init__(self, checksumType):
+        RepoMdError.__init__(self)
+        self.checksumType = checksumType
+
+    def __str__(self):
+        return 'Unsupported checksum type %s' % (self.checksumType, )
+
+
+class ChecksumMismatchError(RepoMdError):
+    """
+    Raised when the contents of a file do not match the checksum listed in
+    the metadata.
+    """
+
+    def __init__(self, path, expected, actual):
+        RepoMdError.__init__(self)
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        return 'Checksum mismatch for %s: expected %s, got %s' % (
+            self.path, self.expected, self.actual)
+
+
+def getDigest(checksumType):
+    """
+    Create a digest object for a checksum type from the metadata.
+    @raise UnsupportedChecksumError: for unknown checksum types
+    """
+
+    algorithm = CHECKSUM_TYPES.get((checksumType or 'sha').lower())
+    factory = algorithm and getattr(digestlib, algorithm, None)
+    if factory is None:
+        raise UnsupportedChecksumError(checksumType)
+    return factory()
+
+def fileChecksum(path, checksumType):
+    """
+    Compute the checksum of a local file.
+    @return hex digest, or None if the file does not exist
+    """
+
+    digest = getDigest(checksumType)
+    try:
+        fobj = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        while True:
+            buf = fobj.read(BUFFER_SIZE)
+            if not buf:
+                break
+            digest.update(buf)
+    finally:
+        fobj.close()
+    return digest.hexdigest()
+
+def verifyFile(path, checksum, checksumType):
+    """
+    @return True if the local file exists and has the given checksum
+    """
+
+    return fileChecksum(path, checksumType) == checksum
@@ -0,0 +1,262 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Parallel download of the package files of a repository.
+
+Files that already exist in the destination with the checksum listed in the
+metadata are skipped. Everything else is downloaded by a pool of threads
+sharing one repository, verified while it is written to a temporary file and
+renamed into place once the checksum matches. Concurrent requests per host
+are limited by the repodata.retry.HostLimiter of the repository.
+
+Example:
+> report = client.downloadPackages(client.getPackageDetail(lazy=True),
+>                                  '/srv/mirror/sles')
+> print '%d downloaded, %d skipped, %.1f MB/sec' % (len(report.downloaded),
+>     len(report.skipped), report.throughput / 1024 / 1024)
+> for location, error in report.failed:
+>     print location, error
+"""
+
+__all__ = ('BulkDownloader', 'DownloadReport', 'UnsafeLocationError', )
+
+import os
+import time
+import Queue
+import tempfile
+import threading
+
+from checksum import getDigest, fileChecksum, ChecksumMismatchError
+from errors import RepoMdError
+
+
+def _getUmask():
+    """
+    Get the umask of the process. Linux reports it in /proc, elsewhere it
+    can only be read by setting it, which briefly affects other threads.
+    """
+
+    try:
+        fobj = open('/proc/self/status')
+        try:
+            for line in fobj:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+        finally:
+            fobj.close()
+    except (IOError, ValueError, IndexError):
+        pass
+
+    umask = os.umask(022)
+    os.umask(umask)
+    return umask
+
+
+class UnsafeLocationError(RepoMdError):
+    """
+    Raised for package locations that point outside of the destination
+    directory.
+    """
+
+
+class DownloadReport(object):
+    """
+    Outcome of a bulk download.
+    @ivar downloaded: locations of the files that were downloaded
+    @ivar skipped: locations of the files that were already up to date
+    @ivar failed: list of (location, error message)
+    @ivar bytes: number of bytes downloaded
+    @ivar seconds: wall clock time of the whole download
+    """
+
+    __slots__ = ('downloaded', 'skipped', 'failed', 'bytes', 'seconds')
+
+    def __init__(self):
+        self.downloaded = []
+        self.skipped = []
+        self.failed = []
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        """
+        Bytes downloaded per second.
+        """
+
+        if not self.seconds:
+            return 0.0
+        return self.bytes / self.seconds
+
+
+class BulkDownloader(object):
+    """
+    Download package files with a pool of threads, all reading from the
+    same repository.
+    """
+
+    MAX_WORKERS = 8
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, repository, maxWorkers=None):
+        """
+        @param repository: repository to download from
+        @type repository: repomd.repository.Repository
+        @param maxWorkers: number of download threads
+        """
+
+        self._repository = repository
+        self._maxWorkers = maxWorkers or self.MAX_WORKERS
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _getDestPath(cls, destDir, location):
+        """
+        Map a package location to a path below destDir.
+        """
+
+        destDir = os.path.abspath(destDir)
+        path = os.path.normpath(os.path.join(destDir, location.lstrip('/')))
+        if not path.startswith(destDir + os.sep):
+            raise UnsafeLocationError('Location %s is outside of %s' %
+                (location, destDir))
+        return path
+
+    def download(self, packages, destDir):
+        """
+        Download the files of packages into destDir, keeping the relative
+        location of each file.
+        @param packages: iterable of repomd.packagexml._Package
+        @param destDir: destination directory
+        @rtype: DownloadReport
+        """
+
+        report = DownloadReport()
+        # Workers take packages as they are produced, the queue only holds
+        # a few entries ahead of them.
+        queue = Queue.Queue(self._maxWorkers * 2)
+        mode = 0666 & ~_getUmask()
+
+        start = time.time()
+        threads = []
+        try:
+            for pkg in packages:
+                if len(threads) < self._maxWorkers:
+                    thread = threading.Thread(target=self._worker,
+                        args=(queue, destDir, mode, report))
+                    thread.setDaemon(True)
+                    thread.start()
+                    threads.append(thread)
+                queue.put((pkg.location, pkg.checksum, pkg.checksumType))
+        finally:
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+        report.seconds = time.time() - start
+
+        return report
+
+    def _worker(self, queue, destDir, mode, report):
+        while True:
+            entry = queue.get()
+            if entry is None:
+                return
+            location, checksum, checksumType = entry
+
+            # Any error only fails the file it happened on, the worker goes
+            # on with the next one.
+            try:
+                size = self._fetch(location, checksum, checksumType, destDir,
+                    mode)
+            except Exception, e:
+                self._record(report.failed,
+                    (location, str(e) or e.__class__.__name__))
+                continue
+
+            if size is None:
+                self._record(report.skipped, location)
+            else:
+                self._lock.acquire()
+                try:
+                    report.downloaded.append(location)
+                    report.bytes += size
+                finally:
+                    self._lock.release()
+
+    def _record(self, entries, entry):
+        self._lock.acquire()
+        try:
+            entries.append(entry)
+        finally:
+            self._lock.release()
+
+    def _fetch(self, location, checksum, checksumType, destDir, mode):
+        """
+        Download one file unless it is up to date. Files without a checksum
+        in the metadata are always downloaded and can not be verified.
+        @param mode: permissions of the downloaded file
+        @return number of bytes downloaded, or None if the file was skipped
+        """
+
+        path = self._getDestPath(destDir, location)
+        if (checksum is not None and
+                fileChecksum(path, checksumType) == checksum):
+            return None
+
+        targetDir = os.path.dirname(path)
+        if not os.path.isdir(targetDir):
+            try:
+                os.makedirs(targetDir)
+            except OSError:
+                # Created by another thread
+                if not os.path.isdir(targetDir):
+                    raise
+
+        digest = getDigest(checksumType)
+
+        fd, tmpPath = tempfile.mkstemp(dir=targetDir, prefix='.download')
+        try:
+            fobj = os.fdopen(fd, 'wb')
+            size = 0
+            try:
+                inf = self._repository.open(location)
+                try:
+                    while True:
+                        buf = inf.read(self.BUFFER_SIZE)
+                        if not buf:
+                            break
+                        digest.update(buf)
+                        fobj.write(buf)
+                        size += len(buf)
+                finally:
+                    inf.close()
+            finally:
+                fobj.close()
+
+            actual = digest.hexdigest()
+            if checksum is not None and actual != checksum:
+                raise ChecksumMismatchError(location, checksum, actual)
+            # mkstemp creates files only readable by the owner
+            os.chmod(tmpPath, mode)
+            os.rename(tmpPath, path)
+        except:
+            if os.path.exists(tmpPath):
+                os.unlink(tmpPath)
+            raise
+        return size
@@ -21,10 +21,16 @@ Errors specific to repomd module.
 
 __all__ = ('RepoMdError', 'ParseError', 'UnknownElementError')
 
+import xml.sax
+import xml.parsers.expat
+
 from repodata import errors
 
 DownloadError = errors.TransportError
 
+# Errors the xml parsers raise for malformed documents
+XmlErrors = (xml.parsers.expat.ExpatError, xml.sax.SAXException)
+
 
 class RepoMdError(errors.RepositoryError):
     """
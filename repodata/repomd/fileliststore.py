@@ -0,0 +1,154 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Store of parsed file lists keyed by package id, shared between repositories.
+
+The same package, identified by the checksum filelists.xml lists as its
+pkgid, is often part of several repositories. Passing one store to the
+clients of all of them means each file list is parsed and held in memory
+once, however many repositories carry the package.
+
+Example:
+> store = FileListStore()
+> for url in urls:
+>     for pkg in repomd.Client(url, fileListStore=store).getFileLists():
+>         print pkg.name, len(pkg.files or ())
+"""
+
+__all__ = ('FileListStore', )
+
+import os
+import marshal
+import tempfile
+import threading
+
+from packagexml import _File
+
+
+class FileListStore(object):
+    """
+    Map of pkgid to file list. File lists are tuples of
+    repomd.packagexml._File instances shared by every package with the same
+    pkgid. The store can be used from several threads.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path=None):
+        """
+        @param path: optional file to load the store from and save it to
+        @type path: string
+        """
+
+        self._path = path
+        self._files = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._files)
+
+    def __contains__(self, pkgid):
+        return pkgid in self._files
+
+    def get(self, pkgid):
+        """
+        @return tuple of files, or None if the package has no files
+        @raise KeyError: if pkgid is not in the store
+        """
+
+        return self._files[pkgid]
+
+    def add(self, pkgid, files):
+        """
+        Add the file list of a package, unless the store already has one.
+        @return the stored file list
+        """
+
+        self._lock.acquire()
+        try:
+            stored = self._files.get(pkgid, self)
+            if stored is self:
+                stored = None
+                if files is not None:
+                    stored = tuple(files)
+                self._files[pkgid] = stored
+            return stored
+        finally:
+            self._lock.release()
+
+    def load(self):
+        """
+        Merge the saved file lists into the store.
+        """
+
+        try:
+            fobj = open(self._path, 'rb')
+        except IOError:
+            return
+
+        try:
+            try:
+                version, records = marshal.load(fobj)
+            except (EOFError, ValueError, TypeError):
+                version, records = None, None
+        finally:
+            fobj.close()
+
+        if version != self.FORMAT_VERSION:
+            return
+
+        self._lock.acquire()
+        try:
+            for pkgid, files in records.iteritems():
+                if files is not None:
+                    files = tuple(_File(name, type=type)
+                                  for name, type in files)
+                self._files.setdefault(pkgid, files)
+        finally:
+            self._lock.release()
+
+    def save(self):
+        """
+        Atomically write the store to its path. Saves are serialized, so
+        the last one to finish holds the most file lists.
+        """
+
+        self._lock.acquire()
+        try:
+            self._save()
+        finally:
+            self._lock.release()
+
+    def _save(self):
+        records = dict((pkgid, files is not None and
+                        tuple((x.name, x.type) for x in files) or None)
+                       for pkgid, files in self._files.iteritems())
+
+        storeDir = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.isdir(storeDir):
+            os.makedirs(storeDir)
+
+        fd, tmpPath = tempfile.mkstemp(dir=storeDir, prefix='.filelists')
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump((self.FORMAT_VERSION, records), fobj, 2)
+        finally:
+            fobj.close()
+        os.rename(tmpPath, self._path)
@@ -21,8 +21,15 @@ Module for parsing filelists.xml files from the repository metadata.
 
 __all__ = ('FilelistXml', )
 
+import re
+
 from xmlcommon import XmlStreamedParser, SlotNode
-from packagexml import PackageXmlMixIn, _Package
+from packagexml import PackageXmlMixIn, _Package, _File
+import lazyxml
+
+_startTagRe = re.compile(r'<package\s([^>]*)>')
+_versionRe = re.compile(r'<version\s([^>]*?)/?>')
+_fileRe = re.compile(r'<file(\s[^>]*)?>([^<]*)</file>')
 
 class _FileLists(SlotNode):
     """
@@ -51,11 +58,69 @@ class FileListsXml(XmlStreamedParser, PackageXmlMixIn):
     Handle registering all types for parsing filelists.xml files.
     """
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        PackageXmlMixIn._registerTypes(self)
-        self._databinder.registerType(_PackageFL, name='package')
-        self._databinder.registerType(_FileLists, name='filelists')
+        PackageXmlMixIn._registerTypes(self, registry)
+        registry.registerType(_PackageFL, name='package')
+        registry.registerType(_FileLists, name='filelists')
+
+    def parseShared(self, store, repository=None):
+        """
+        Parse filelists.xml, taking the file lists of packages from store
+        when it already has their pkgid. Package elements are not bound,
+        the few elements they hold are read straight from the xml. File
+        lists of unknown packages are added to store.
+        @type store: repomd.fileliststore.FileListStore
+        @param repository: repository to read from instead of the one the
+        parser was set up with
+        @return iterator of package instances
+        """
+
+        if repository is None:
+            repository = self._repository
+        metrics = getattr(repository, 'metrics', None)
+        fn = self._open(repository)
+        iterator = self._iterShared(fn, store)
+        if metrics is not None:
+            return self._iterMetered(iterator, fn, metrics)
+        return iterator
+
+    def _iterShared(self, fn, store):
+        for fragment in lazyxml.FragmentScanner(fn, 'package'):
+            m = _startTagRe.match(fragment)
+            attrs = m and lazyxml.parseAttributes(m.group(1)) or {}
+
+            pkg = _PackageFL()
+            pkg.name = attrs.get('name')
+            pkg.arch = attrs.get('arch')
+            pkg.pkgid = attrs.get('pkgid')
+            m = _versionRe.search(fragment)
+            if m:
+                attrs = lazyxml.parseAttributes(m.group(1))
+                pkg.epoch = attrs.get('epoch')
+                pkg.version = attrs.get('ver')
+                pkg.release = attrs.get('rel')
+
+            if pkg.pkgid is not None and pkg.pkgid in store:
+                pkg.files = store.get(pkg.pkgid)
+            else:
+                pkg.files = self._parseFiles(fragment)
+                if pkg.pkgid is not None:
+                    pkg.files = store.add(pkg.pkgid, pkg.files)
+            yield pkg
+
+    @classmethod
+    def _parseFiles(cls, fragment):
+        """
+        @return list of files in a package element, or None if there are
+        none
+        """
+
+        files = [ _File(lazyxml.parseText(name),
+                        type=attrs and lazyxml.parseAttributes(
+                            attrs).get('type') or None)
+                  for attrs, name in _fileRe.findall(fragment) ]
+        return files or None
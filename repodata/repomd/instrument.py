@@ -0,0 +1,177 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Performance instrumentation for repository access and parsing.
+
+Pass a MetricsSink to Client to receive per-stage timings, byte counts and
+node counts. When no sink is configured none of the measuring wrappers are
+installed.
+
+Stages:
+    * download: fetching a file from the repository storage
+    * decompress: reading and inflating a gzip compressed file
+    * parse: xml binding and node construction, excluding decompress time
+"""
+
+__all__ = ('MetricsSink', 'CallbackSink', 'CollectingSink', 'MeteredFile',
+    'STAGE_DOWNLOAD', 'STAGE_DECOMPRESS', 'STAGE_PARSE', )
+
+import time
+import threading
+
+STAGE_DOWNLOAD = 'download'
+STAGE_DECOMPRESS = 'decompress'
+STAGE_PARSE = 'parse'
+
+
+class MetricsSink(object):
+    """
+    Base class for metrics receivers. All methods are no-ops, subclasses
+    override the events they are interested in.
+    """
+
+    def addTiming(self, stage, path, seconds):
+        """
+        Record time spent in a stage for a repository file.
+        """
+
+    def addBytes(self, stage, path, count):
+        """
+        Record the number of bytes a stage produced for a repository file.
+        """
+
+    def addNodes(self, path, counts):
+        """
+        Record the number of nodes created for a repository file.
+        @param counts: dictionary of node class name to count
+        """
+
+
+class CallbackSink(MetricsSink):
+    """
+    Forward every event to a callable, for exporting to external monitoring.
+    The callback is called as callback(event, stage, path, value) where event
+    is one of 'timing', 'bytes' or 'nodes'. For node events stage is the
+    node class name.
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def addTiming(self, stage, path, seconds):
+        self._callback('timing', stage, path, seconds)
+
+    def addBytes(self, stage, path, count):
+        self._callback('bytes', stage, path, count)
+
+    def addNodes(self, path, counts):
+        for name, count in counts.iteritems():
+            self._callback('nodes', name, path, count)
+
+
+class CollectingSink(MetricsSink):
+    """
+    Accumulate totals in memory. Events may come from several threads.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.bytes = {}
+        self.nodes = {}
+        self._lock = threading.Lock()
+
+    def addTiming(self, stage, path, seconds):
+        self._lock.acquire()
+        try:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        finally:
+            self._lock.release()
+
+    def addBytes(self, stage, path, count):
+        self._lock.acquire()
+        try:
+            self.bytes[stage] = self.bytes.get(stage, 0) + count
+        finally:
+            self._lock.release()
+
+    def addNodes(self, path, counts):
+        self._lock.acquire()
+        try:
+            for name, count in counts.iteritems():
+                self.nodes[name] = self.nodes.get(name, 0) + count
+        finally:
+            self._lock.release()
+
+
+class MeteredFile(object):
+    """
+    Read-only file wrapper that measures time spent in read() and the number
+    of bytes returned. The totals are reported to the sink when the end of
+    the file is reached or the file is closed.
+    """
+
+    __slots__ = ('file', 'seconds', 'size', '_sink', '_stage', '_path',
+        '_reported')
+
+    def __init__(self, file, sink, stage, path):
+        self.file = file
+        self.seconds = 0.0
+        self.size = 0
+        self._sink = sink
+        self._stage = stage
+        self._path = path
+        self._reported = False
+
+    def read(self, size=-1):
+        start = time.time()
+        data = self.file.read(size)
+        self.seconds += time.time() - start
+        self.size += len(data)
+        if not data:
+            self._report()
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self._report()
+        return self.file.close()
+
+    def _report(self):
+        if self._reported:
+            return
+        self._reported = True
+        self._sink.addTiming(self._stage, self._path, self.seconds)
+        self._sink.addBytes(self._stage, self._path, self.size)
+
+
+def countNodes(node, counts):
+    """
+    Count node and the children it retained by class name.
+    """
+
+    name = node.__class__.__name__
+    counts[name] = counts.get(name, 0) + 1
+    iterChildren = getattr(node, 'iterChildren', None)
+    if iterChildren is not None:
+        for child in iterChildren():
+            countNodes(child, counts)
@@ -0,0 +1,294 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Lazy parsing of package elements.
+
+FragmentScanner splits a metadata file into the raw xml of its package
+elements without binding them. Lazy packages decode only the name, arch,
+version, checksum and location from that fragment up front, and bind the
+whole fragment the first time any other attribute is accessed.
+"""
+
+__all__ = ('FragmentScanner', 'getLazyPackageClass', )
+
+import re
+import StringIO
+import threading
+
+from rpath_xmllib import api1 as xmllib
+
+_ENTITIES = { 'amp': u'&', 'lt': u'<', 'gt': u'>', 'quot': u'"',
+              'apos': u"'" }
+_entityRe = re.compile(r'&(#[0-9]+|#x[0-9a-fA-F]+|amp|lt|gt|quot|apos);')
+
+_attributeRe = re.compile(r'''([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+_nameRe = re.compile(r'<name>([^<]*)</name>')
+_archRe = re.compile(r'<arch>([^<]*)</arch>')
+_versionRe = re.compile(r'<version\s([^>]*?)/?>')
+_checksumRe = re.compile(r'<checksum\s([^>]*)>([^<]*)</checksum>')
+_locationRe = re.compile(r'<location\s([^>]*?)/?>')
+_sizeRe = re.compile(r'<size\s([^>]*?)/?>')
+
+
+def _replaceEntity(match):
+    ref = match.group(1)
+    if ref[0] != '#':
+        return _ENTITIES[ref]
+    if ref[1] == 'x':
+        code = int(ref[2:], 16)
+    else:
+        code = int(ref[1:])
+    try:
+        return unichr(code)
+    except ValueError:
+        # Outside the BMP on narrow unicode builds
+        return ('\\U%08x' % code).decode('unicode-escape')
+
+def parseText(value):
+    """
+    Replace the entities and character references in the utf-8 text of an
+    element or attribute.
+    @return utf-8 encoded str, like the values of a full parse
+    """
+
+    if '&' not in value:
+        return value
+    return _entityRe.sub(_replaceEntity,
+                         value.decode('utf-8')).encode('utf-8')
+
+def parseAttributes(text):
+    """
+    Parse the attributes of a start tag.
+    @return dictionary of attribute name to value
+    """
+
+    return dict((name, parseText(dquoted or squoted))
+                for name, dquoted, squoted in _attributeRe.findall(text))
+
+
+class FragmentScanner(object):
+    """
+    Iterate over the raw xml of all elements with a given name in a file.
+    The elements must not nest. The start tag of the root element, which
+    carries the namespace declarations, is available as rootStart once
+    iteration has started.
+    """
+
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, fobj, tag):
+        self._fobj = fobj
+        self._startTag = '<' + tag
+        self._endTag = '</%s>' % tag
+
+        self.rootStart = None
+        self.rootName = None
+
+    def _findRoot(self, buf):
+        pos = 0
+        while True:
+            pos = buf.find('<', pos)
+            if pos < 0 or pos + 1 >= len(buf):
+                return False
+            if buf[pos + 1] not in '?!':
+                break
+            pos += 1
+
+        end = buf.find('>', pos)
+        if end < 0:
+            return False
+        self.rootStart = buf[pos:end + 1]
+        self.rootName = re.match(r'<([^\s/>]+)', self.rootStart).group(1)
+        return True
+
+    def _findStart(self, buf, pos):
+        """
+        @return index of the next start tag, -1 if there is none, or
+        -2 if more data is needed to tell
+        """
+
+        tagLen = len(self._startTag)
+        while True:
+            pos = buf.find(self._startTag, pos)
+            if pos < 0:
+                return -1
+            if pos + tagLen >= len(buf):
+                return -2
+            # Skip longer names with the same prefix, like packager
+            if buf[pos + tagLen] in ' \t\r\n/>':
+                return pos
+            pos += tagLen
+
+    def __iter__(self):
+        buf = ''
+        while True:
+            chunk = self._fobj.read(self.BUFFER_SIZE)
+            buf += chunk
+
+            if self.rootStart is None and not self._findRoot(buf):
+                if not chunk:
+                    return
+                continue
+
+            pos = 0
+            while True:
+                start = self._findStart(buf, pos)
+                if start < 0:
+                    break
+                end = buf.find(self._endTag, start)
+                if end < 0:
+                    break
+                end += len(self._endTag)
+                yield buf[start:end]
+                pos = end
+
+            if not chunk:
+                return
+
+            if start >= 0:
+                buf = buf[start:]
+            elif start == -1:
+                buf = buf[max(pos, len(buf) - len(self._startTag)):]
+            else:
+                buf = buf[max(pos, len(buf) - len(self._startTag) - 1):]
+
+
+class LazyPackageMixIn(object):
+    """
+    Mix-in for package classes that keeps the raw xml of the package and
+    binds it on first access to an attribute that has not been decoded.
+    """
+
+    __slots__ = ()
+
+    # Attributes decoded from the fragment up front
+    LightAttributes = frozenset(['name', 'arch', 'epoch', 'version',
+        'release', 'checksum', 'checksumType', 'pkgid', 'location',
+        'packageSize'])
+
+    def __init__(self, fragment, decoder):
+        # The heavy slots are left unset so accessing them ends up in
+        # __getattr__, SlotNode.__init__ would set them all to None.
+        xmllib.BaseNode.__init__(self)
+        self._fragment = fragment
+        self._decoder = decoder
+        self._formatView = None
+
+        self.name = self.arch = None
+        self.epoch = self.version = self.release = None
+        self.checksum = self.checksumType = self.pkgid = None
+        self.location = self.packageSize = None
+
+        m = _nameRe.search(fragment)
+        if m:
+            self.name = parseText(m.group(1))
+        m = _archRe.search(fragment)
+        if m:
+            self.arch = parseText(m.group(1))
+        m = _versionRe.search(fragment)
+        if m:
+            attrs = parseAttributes(m.group(1))
+            self.epoch = attrs.get('epoch')
+            self.version = attrs.get('ver')
+            self.release = attrs.get('rel')
+        m = _checksumRe.search(fragment)
+        if m:
+            attrs = parseAttributes(m.group(1))
+            self.checksum = parseText(m.group(2))
+            self.checksumType = attrs.get('type')
+            if attrs.get('pkgid') == 'YES':
+                self.pkgid = self.checksum
+        m = _locationRe.search(fragment)
+        if m:
+            self.location = parseAttributes(m.group(1)).get('href')
+        m = _sizeRe.search(fragment)
+        if m:
+            self.packageSize = parseAttributes(m.group(1)).get('package')
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set. All heavy attributes
+        # have public names.
+        if name.startswith('_') or self._fragment is None:
+            raise AttributeError(name)
+        self._decode()
+        return getattr(self, name)
+
+    def _decode(self):
+        """
+        Bind the fragment and copy all attributes of the result.
+        """
+
+        pkg = self._decoder.decode(self._fragment)
+        skip = self.LightAttributes
+        for cls in pkg.__class__.__mro__:
+            for attr in cls.__dict__.get('__slots__', ()):
+                if attr not in skip:
+                    setattr(self, attr, getattr(pkg, attr, None))
+        for attr in ('packager', 'url'):
+            setattr(self, attr, getattr(pkg, attr, None))
+        self._fragment = None
+        self._decoder = None
+
+
+class FragmentDecoder(object):
+    """
+    Bind package fragments found by FragmentScanner with a parser class.
+    One databinder is set up per decoder and reused for every fragment,
+    decoding is serialized since lazy packages may be read from several
+    threads.
+    """
+
+    def __init__(self, parserClass, packageFactory, rootStart, rootName):
+        parser = parserClass(None, None)
+        if parser.PackageFactory is not packageFactory:
+            parser.PackageFactory = packageFactory
+            parser._compileTypes()
+        self._databinder = parser._getDataBinder()
+        self._lock = threading.Lock()
+        self._rootStart = rootStart
+        self._rootEnd = '</%s>' % rootName
+
+    def decode(self, fragment):
+        doc = StringIO.StringIO(self._rootStart + fragment + self._rootEnd)
+        self._lock.acquire()
+        try:
+            # Run the parse to the end so the databinder is reset for the
+            # next fragment.
+            nodes = list(self._databinder.parseFile(doc))
+        finally:
+            self._lock.release()
+        if nodes:
+            return nodes[0]
+        return None
+
+
+# Map of package factory to its lazy subclass
+_lazyClasses = {}
+
+def getLazyPackageClass(factory):
+    """
+    Get the lazy variant of a package class.
+    """
+
+    cls = _lazyClasses.get(factory)
+    if cls is None:
+        cls = type('Lazy' + factory.__name__.lstrip('_'),
+                   (LazyPackageMixIn, factory),
+                   { '__slots__': ('_fragment', '_decoder') })
+        _lazyClasses[factory] = cls
+    return cls
@@ -0,0 +1,489 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Mirror lists, metalinks and mirror selection.
+
+MirrorStorage opens every file from the best ranked mirror and moves on to
+the next one as soon as a request fails, instead of retrying the same host.
+Mirrors are ranked by the latency and throughput measured on earlier
+requests. The measurements are kept in a MirrorRegistry, by default one
+registry shared by all repositories in the process, so later clients start
+out with the mirrors that worked best for earlier ones.
+
+With hedging enabled, a file that has not started arriving, or arrives too
+slowly, within the hedge delay is requested from the next mirror as well and
+the first complete copy is used.
+"""
+
+__all__ = ('MirrorStorage', 'MirrorRegistry', 'MirrorStats', 'HedgeStats',
+    'parseMirrorList', 'parseMetalink', 'defaultRegistry', )
+
+import sys
+import copy
+import time
+import socket
+import tempfile
+import threading
+from xml.etree import cElementTree as etree
+
+from storage import Storage
+from conary.lib.http import http_error
+
+REPOMD_SUFFIX = 'repodata/repomd.xml'
+PROTOCOLS = ('http', 'https', 'ftp')
+
+
+def _baseUrl(url):
+    url = url.strip()
+    if url.endswith(REPOMD_SUFFIX):
+        url = url[:-len(REPOMD_SUFFIX)]
+    return url.rstrip('/')
+
+def parseMirrorList(fobj):
+    """
+    Parse a mirror list, one repository url per line.
+    @return list of repository base urls
+    """
+
+    mirrors = []
+    for line in fobj:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.split(':', 1)[0] in PROTOCOLS:
+            mirrors.append(_baseUrl(line))
+    return mirrors
+
+def parseMetalink(fobj):
+    """
+    Parse a metalink for repomd.xml, as served by MirrorManager. Both
+    metalink 3.0 preferences and metalink 4 priorities are understood.
+    @return list of repository base urls, most preferred first
+    """
+
+    entries = []
+    for _, elem in etree.iterparse(fobj):
+        if elem.tag.rsplit('}', 1)[-1] != 'url' or not elem.text:
+            continue
+        url = elem.text.strip()
+        if url.split(':', 1)[0] not in PROTOCOLS:
+            continue
+        if elem.get('priority') is not None:
+            order = int(elem.get('priority'))
+        else:
+            order = -int(elem.get('preference', 0))
+        entries.append((order, len(entries), _baseUrl(url)))
+    entries.sort()
+    return [ x[2] for x in entries ]
+
+
+class MirrorStats(object):
+    """
+    Health of one mirror.
+    @ivar successes: number of successful requests
+    @ivar failures: number of failed requests
+    @ivar latency: smoothed seconds until a response started, or None
+    @ivar throughput: smoothed bytes per second of downloads, or None
+    @ivar lastSuccess: time of the last successful request, or None
+    @ivar lastFailure: time of the last failed request, or None
+    """
+
+    __slots__ = ('successes', 'failures', 'latency', 'throughput',
+                 'lastSuccess', 'lastFailure')
+
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latency = None
+        self.throughput = None
+        self.lastSuccess = None
+        self.lastFailure = None
+
+    def copy(self):
+        other = MirrorStats()
+        for attr in self.__slots__:
+            setattr(other, attr, getattr(self, attr))
+        return other
+
+
+class MirrorRegistry(object):
+    """
+    Thread safe collection of mirror statistics, keyed by mirror url.
+    """
+
+    # Seconds a failed mirror is ranked behind the working ones
+    FAILURE_TIMEOUT = 300
+    # Weight of a new measurement in the smoothed latency and throughput
+    SMOOTHING = 0.3
+    # Transfer size used to weigh throughput against latency when ranking
+    REFERENCE_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _get(self, url):
+        stats = self._stats.get(url)
+        if stats is None:
+            stats = self._stats[url] = MirrorStats()
+        return stats
+
+    def _smooth(self, old, new):
+        if old is None:
+            return new
+        return old + self.SMOOTHING * (new - old)
+
+    def getStats(self, url):
+        """
+        @return copy of the statistics of a mirror
+        @rtype: MirrorStats
+        """
+
+        self._lock.acquire()
+        try:
+            return self._get(url).copy()
+        finally:
+            self._lock.release()
+
+    def recordSuccess(self, url, latency):
+        self._lock.acquire()
+        try:
+            stats = self._get(url)
+            stats.successes += 1
+            stats.lastSuccess = time.time()
+            stats.latency = self._smooth(stats.latency, latency)
+        finally:
+            self._lock.release()
+
+    def recordThroughput(self, url, size, seconds):
+        self._lock.acquire()
+        try:
+            stats = self._get(url)
+            stats.throughput = self._smooth(stats.throughput,
+                size / max(seconds, 1e-6))
+        finally:
+            self._lock.release()
+
+    def recordFailure(self, url):
+        self._lock.acquire()
+        try:
+            stats = self._get(url)
+            stats.failures += 1
+            stats.lastFailure = time.time()
+        finally:
+            self._lock.release()
+
+    def _getRankKey(self, url, now):
+        stats = self._stats.get(url)
+        if stats is None:
+            # Unmeasured mirrors are tried first so they get measured
+            return (0, 0.0)
+        if (stats.lastFailure is not None and
+                now - stats.lastFailure < self.FAILURE_TIMEOUT and
+                stats.lastFailure >= (stats.lastSuccess or 0)):
+            return (1, stats.lastFailure)
+        cost = stats.latency or 0.0
+        if stats.throughput:
+            cost += self.REFERENCE_SIZE / stats.throughput
+        return (0, cost)
+
+    def rank(self, urls):
+        """
+        Order mirrors from best to worst. Mirrors that failed recently come
+        last, the one that failed longest ago first among them.
+        """
+
+        now = time.time()
+        self._lock.acquire()
+        try:
+            keys = dict((x, self._getRankKey(x, now)) for x in urls)
+        finally:
+            self._lock.release()
+        # sort is stable, so ties keep the order of the mirror list
+        return sorted(urls, key=keys.get)
+
+# Registry shared by all repositories that do not bring their own
+defaultRegistry = MirrorRegistry()
+
+
+class _MeasuredFile(object):
+    """
+    File wrapper that reports the throughput of a download once it has been
+    read to the end.
+    """
+
+    def __init__(self, fobj, registry, url):
+        self._fobj = fobj
+        self._registry = registry
+        self._url = url
+        self._start = time.time()
+        self._size = 0
+
+    def read(self, size=-1):
+        buf = self._fobj.read(size)
+        if buf:
+            self._size += len(buf)
+        elif self._registry is not None:
+            self._registry.recordThroughput(self._url, self._size,
+                time.time() - self._start)
+            self._registry = None
+        return buf
+
+    def close(self):
+        return self._fobj.close()
+
+    def __getattr__(self, name):
+        return getattr(self._fobj, name)
+
+
+class HedgeStats(object):
+    """
+    Counters of hedged requests.
+    @ivar requests: number of hedged requests
+    @ivar fired: number of requests where a hedge was sent
+    @ivar won: number of requests answered by the hedge first
+    """
+
+    __slots__ = ('requests', 'fired', 'won', '_lock')
+
+    def __init__(self):
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self._lock = threading.Lock()
+
+    def record(self, fired, won):
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            self.fired += int(fired)
+            self.won += int(won)
+        finally:
+            self._lock.release()
+
+
+class _Attempt(object):
+    """
+    One request of a hedged fetch, run in its own thread.
+    """
+
+    __slots__ = ('mirror', 'url', 'hedge', 'started', 'firstByte', 'size',
+                 'file', 'excInfo', 'done', 'cancelled')
+
+    def __init__(self, mirror, url, hedge):
+        self.mirror = mirror
+        self.url = url
+        self.hedge = hedge
+        self.started = time.time()
+        self.firstByte = None
+        self.size = 0
+        self.file = None
+        # sys.exc_info() of the error the attempt failed with
+        self.excInfo = None
+        self.done = False
+        self.cancelled = False
+
+
+class MirrorStorage(Storage):
+    """
+    Access repository files through the best working mirror.
+    """
+
+    # Errors that make a request move on to the next mirror
+    FailoverErrors = (http_error.TransportError, IOError, socket.error)
+
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, mirrors, opener, registry=None, hedgeDelay=None,
+            hedgeThroughput=None):
+        """
+        @param mirrors: repository base urls
+        @param opener: URL opener that does not retry failed requests
+        @param registry: mirror statistics, defaults to the shared registry
+        @type registry: MirrorRegistry
+        @param hedgeDelay: seconds after which openHedged() requests a file
+        from another mirror if the first one is not fast enough
+        @param hedgeThroughput: bytes per second a transfer must reach by
+        then, by default only the first byte has to arrive
+        """
+
+        self._mirrors = [ x.rstrip('/') for x in mirrors ]
+        self._opener = opener
+        if registry is None:
+            registry = defaultRegistry
+        self.registry = registry
+        self.hedgeDelay = hedgeDelay
+        self.hedgeThroughput = hedgeThroughput
+        self.hedgeStats = HedgeStats()
+
+    def getMirrors(self):
+        """
+        @return mirror urls, best first
+        """
+
+        return self.registry.rank(self._mirrors)
+
+    def open(self, path):
+        lastError = None
+        for mirror in self.getMirrors():
+            url = "%s/%s" % (mirror, path.lstrip('/'))
+            start = time.time()
+            try:
+                fobj = self._opener.open(url)
+            except self.FailoverErrors, e:
+                self.registry.recordFailure(mirror)
+                lastError = e
+                continue
+            self.registry.recordSuccess(mirror, time.time() - start)
+            return _MeasuredFile(fobj, self.registry, mirror)
+
+        if lastError is None:
+            raise http_error.TransportError('No mirrors for %s' % path)
+        raise lastError
+
+    def getRealUrl(self, path):
+        return "%s/%s" % (self.getMirrors()[0], path.lstrip('/'))
+
+    def withDeadline(self, deadline):
+        # Mirrors, measurements and hedge counters stay shared
+        storage = copy.copy(self)
+        storage._opener = self._opener.withDeadline(deadline)
+        return storage
+
+    def _isSlow(self, attempt, now):
+        if attempt.firstByte is None:
+            return True
+        if self.hedgeThroughput is None:
+            return False
+        elapsed = now - attempt.firstByte
+        return elapsed > 0 and attempt.size / elapsed < self.hedgeThroughput
+
+    def _runAttempt(self, attempt, cond):
+        spool = None
+        try:
+            try:
+                fobj = self._opener.open(attempt.url)
+                latency = time.time() - attempt.started
+                spool = tempfile.TemporaryFile(prefix='hedge')
+                try:
+                    while not attempt.cancelled:
+                        buf = fobj.read(self.BUFFER_SIZE)
+                        if not buf:
+                            break
+                        if attempt.firstByte is None:
+                            attempt.firstByte = time.time()
+                        spool.write(buf)
+                        attempt.size += len(buf)
+                finally:
+                    fobj.close()
+
+                if not attempt.cancelled:
+                    self.registry.recordSuccess(attempt.mirror, latency)
+                    self.registry.recordThroughput(attempt.mirror,
+                        attempt.size, time.time() - attempt.started)
+                    spool.seek(0)
+                    attempt.file = spool
+                    spool = None
+            except Exception, e:
+                # Handed to openHedged(), which fails over or raises it
+                if (isinstance(e, self.FailoverErrors) and
+                        not attempt.cancelled):
+                    self.registry.recordFailure(attempt.mirror)
+                attempt.excInfo = sys.exc_info()
+        finally:
+            if spool is not None:
+                spool.close()
+            cond.acquire()
+            try:
+                attempt.done = True
+                cond.notifyAll()
+            finally:
+                cond.release()
+
+    def openHedged(self, path):
+        """
+        Download a file completely, sending a second request to the next
+        mirror if the first one does not deliver within hedgeDelay, and
+        failing over to the next mirror on errors.
+        @return seekable file object
+        """
+
+        cond = threading.Condition()
+        attempts = []
+        mirrors = iter(self.getMirrors())
+
+        def launch(hedge):
+            for mirror in mirrors:
+                attempt = _Attempt(mirror,
+                    "%s/%s" % (mirror, path.lstrip('/')), hedge)
+                attempts.append(attempt)
+                thread = threading.Thread(target=self._runAttempt,
+                    args=(attempt, cond))
+                thread.setDaemon(True)
+                thread.start()
+                return attempt
+            return None
+
+        winner = None
+        hedged = False
+        # At most one hedge is sent per request
+        watching = True
+        deadline = time.time() + self.hedgeDelay
+        cond.acquire()
+        try:
+            launch(False)
+            while winner is None:
+                for attempt in attempts:
+                    if attempt.done and attempt.excInfo is None:
+                        winner = attempt
+                        break
+                if winner is not None:
+                    break
+
+                running = [ x for x in attempts if not x.done ]
+                if not running:
+                    # Everything in flight failed, fail over right away
+                    if launch(False) is not None:
+                        deadline = time.time() + self.hedgeDelay
+                        continue
+                    if not attempts:
+                        raise http_error.TransportError(
+                            'No mirrors for %s' % path)
+                    excInfo = attempts[-1].excInfo
+                    raise excInfo[0], excInfo[1], excInfo[2]
+
+                timeout = None
+                if watching:
+                    now = time.time()
+                    if now < deadline:
+                        timeout = deadline - now
+                    elif self._isSlow(running[0], now):
+                        hedged = launch(True) is not None
+                        watching = False
+                    else:
+                        deadline = now + self.hedgeDelay
+                        timeout = self.hedgeDelay
+                cond.wait(timeout)
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancelled = True
+            cond.release()
+
+        self.hedgeStats.record(hedged, winner.hedge)
+        return winner.file
@@ -43,10 +43,10 @@ class _Package(SlotNode):
     __slots__ = ('name', 'arch', 'epoch', 'version', 'release',
                  'checksum', 'checksumType', 'summary', 'description',
                  'fileTimestamp', 'buildTimestamp', 'packageSize',
-                 'installedSize', 'archiveSize', 'location', 'format',
-                 'license', 'vendor', 'group', 'buildhost',
+                 'installedSize', 'archiveSize', 'location',
+                 'dependencies', 'license', 'vendor', 'group', 'buildhost',
                  'sourcerpm', 'headerStart', 'headerEnd',
-                 'licenseToConfirm', 'files', 'pkgid')
+                 'licenseToConfirm', 'files', 'pkgid', '_formatView')
 
     # All attributes are defined in __init__ by iterating over __slots__,
     # this confuses pylint.
@@ -54,90 +54,190 @@ class _Package(SlotNode):
     # pylint: disable-msg=W0201
 
 
+    # Handlers for children of the package element, indexed by element name
+    # in _childHandlers below.
+
+    # E0203 - Access to member 'files' before its definition
+    # files is set to None by the superclasses __init__
+    # pylint: disable-msg=E0203
+
+    def _addName(self, child):
+        self.name = child.finalize()
+
+    def _addArch(self, child):
+        self.arch = child.finalize()
+
+    def _addVersion(self, child):
+        self.epoch = child.getAttribute('epoch')
+        self.version = child.getAttribute('ver')
+        self.release = child.getAttribute('rel')
+
+    def _addChecksum(self, child):
+        self.checksum = child.finalize()
+        self.checksumType = child.getAttribute('type')
+        if child.getAttribute('pkgid') == 'YES':
+            self.pkgid = self.checksum
+
+    def _addSummary(self, child):
+        self.summary = child.finalize()
+
+    def _addDescription(self, child):
+        self.description = child.finalize()
+
+    def _addPackager(self, child):
+        self.packager = child.finalize()
+
+    def _addUrl(self, child):
+        self.url = child.finalize()
+
+    def _addTime(self, child):
+        self.fileTimestamp = child.getAttribute('file')
+        self.buildTimestamp = child.getAttribute('build')
+
+    def _addSize(self, child):
+        self.packageSize = child.getAttribute('package')
+        self.installedSize = child.getAttribute('installed')
+        self.archiveSize = child.getAttribute('archive')
+
+    def _addLocation(self, child):
+        self.location = child.getAttribute('href')
+
+    def _addFile(self, child):
+        if self.files is None:
+            self.files = []
+        self.files.append(
+            _File(child.getText(), type=child.getAttribute('type')))
+
+    def _addFormat(self, child):
+        groups = []
+        handlers = self._formatHandlers
+        for node in child.iterChildren():
+            nn = node.getName()
+            handler = handlers.get(nn)
+            if handler is not None:
+                handler(self, node)
+            elif nn in DEPENDENCY_TYPES:
+                groups.append((nn, node.dependencies or []))
+            else:
+                raise UnknownElementError(node)
+        self.setDependencyGroups(groups)
+
+    def _addLicenseToConfirm(self, child):
+        self.licenseToConfirm = child.finalize()
+
+    def _ignore(self, child):
+        pass
+
+    _childHandlers = {
+        'name': _addName,
+        'arch': _addArch,
+        'version': _addVersion,
+        'checksum': _addChecksum,
+        'summary': _addSummary,
+        'description': _addDescription,
+        'packager': _addPackager,
+        'url': _addUrl,
+        'time': _addTime,
+        'size': _addSize,
+        'location': _addLocation,
+        'file': _addFile,
+        'format': _addFormat,
+        'pkgfiles': _ignore,
+        'suse:license-to-confirm': _addLicenseToConfirm,
+    }
+
+    # Handlers for children of the format element
+
+    def _addLicense(self, node):
+        self.license = node.getText()
+
+    def _addVendor(self, node):
+        self.vendor = node.getText()
+
+    def _addGroup(self, node):
+        self.group = node.getText()
+
+    def _addBuildhost(self, node):
+        self.buildhost = node.getText()
+
+    def _addSourcerpm(self, node):
+        self.sourcerpm = node.getText()
+
+    def _addHeaderRange(self, node):
+        self.headerStart = node.getAttribute('start')
+        self.headerEnd = node.getAttribute('end')
+
+    _formatHandlers = {
+        'rpm:license': _addLicense,
+        'rpm:vendor': _addVendor,
+        'rpm:group': _addGroup,
+        'rpm:buildhost': _addBuildhost,
+        'rpm:sourcerpm': _addSourcerpm,
+        'rpm:header-range': _addHeaderRange,
+        'file': _ignore,
+    }
+
     def addChild(self, child):
         """
         Parse children of package element.
         """
 
-        # R0912 - Too many branches
-        # pylint: disable-msg=R0912
+        handler = self._childHandlers.get(child.getName())
+        if handler is None:
+            raise UnknownElementError(child)
+        handler(self, child)
 
-        # R0915 - Too many statements
-        # pylint: disable-msg=R0915
+    def setDependencyGroups(self, groups):
+        """
+        Set the dependencies from the dependency elements of the format
+        element. Repeated elements of one relation type are merged in
+        dependencies and kept apart in format.
+        @param groups: (element name, [ _Dependency, ... ]) in document
+        order, for example ('rpm:provides', [ ... ])
+        """
 
-        # E0203 - Access to member 'files' before its definition line 84
-        # files is set to None by the superclasses __init__
-        # pylint: disable-msg=E0203
+        dependencies = {}
+        for name, entries in groups:
+            relation = DEPENDENCY_RELATIONS[name]
+            if relation in dependencies:
+                entries = dependencies[relation] + entries
+            dependencies[relation] = entries
+        self.dependencies = dependencies
+        self._formatView = [ _DependencyGroup(name, entries)
+                             for name, entries in groups ]
+
+    def _getFormat(self):
+        # Look at dependencies first, on lazy packages that decodes the
+        # package and with it the view.
+        dependencies = self.dependencies
+        if self._formatView is None and dependencies is not None:
+            self._formatView = [
+                _DependencyGroup(RELATION_ELEMENTS[relation],
+                                 dependencies[relation])
+                for relation in RELATIONS if relation in dependencies ]
+        return self._formatView
+
+    def _setFormat(self, value):
+        self._formatView = value
+
+    format = property(_getFormat, _setFormat, doc="""
+        Dependencies in the form of the rpm:provides, rpm:requires, ...
+        elements of the format element, in document order. Packages built
+        from the dependencies attribute alone list them in RELATIONS order.
+        Assigning a list replaces the view, not the dependencies.
+        """)
+
+    def getDependencies(self, relation):
+        """
+        Get the dependencies of one relation type.
+        @param relation: relation type, for example provides or requires
+        @type relation: string
+        @return [ repomd.packagexml._Dependency, ... ]
+        """
 
-        n = child.getName()
-        if n == 'name':
-            self.name = child.finalize()
-        elif n == 'arch':
-            self.arch = child.finalize()
-        elif n == 'version':
-            self.epoch = child.getAttribute('epoch')
-            self.version = child.getAttribute('ver')
-            self.release = child.getAttribute('rel')
-        elif n == 'checksum':
-            self.checksum = child.finalize()
-            self.checksumType = child.getAttribute('type')
-            if child.getAttribute('pkgid') == 'YES':
-                self.pkgid = self.checksum
-        elif n == 'summary':
-            self.summary = child.finalize()
-        elif n == 'description':
-            self.description = child.finalize()
-        elif n == 'packager':
-            self.packager = child.finalize()
-        elif n == 'url':
-            self.url = child.finalize()
-        elif n == 'time':
-            self.fileTimestamp = child.getAttribute('file')
-            self.buildTimestamp = child.getAttribute('build')
-        elif n == 'size':
-            self.packageSize = child.getAttribute('package')
-            self.installedSize = child.getAttribute('installed')
-            self.archiveSize = child.getAttribute('archive')
-        elif n == 'location':
-            self.location = child.getAttribute('href')
-        elif n == 'file':
-            if self.files is None:
-                self.files = []
-            self.files.append(
-                _File(child.getText(), type=child.getAttribute('type')))
-        elif child.getName() == 'format':
-            self.format = []
-            for node in child.iterChildren():
-                nn = node.getName()
-                if nn == 'rpm:license':
-                    self.license = node.getText()
-                elif nn == 'rpm:vendor':
-                    self.vendor = node.getText()
-                elif nn == 'rpm:group':
-                    self.group = node.getText()
-                elif nn == 'rpm:buildhost':
-                    self.buildhost = node.getText()
-                elif nn == 'rpm:sourcerpm':
-                    self.sourcerpm = node.getText()
-                elif nn == 'rpm:header-range':
-                    self.headerStart = node.getAttribute('start')
-                    self.headerEnd = node.getAttribute('end')
-                elif nn in ('rpm:provides', 'rpm:requires',
-                                        'rpm:obsoletes', 'rpm:recommends',
-                                        'rpm:conflicts', 'suse:freshens',
-                                        'rpm:enhances', 'rpm:supplements',
-                                        'rpm:suggests', ):
-                    self.format.append(node)
-                elif nn == 'file':
-                    pass
-                else:
-                    raise UnknownElementError(node)
-        elif n == 'pkgfiles':
-            pass
-        elif n == 'suse:license-to-confirm':
-            self.licenseToConfirm = child.finalize()
-        else:
-            raise UnknownElementError(child)
+        if self.dependencies is None:
+            return []
+        return self.dependencies.get(relation, [])
 
     def __repr__(self):
         if self.location is None:
@@ -174,35 +274,33 @@ class _Package(SlotNode):
 
 class _RpmEntry(SlotNode):
     """
-    Parse any element that contains rpm:entry or suse:entry elements.
+    Parse any element that contains rpm:entry or suse:entry elements. Entries
+    are stored as _Dependency records in the dependencies attribute, the
+    entry nodes themselves are not retained.
     """
 
-    __slots__ = ()
+    __slots__ = ('dependencies', )
 
     def addChild(self, child):
         """
         Parse rpm:entry and suse:entry nodes.
         """
 
-        if child.getName() in ('rpm:entry', 'suse:entry'):
+        # E0203 - Access to member 'dependencies' before its definition
+        # pylint: disable-msg=E0203
+
+        factory = _entryFactories.get(child.getName())
+        if factory is not None:
+            dep = factory()
+            attributeNames = factory._attributeNames
             for attr, value in child.iterAttributes():
-                if attr == 'kind':
-                    child.kind = value
-                elif attr == 'name':
-                    child.name = value
-                elif attr == 'epoch':
-                    child.epoch = value
-                elif attr == 'ver':
-                    child.version = value
-                elif attr == 'rel':
-                    child.release = value
-                elif attr == 'flags':
-                    child.flags = value
-                elif attr == 'pre':
-                    child.pre = value
-                else:
+                slot = attributeNames.get(attr)
+                if slot is None:
                     raise UnknownAttributeError(child, attr)
-            SlotNode.addChild(self, child)
+                setattr(dep, slot, value)
+            if self.dependencies is None:
+                self.dependencies = []
+            self.dependencies.append(dep)
         else:
             raise UnknownElementError(child)
 
@@ -287,6 +385,125 @@ class _SuseFreshens(_RpmEntry):
 
     __slots__ = ()
 
+# Map of dependency element names to the classes that parse them.
+DEPENDENCY_TYPES = {
+    'rpm:requires': _RpmRequires,
+    'rpm:recommends': _RpmRecommends,
+    'rpm:provides': _RpmProvides,
+    'rpm:obsoletes': _RpmObsoletes,
+    'rpm:conflicts': _RpmConflicts,
+    'rpm:enhances': _RpmEnhances,
+    'rpm:supplements': _RpmSupplements,
+    'rpm:suggests': _RpmSuggests,
+    'suse:freshens': _SuseFreshens,
+}
+
+# Map of dependency element names to relation types, and back.
+DEPENDENCY_RELATIONS = dict((x, x.split(':')[1]) for x in DEPENDENCY_TYPES)
+RELATION_ELEMENTS = dict((y, x) for x, y in DEPENDENCY_RELATIONS.items())
+
+# Order of relation types in the format element.
+RELATIONS = ('provides', 'requires', 'conflicts', 'obsoletes', 'recommends',
+             'suggests', 'supplements', 'enhances', 'freshens')
+
+class _Dependency(object):
+    """
+    Compact representation of an rpm:entry or suse:entry element.
+    """
+
+    __slots__ = ('kind', 'name', 'flags', 'epoch', 'version', 'release',
+                 'pre')
+
+    # Element the entry was read from, getName() of the entry nodes that
+    # were kept before
+    ElementName = 'rpm:entry'
+
+    # Map of entry attribute names to slots
+    _attributeNames = {
+        'kind': 'kind',
+        'name': 'name',
+        'epoch': 'epoch',
+        'ver': 'version',
+        'rel': 'release',
+        'flags': 'flags',
+        'pre': 'pre',
+    }
+
+    def __init__(self, kind=None, name=None, flags=None, epoch=None,
+            version=None, release=None, pre=None):
+        self.kind = kind
+        self.name = name
+        self.flags = flags
+        self.epoch = epoch
+        self.version = version
+        self.release = release
+        self.pre = pre
+
+    def getName(self):
+        return self.ElementName
+
+    def getAbsoluteName(self):
+        return self.ElementName
+
+    def getAttribute(self, name, namespace=None):
+        """
+        @return value of an attribute of the entry element, for example ver
+        """
+
+        slot = self._attributeNames.get(name)
+        if slot is None:
+            return None
+        return getattr(self, slot)
+
+    def __repr__(self):
+        if self.flags is None:
+            text = u'%s' % (self.name, )
+        else:
+            text = u'%s %s %s:%s-%s' % (self.name, self.flags, self.epoch,
+                                        self.version, self.release)
+        return text.encode('utf-8')
+
+class _SuseDependency(_Dependency):
+    """
+    Compact representation of a suse:entry element.
+    """
+
+    __slots__ = ()
+
+    ElementName = 'suse:entry'
+
+# Dependency classes for the entry elements
+_entryFactories = {
+    'rpm:entry': _Dependency,
+    'suse:entry': _SuseDependency,
+}
+
+class _DependencyGroup(object):
+    """
+    Read-only stand-in for an rpm:provides, rpm:requires, ... node, used by
+    _Package.format to present dependency records the way parsed nodes
+    used to.
+    """
+
+    __slots__ = ('_name', '_entries')
+
+    def __init__(self, name, entries):
+        self._name = name
+        self._entries = entries
+
+    def getName(self):
+        return self._name
+
+    def getAbsoluteName(self):
+        return self._name
+
+    def iterChildren(self):
+        return iter(self._entries)
+
+    def getChildren(self, name=None, namespace=None):
+        # Entries are the only children of dependency elements
+        return list(self._entries)
+
 class _File(object):
     "Representation of a file"
     __slots__ = ('type', 'name')
@@ -303,40 +520,40 @@ class PackageXmlMixIn(object):
     """
     PackageFactory = _Package
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        self._databinder.registerType(self.PackageFactory, name='package')
-        self._databinder.registerType(xmllib.StringNode, name='name')
-        self._databinder.registerType(xmllib.StringNode, name='arch')
-        self._databinder.registerType(xmllib.StringNode, name='checksum')
-        self._databinder.registerType(xmllib.StringNode, name='summary')
-        self._databinder.registerType(xmllib.StringNode, name='description')
-        self._databinder.registerType(xmllib.StringNode, name='url')
-        self._databinder.registerType(_RpmEntries, name='entry',
+        registry.registerType(self.PackageFactory, name='package')
+        registry.registerType(xmllib.StringNode, name='name')
+        registry.registerType(xmllib.StringNode, name='arch')
+        registry.registerType(xmllib.StringNode, name='checksum')
+        registry.registerType(xmllib.StringNode, name='summary')
+        registry.registerType(xmllib.StringNode, name='description')
+        registry.registerType(xmllib.StringNode, name='url')
+        registry.registerType(_RpmEntries, name='entry',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmEntries, name='entry',
+        registry.registerType(_RpmEntries, name='entry',
                                       namespace='suse')
-        self._databinder.registerType(_RpmRequires, name='requires',
+        registry.registerType(_RpmRequires, name='requires',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmRecommends, name='recommends',
+        registry.registerType(_RpmRecommends, name='recommends',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmProvides, name='provides',
+        registry.registerType(_RpmProvides, name='provides',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmObsoletes, name='obsoletes',
+        registry.registerType(_RpmObsoletes, name='obsoletes',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmConflicts, name='conflicts',
+        registry.registerType(_RpmConflicts, name='conflicts',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmEnhances, name='enhances',
+        registry.registerType(_RpmEnhances, name='enhances',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmSupplements, name='supplements',
+        registry.registerType(_RpmSupplements, name='supplements',
                                       namespace='rpm')
-        self._databinder.registerType(_RpmSuggests, name='suggests',
+        registry.registerType(_RpmSuggests, name='suggests',
                                       namespace='rpm')
-        self._databinder.registerType(_SuseFreshens, name='freshens',
+        registry.registerType(_SuseFreshens, name='freshens',
                                       namespace='suse')
-        self._databinder.registerType(xmllib.StringNode,
+        registry.registerType(xmllib.StringNode,
                                       name='license-to-confirm',
                                       namespace='suse')
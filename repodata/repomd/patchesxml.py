@@ -62,7 +62,8 @@ class _PatchElement(SlotNode):
             raise UnknownElementError(child)
 
     def finalize(self):
-        self._parser = PatchXml(None, self.location)
+        self._parser = PatchXml(None, self.location, self.checksum,
+            self.checksumType)
         self.parseChildren = self._parser.parse
         return self
 
@@ -71,11 +72,11 @@ class PatchesXml(XmlStreamedParser):
     Handle registering all types for parsing patches.xml.
     """
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        self._databinder.registerType(_Patches, name='patches')
-        self._databinder.registerType(_PatchElement, name='patch')
-        self._databinder.registerType(xmllib.StringNode, name='checksum')
+        registry.registerType(_Patches, name='patches')
+        registry.registerType(_PatchElement, name='patch')
+        registry.registerType(xmllib.StringNode, name='checksum')
@@ -0,0 +1,149 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Local store of parsed patches for incremental syncing of SuSE patch
+metadata.
+
+patches.xml lists a checksum for every patch-*.xml file. The store keeps the
+parsed patches keyed by location and checksum, so a sync only downloads and
+parses the patch files that are new or have changed since the previous sync.
+
+Example:
+> result = client.syncPatchDetail('/var/cache/repodata/sles-patches')
+> print 'fetched %d, removed %d' % (len(result.fetched),
+>                                   len(result.removed))
+> for patch in result.patches:
+>     print patch.name
+"""
+
+__all__ = ('PatchStore', 'PatchSyncResult', )
+
+import os
+import marshal
+import tempfile
+
+from patchxml import PatchXml
+from snapshot import patchToRecord, recordToPatch
+
+
+class PatchSyncResult(object):
+    """
+    Outcome of a patch sync.
+    @ivar patches: all patches currently in the repository
+    @ivar fetched: locations of the patch files that were downloaded
+    @ivar removed: locations of the patch files that are no longer listed
+    """
+
+    __slots__ = ('patches', 'fetched', 'removed')
+
+    def __init__(self, patches, fetched, removed):
+        self.patches = patches
+        self.fetched = fetched
+        self.removed = removed
+
+
+class PatchStore(object):
+    """
+    Parsed patches of one repository, stored as a single marshaled file
+    mapping the location of each patch file to its checksum and record.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, packageFactory=None):
+        """
+        @param path: file the patches are stored in
+        @param packageFactory: package class to restore the packages of
+        stored patches with, the one patch files are parsed with
+        """
+
+        self._path = path
+        self._packageFactory = packageFactory or PatchXml.PackageFactory
+
+    def load(self):
+        """
+        @return dictionary of location to (checksum, record), empty if there
+        is no usable store
+        """
+
+        try:
+            fobj = open(self._path, 'rb')
+        except IOError:
+            return {}
+
+        try:
+            try:
+                version, entries = marshal.load(fobj)
+            except (EOFError, ValueError, TypeError):
+                version, entries = None, None
+        finally:
+            fobj.close()
+
+        if version != self.FORMAT_VERSION:
+            return {}
+        return entries
+
+    def save(self, entries):
+        """
+        Atomically replace the stored entries.
+        """
+
+        storeDir = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.isdir(storeDir):
+            os.makedirs(storeDir)
+
+        fd, tmpPath = tempfile.mkstemp(dir=storeDir, prefix='.patches')
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump((self.FORMAT_VERSION, entries), fobj, 2)
+        finally:
+            fobj.close()
+        os.rename(tmpPath, self._path)
+
+    def sync(self, elements, fetch):
+        """
+        Bring the store up to date with the patch elements of patches.xml.
+        @param elements: patch elements from patches.xml
+        @param fetch: function downloading and parsing the patch file of an
+        element
+        @rtype: PatchSyncResult
+        """
+
+        entries = self.load()
+        newEntries = {}
+        patches = []
+        fetched = []
+
+        for element in elements:
+            location = element.location
+            entry = entries.get(location)
+            if entry is not None and entry[0] == element.checksum:
+                record = entry[1]
+                patch = recordToPatch(record, self._packageFactory)
+            else:
+                patch = fetch(element)
+                record = patchToRecord(patch)
+                fetched.append(location)
+            newEntries[location] = (element.checksum, record)
+            patches.append(patch)
+
+        removed = sorted(set(entries) - set(newEntries))
+        if fetched or removed:
+            self.save(newEntries)
+
+        return PatchSyncResult(patches, fetched, removed)
@@ -19,13 +19,14 @@
 Module for parsing patch-*.xml files from the repository metadata.
 """
 
-__all__ = ('PatchXml', )
+__all__ = ('PatchXml', 'mergePatches', 'getPatchPackageClass', )
 
 from rpath_xmllib import api1 as xmllib
 
 from xmlcommon import XmlFileParser, SlotNode
 from packagexml import PackageXmlMixIn
 from errors import UnknownElementError
+from rpmver import rpmvercmp
 
 class _Patch(SlotNode):
     """
@@ -46,57 +47,80 @@ class _Patch(SlotNode):
     # W0201 - Attribute $foo defined outside __init__
     # pylint: disable-msg=W0201
 
+    # Map of dependency element names to _Patch attributes
+    _dependencyNames = {
+        'rpm:requires': 'requires',
+        'rpm:provides': 'provides',
+        'rpm:supplements': 'supplements',
+        'rpm:recommends': 'recommends',
+        'rpm:obsoletes': 'obsoletes',
+        'rpm:conflicts': 'conflicts',
+    }
+
+    def _addName(self, child):
+        self.name = child.finalize()
+
+    def _addSummary(self, child):
+        if child.getAttribute('lang') == 'en':
+            self.summary = child.finalize()
+
+    def _addDescription(self, child):
+        if child.getAttribute('lang') == 'en':
+            self.description = child.finalize()
+
+    def _addVersion(self, child):
+        self.version = child.getAttribute('ver')
+        self.release = child.getAttribute('rel')
+
+    def _addRebootNeeded(self, child):
+        self.rebootNeeded = True
+
+    def _addLicenseToConfirm(self, child):
+        self.licenseToConfirm = child.finalize()
+
+    def _addPackageManager(self, child):
+        self.packageManager = True
+
+    def _addCategory(self, child):
+        self.category = child.finalize()
+
+    def _addAtoms(self, child):
+        self.packages = child.getChildren('package')
+
+    _childHandlers = {
+        'yum:name': _addName,
+        'summary': _addSummary,
+        'description': _addDescription,
+        'yum:version': _addVersion,
+        'reboot-needed': _addRebootNeeded,
+        'license-to-confirm': _addLicenseToConfirm,
+        'package-manager': _addPackageManager,
+        'category': _addCategory,
+        'atoms': _addAtoms,
+    }
+
     def addChild(self, child):
         """
         Parse children of patch element.
         """
 
-        # R0912 - Too many branches
-        # pylint: disable-msg=R0912
-
         n = child.getName()
-        if n == 'yum:name':
-            self.name = child.finalize()
-        elif n == 'summary':
-            if child.getAttribute('lang') == 'en':
-                self.summary = child.finalize()
-        elif n == 'description':
-            if child.getAttribute('lang') == 'en':
-                self.description = child.finalize()
-        elif n == 'yum:version':
-            self.version = child.getAttribute('ver')
-            self.release = child.getAttribute('rel')
-        elif n == 'rpm:requires':
-            self.requires = child.getChildren('entry', namespace='rpm')
-        elif n == 'rpm:provides':
-            self.provides = child.getChildren('entry', namespace='rpm')
-        elif n == 'rpm:supplements':
-            self.supplements = child.getChildren('entry', namespace='rpm')
-        elif n == 'rpm:recommends':
-            self.recommends = child.getChildren('entry', namespace='rpm')
-        elif n == 'rpm:obsoletes':
-            self.obsoletes = child.getChildren('entry', namespace='rpm')
-        elif n == 'rpm:conflicts':
-            self.conflicts = child.getChildren('entry', namespace='rpm')
-        elif n == 'reboot-needed':
-            self.rebootNeeded = True
-        elif n == 'license-to-confirm':
-            self.licenseToConfirm = child.finalize()
-        elif n == 'package-manager':
-            self.packageManager = True
-        elif n == 'category':
-            self.category = child.finalize()
-        elif n == 'atoms':
-            self.packages = child.getChildren('package')
-        else:
+        handler = self._childHandlers.get(n)
+        if handler is not None:
+            handler(self, child)
+            return
+
+        attr = self._dependencyNames.get(n)
+        if attr is None:
             raise UnknownElementError(child)
+        setattr(self, attr, child.dependencies or [])
 
     def __cmp__(self, other):
-        vercmp = cmp(self.version, other.version)
+        vercmp = rpmvercmp(self.version, other.version)
         if vercmp != 0:
             return vercmp
 
-        relcmp = cmp(self.release, other.release)
+        relcmp = rpmvercmp(self.release, other.release)
         if relcmp != 0:
             return relcmp
 
@@ -104,19 +128,57 @@ class _Patch(SlotNode):
         if sumcmp != 0:
             return sumcmp
 
-        desccmp = cmp(self.description, other.description)
-        if desccmp != 0:
-            return desccmp
+        return cmp(self.description, other.description)
 
-        for pkg in other.packages:
-            if pkg not in self.packages:
-                self.packages.append(pkg)
+    def getKey(self):
+        """
+        Return the name, version, release, summary and description of the
+        patch. Patches with the same key are the same patch.
+        """
 
-        return 0
+        return (self.name, self.version, self.release, self.summary,
+                self.description)
 
     def __hash__(self):
-        return hash((self.name, self.version, self.release, self.summary,
-                     self.description))
+        return hash(self.getKey())
+
+
+def mergePatches(patches):
+    """
+    Merge patches with the same key, as returned by _Patch.getKey(), into one
+    patch carrying the packages of all of them. Packages are deduplicated by
+    name, epoch, version, release and arch. The first patch seen for each key
+    is updated in place.
+    @param patches: iterable of patches, for example the concatenated
+    results of Client.getPatchDetail() for several repositories
+    @return list of merged patches in the order they were first seen
+    """
+
+    merged = {}
+    ret = []
+    for patch in patches:
+        key = patch.getKey()
+        entry = merged.get(key)
+        if entry is None:
+            packages = []
+            seen = set()
+            for pkg in patch.packages or ():
+                nevra = pkg.getNevra()
+                if nevra not in seen:
+                    seen.add(nevra)
+                    packages.append(pkg)
+            patch.packages = packages
+            merged[key] = (patch, seen)
+            ret.append(patch)
+            continue
+
+        target, seen = entry
+        for pkg in patch.packages or ():
+            nevra = pkg.getNevra()
+            if nevra not in seen:
+                seen.add(nevra)
+                target.packages.append(pkg)
+    return ret
 
 
 class _Atoms(SlotNode):
@@ -143,27 +205,40 @@ class _Atoms(SlotNode):
             raise UnknownElementError(child)
 
 
+# Map of package factory to the package class used in patches
+_patchPackageClasses = {}
+
+def getPatchPackageClass(factory):
+    """
+    Get the class of packages listed in a patch, which adds the package
+    type to the package class.
+    """
+
+    cls = _patchPackageClasses.get(factory)
+    if cls is None:
+        # The base package has no type
+        cls = type('_Package', (factory, ), { '__slots__': ('type', ) })
+        _patchPackageClasses[factory] = cls
+    return cls
+
+
 class PatchXml(XmlFileParser, PackageXmlMixIn):
     """
     Handle registering all types for parsing patch-*.xml files.
     """
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        class _Package(self.PackageFactory):
-            # The base package has no type
-            __slots__ = ('type', )
-
-
-        PackageXmlMixIn._registerTypes(self)
-        self._databinder.registerType(_Package, name='package')
-        self._databinder.registerType(_Patch, name='patch')
-        self._databinder.registerType(xmllib.StringNode, name='name',
+        PackageXmlMixIn._registerTypes(self, registry)
+        registry.registerType(
+            getPatchPackageClass(self.PackageFactory), name='package')
+        registry.registerType(_Patch, name='patch')
+        registry.registerType(xmllib.StringNode, name='name',
                                       namespace='yum')
-        self._databinder.registerType(xmllib.StringNode, name='category')
-        self._databinder.registerType(_Atoms, name='atoms')
-        self._databinder.registerType(xmllib.StringNode,
+        registry.registerType(xmllib.StringNode, name='category')
+        registry.registerType(_Atoms, name='atoms')
+        registry.registerType(xmllib.StringNode,
                                       name='license-to-confirm')
@@ -0,0 +1,70 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Run calls in background threads and pick up their results later.
+"""
+
+__all__ = ('Future', )
+
+import sys
+import threading
+
+
+class Future(object):
+    """
+    Call a function in a daemon thread. result() waits for the call and
+    returns its value, or raises the exception it raised.
+    """
+
+    __slots__ = ('_thread', '_value', '_excInfo', )
+
+    def __init__(self, func, *args, **kwargs):
+        self._value = None
+        self._excInfo = None
+        self._thread = threading.Thread(target=self._run,
+            args=(func, args, kwargs))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._value = func(*args, **kwargs)
+        except:
+            self._excInfo = sys.exc_info()
+
+    def done(self):
+        """
+        @return True if the call has finished
+        """
+
+        return not self._thread.isAlive()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish.
+        @param timeout: optional number of seconds to wait
+        @return value returned by the call
+        @raise RuntimeError: if the call did not finish within timeout
+        """
+
+        self._thread.join(timeout)
+        if self._thread.isAlive():
+            raise RuntimeError('call did not finish in time')
+        if self._excInfo is not None:
+            raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+        return self._value
@@ -24,6 +24,7 @@ __all__ = ('PrimaryXml', )
 from packagexml import PackageXmlMixIn
 from errors import UnknownElementError
 from xmlcommon import XmlStreamedParser, SlotNode
+import lazyxml
 
 class _Metadata(SlotNode):
     """
@@ -45,10 +46,30 @@ class PrimaryXml(XmlStreamedParser, PackageXmlMixIn):
     Handle registering all types for parsing primary.xml.gz.
     """
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        PackageXmlMixIn._registerTypes(self)
-        self._databinder.registerType(_Metadata, name='metadata')
+        PackageXmlMixIn._registerTypes(self, registry)
+        registry.registerType(_Metadata, name='metadata')
+
+    def parseLazy(self, repository=None):
+        """
+        Parse primary.xml.gz, decoding only the name, arch, version, checksum
+        and location of each package. Other attributes are decoded on first
+        access.
+        @param repository: repository to read from instead of the one the
+        parser was set up with
+        @return iterator of lazy package instances
+        """
+
+        fn = self._open(repository)
+        scanner = lazyxml.FragmentScanner(fn, 'package')
+        cls = lazyxml.getLazyPackageClass(self.PackageFactory)
+        decoder = None
+        for fragment in scanner:
+            if decoder is None:
+                decoder = lazyxml.FragmentDecoder(self.__class__,
+                    self.PackageFactory, scanner.rootStart, scanner.rootName)
+            yield cls(fragment, decoder)
@@ -56,20 +56,24 @@ class _RepoMd(SlotNode):
         elif name == 'data':
             child.type = child.getAttribute('type')
             if child.type == 'patches':
-                child._parser = PatchesXml(None, child.location)
+                child._parser = PatchesXml(None, child.location,
+                    child.checksum, child.checksumType)
                 child.iterSubnodes = child._parser.parse
             elif child.type == 'primary':
-                child._parser = PrimaryXml(None, child.location)
+                child._parser = PrimaryXml(None, child.location,
+                    child.checksum, child.checksumType)
                 child._parser.PackageFactory = self.PackageFactory
-                child._parser._registerTypes()
+                child._parser._compileTypes()
                 child.iterSubnodes = child._parser.parse
             elif child.type == 'filelists':
-                child._parser = FileListsXml(None, child.location)
+                child._parser = FileListsXml(None, child.location,
+                    child.checksum, child.checksumType)
                 child._parser.PackageFactory = self.PackageFactory
-                child._parser._registerTypes()
+                child._parser._compileTypes()
                 child.iterSubnodes = child._parser.parse
             elif child.type == 'updateinfo':
-                child._parser = UpdateInfoXml(None, child.location)
+                child._parser = UpdateInfoXml(None, child.location,
+                    child.checksum, child.checksumType)
                 child.iterSubnodes = child._parser.parse
             SlotNode.addChild(self, child)
         elif name == 'tags':
@@ -99,6 +103,25 @@ class _RepoMd(SlotNode):
 
         return None
 
+    def getFingerprint(self):
+        """
+        @return value that is different for every change of the metadata
+        """
+
+        return (self.revision, tuple(sorted((x.type, x.checksum)
+            for x in self.getChildren('data'))))
+
+    def getTimestamp(self):
+        """
+        @return newest timestamp of the data files, or None if there is none
+        """
+
+        timestamps = [ x.timestamp for x in self.getChildren('data')
+                       if x.timestamp is not None ]
+        if not timestamps:
+            return None
+        return max(timestamps)
+
 
 class _RepoMdDataElement(SlotNode):
     """
@@ -113,30 +136,48 @@ class _RepoMdDataElement(SlotNode):
     # W0201 - Attribute $foo defined outside __init__
     # pylint: disable-msg=W0201
 
+    def _addLocation(self, child):
+        self.location = child.getAttribute('href')
+
+    def _addChecksum(self, child):
+        self.checksum = child.finalize()
+        self.checksumType = child.getAttribute('type')
+
+    def _addTimestamp(self, child):
+        self.timestamp = child.finalize()
+
+    def _addOpenChecksum(self, child):
+        self.openChecksum = child.finalize()
+        self.openChecksumType = child.getAttribute('type')
+
+    def _addDatabaseVersion(self, child):
+        self.databaseVersion = child.finalize()
+
+    def _addSize(self, child):
+        self.size = child.finalize()
+
+    def _addOpenSize(self, child):
+        self.openSize = child.finalize()
+
+    _childHandlers = {
+        'location': _addLocation,
+        'checksum': _addChecksum,
+        'timestamp': _addTimestamp,
+        'open-checksum': _addOpenChecksum,
+        'database_version': _addDatabaseVersion,
+        'size': _addSize,
+        'open-size': _addOpenSize,
+    }
+
     def addChild(self, child):
         """
         Parse children of data element.
         """
 
-        name = child.getName()
-        if name == 'location':
-            self.location = child.getAttribute('href')
-        elif name == 'checksum':
-            self.checksum = child.finalize()
-            self.checksumType = child.getAttribute('type')
-        elif name == 'timestamp':
-            self.timestamp = child.finalize()
-        elif name == 'open-checksum':
-            self.openChecksum = child.finalize()
-            self.openChecksumType = child.getAttribute('type')
-        elif name == 'database_version':
-            self.databaseVersion = child.finalize()
-        elif name == 'size':
-            self.size = child.finalize()
-        elif name == 'open-size':
-            self.openSize = child.finalize()
-        else:
+        handler = self._childHandlers.get(child.getName())
+        if handler is None:
             raise UnknownElementError(child)
+        handler(self, child)
 
 
 class RepoMdXml(XmlFileParser):
@@ -145,15 +186,17 @@ class RepoMdXml(XmlFileParser):
     """
     RepoMdFactory = _RepoMd
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup databinder to parse xml.
         """
 
-        self._databinder.registerType(self.RepoMdFactory, name='repomd')
-        self._databinder.registerType(_RepoMdDataElement, name='data')
-        self._databinder.registerType(xmllib.StringNode, name='revision')
-        self._databinder.registerType(xmllib.StringNode, name='checksum')
-        self._databinder.registerType(xmllib.IntegerNode, name='timestamp')
-        self._databinder.registerType(xmllib.StringNode, name='open-checksum')
-        self._databinder.registerType(xmllib.StringNode, name='database_version')
+        registry.registerType(self.RepoMdFactory, name='repomd')
+        registry.registerType(_RepoMdDataElement, name='data')
+        registry.registerType(xmllib.StringNode, name='revision')
+        registry.registerType(xmllib.StringNode, name='checksum')
+        registry.registerType(xmllib.IntegerNode, name='timestamp')
+        registry.registerType(xmllib.StringNode, name='open-checksum')
+        registry.registerType(xmllib.StringNode, name='database_version')
+        registry.registerType(xmllib.StringNode, name='size')
+        registry.registerType(xmllib.StringNode, name='open-size')
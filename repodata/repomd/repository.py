@@ -22,10 +22,15 @@ Repository access module.
 __all__ = ('Repository',  )
 
 import os
+import copy
 import gzip
+import time
 import tempfile
+import threading
 
-from repodata import urlopener
+from repodata import urlopener, retry
+from repodata.repomd import instrument, storage, mirrors, sharedcache
+from repodata.repomd.prefetch import Future
 
 from conary.lib import digestlib, util
 from conary.lib.http import http_error
@@ -33,47 +38,425 @@ from conary.lib.http import http_error
 class Repository(object):
     """
     Access files from the repository.
+
+    file:// urls and plain directory paths are read in place through
+    LocalStorage; everything else is downloaded through URLOpener and spooled
+    to a temporary file, once for all threads getting it at the same time.
+    With a mirror list or metalink, files are downloaded from the best
+    ranked mirror through MirrorStorage, which fails over to the next
+    mirror instead of retrying. With a cache
+    directory, downloaded files whose checksum is known are kept in a
+    SharedCache and fetched once for all processes using it. Any other
+    repomd.storage.Storage, like BufferStorage or TarStorage, can be passed
+    in directly.
     """
     URLOpenerFactory = urlopener.URLOpener
+    RetryPolicyFactory = retry.RetryPolicy
+    URLStorageFactory = storage.URLStorage
+    LocalStorageFactory = storage.LocalStorage
+    MirrorStorageFactory = mirrors.MirrorStorage
+    SharedCacheFactory = sharedcache.SharedCache
     TransportError = http_error.TransportError
 
-    def __init__(self, repoUrl, proxyMap=None):
+    # Read size used when computing digests of files opened in place.
+    BUFFER_SIZE = 1024 * 1024
+
+    # Directory of the metadata files. Only these are hedged, hedged
+    # downloads are spooled completely and sent twice when slow, which does
+    # not pay off for packages.
+    METADATA_DIR = 'repodata/'
+
+    # Seconds a prefetched file waits for get() before it is closed
+    PREFETCH_TTL = 300
+
+    def __init__(self, repoUrl, proxyMap=None, metrics=None,
+            mirrorList=None, metalink=None, mirrorRegistry=None,
+            hedgeDelay=None, hedgeThroughput=None, retryPolicy=None,
+            deadline=None, cacheDir=None, storage=None, hostLimiter=None):
+        """
+        @param mirrorList: optional url of a list of mirrors of the
+        repository, one per line
+        @param metalink: optional url of a metalink for repomd.xml
+        @param mirrorRegistry: mirror statistics to rank mirrors by,
+        defaults to the registry shared by all repositories
+        @type mirrorRegistry: repomd.mirrors.MirrorRegistry
+        @param hedgeDelay: enables hedged requests in get() of metadata
+        files when the repository has mirrors. Files that have not started
+        arriving after this many seconds are requested from the next mirror
+        as well.
+        @param hedgeThroughput: optional bytes per second a transfer must
+        reach within hedgeDelay to not be hedged
+        @param retryPolicy: optional policy for retrying failed requests
+        @type retryPolicy: repodata.retry.RetryPolicy
+        @param deadline: optional deadline for all requests
+        @type deadline: repodata.retry.Deadline
+        @param cacheDir: optional directory of metadata files shared with
+        other processes, see repomd.sharedcache
+        @type cacheDir: string
+        @param storage: optional backend to read files from instead of
+        repoUrl, which then only names the repository
+        @type storage: repomd.storage.Storage
+        @param hostLimiter: optional limit of concurrent transfers per host
+        @type hostLimiter: repodata.retry.HostLimiter
+        """
+
         self._repoUrl = repoUrl.rstrip('/')
         self._proxyMap = proxyMap
-        self._opener = self.URLOpenerFactory(proxyMap=self._proxyMap)
+        self._mirrorList = mirrorList
+        self._metalink = metalink
+        self._mirrorRegistry = mirrorRegistry
+        self._hedgeDelay = hedgeDelay
+        self._hedgeThroughput = hedgeThroughput
+        self._retryPolicy = retryPolicy
+        self._deadline = deadline
+        self._hostLimiter = hostLimiter
+        self._opener = None
+        if storage is None:
+            storage = self._createStorage()
+        self._storage = storage
+        self._cache = None
+        if cacheDir is not None and not self._storage.IsSeekable:
+            self._cache = self.SharedCacheFactory(cacheDir)
+        # url -> [ lock, number of threads using it, path of the downloaded
+        # file or None ], so concurrent gets of a file download it once
+        self._flights = {}
+        self._flightsLock = threading.Lock()
+        # fileName -> Future of a background get()
+        self._prefetched = {}
+        # fileName -> timer closing the prefetched file if nobody gets it
+        self._prefetchTimers = {}
+        self._prefetchLock = threading.Lock()
+        # instance of instrument.MetricsSink or None
+        self.metrics = metrics
 
-    def get(self, fileName, computeShaDigest = False):
+    def _createStorage(self):
+        """
+        Pick the storage backend for the repository url.
+        @return instance of repomd.storage.Storage
+        """
+
+        if self._mirrorList or self._metalink:
+            return self._createMirrorStorage()
+        if storage.isLocalUrl(self._repoUrl):
+            return self.LocalStorageFactory(self._repoUrl)
+        self._opener = self.URLOpenerFactory(proxyMap=self._proxyMap,
+            retryPolicy=self._retryPolicy, deadline=self._deadline,
+            hostLimiter=self._hostLimiter)
+        return self.URLStorageFactory(self._repoUrl, self._opener)
+
+    def _createMirrorStorage(self):
+        """
+        Fetch the mirror list or metalink. The repository url is used as the
+        last resort mirror.
+        @return instance of repomd.mirrors.MirrorStorage
+        """
+
+        # Mirrors fail over to each other, so requests are not retried. The
+        # circuit breaker still skips mirrors known to be down.
+        breaker = None
+        if self._retryPolicy is not None:
+            breaker = self._retryPolicy.breaker
+        self._opener = self.URLOpenerFactory(proxyMap=self._proxyMap,
+            retryPolicy=self.RetryPolicyFactory(maxAttempts=1,
+                breaker=breaker),
+            deadline=self._deadline, hostLimiter=self._hostLimiter)
+        if self._metalink:
+            fobj = self._opener.open(self._metalink)
+            parse = mirrors.parseMetalink
+        else:
+            fobj = self._opener.open(self._mirrorList)
+            parse = mirrors.parseMirrorList
+        try:
+            urls = parse(fobj)
+        finally:
+            fobj.close()
+        if self._repoUrl not in urls:
+            urls.append(self._repoUrl)
+        return self.MirrorStorageFactory(urls, self._opener,
+            self._mirrorRegistry, hedgeDelay=self._hedgeDelay,
+            hedgeThroughput=self._hedgeThroughput)
+
+    def withDeadline(self, deadline):
+        """
+        Get a view of the repository whose requests have to finish by
+        deadline. The view shares the storage, shared cache, prefetched
+        files and metrics of this repository.
+        @type deadline: repodata.retry.Deadline
+        """
+
+        repo = copy.copy(self)
+        repo._deadline = retry.Deadline.earliest(self._deadline, deadline)
+        repo._storage = self._storage.withDeadline(deadline)
+        if self._opener is not None:
+            repo._opener = self._opener.withDeadline(deadline)
+        return repo
+
+    def getMirrors(self):
+        """
+        @return mirror urls, best first, or only the repository url if the
+        repository has no mirrors
+        """
+
+        if hasattr(self._storage, 'getMirrors'):
+            return self._storage.getMirrors()
+        return [ self._repoUrl ]
+
+    @property
+    def hedgeStats(self):
+        """
+        Counters of hedged requests, or None if get() does not hedge.
+        @rtype: repomd.mirrors.HedgeStats
+        """
+
+        if not self._canHedge():
+            return None
+        return self._storage.hedgeStats
+
+    def _canHedge(self):
+        return (self._hedgeDelay is not None and
+                hasattr(self._storage, 'openHedged'))
+
+    def _isHedged(self, fileName):
+        return (self._canHedge() and
+                fileName.lstrip('/').startswith(self.METADATA_DIR))
+
+    def get(self, fileName, computeShaDigest = False, checksum=None,
+            checksumType=None):
         """
         Download a file from the repository.
         @param fileName: relative path to file
         @type fileName: string
+        @param checksum: optional checksum of the file from the metadata,
+        files with a checksum are served from the shared cache directory
+        if the repository has one
+        @param checksumType: type of checksum, for example sha256
         @return open file instance
         """
 
-        fobj = self._getTempFileObject()
-        realUrl = self._getRealUrl(fileName)
+        # Prefetched files have no digest, they are left for the next call
+        # without one
+        if not computeShaDigest:
+            future = self._takePrefetched(fileName)
+            if future is not None:
+                return future.result()
+        return self._get(fileName, computeShaDigest, checksum, checksumType)
+
+    def prefetch(self, fileName, checksum=None, checksumType=None):
+        """
+        Start downloading a file in the background. The next get() of the
+        file returns the downloaded file, or raises the error the download
+        failed with. If no get() asks for it within PREFETCH_TTL seconds the
+        file is closed.
+        @param fileName: relative path to file
+        @type fileName: string
+        """
+
+        self._prefetchLock.acquire()
+        try:
+            if fileName in self._prefetched:
+                return
+            future = self._prefetched[fileName] = Future(self._get,
+                fileName, False, checksum, checksumType)
+            timer = self._prefetchTimers[fileName] = threading.Timer(
+                self.PREFETCH_TTL, self._expirePrefetched,
+                (fileName, future))
+            timer.setDaemon(True)
+            timer.start()
+        finally:
+            self._prefetchLock.release()
+
+    def _expirePrefetched(self, fileName, future):
+        self._prefetchLock.acquire()
+        try:
+            if self._prefetched.get(fileName) is not future:
+                # Taken by get() or dropped already
+                return
+            del self._prefetched[fileName]
+            del self._prefetchTimers[fileName]
+        finally:
+            self._prefetchLock.release()
+        self._closePrefetched(future)
+
+    def _takePrefetched(self, fileName):
+        self._prefetchLock.acquire()
+        try:
+            timer = self._prefetchTimers.pop(fileName, None)
+            if timer is not None:
+                timer.cancel()
+            return self._prefetched.pop(fileName, None)
+        finally:
+            self._prefetchLock.release()
+
+    def dropPrefetched(self):
+        """
+        Forget all prefetched files that were not used yet and close them,
+        for example because the metadata changed.
+        """
+
+        self._prefetchLock.acquire()
+        try:
+            futures = self._prefetched.values()
+            self._prefetched.clear()
+            for timer in self._prefetchTimers.values():
+                timer.cancel()
+            self._prefetchTimers.clear()
+        finally:
+            self._prefetchLock.release()
+        for future in futures:
+            if future.done():
+                self._closePrefetched(future)
+            else:
+                Future(self._closePrefetched, future)
+
+    @classmethod
+    def _closePrefetched(cls, future):
+        try:
+            fobj = future.result()
+        except Exception:
+            # Nobody is interested in the error any more
+            return
+        fobj.close()
+
+    def _get(self, fileName, computeShaDigest, checksum, checksumType):
 
-        inf = self._opener.open(realUrl)
         if computeShaDigest:
             dig = digestlib.sha1()
         else:
             dig = None
-        util.copyfileobj(inf, fobj, digest = dig)
-        fobj.seek(0)
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.time()
+
+        if self._cache is not None and checksum is not None:
+            fobj = open(self._cache.fetch(self._getCacheUrl(fileName),
+                checksum, checksumType,
+                lambda fobj: self._download(fileName, fobj)), 'rb')
+        elif self._storage.IsSeekable:
+            fobj = self._storage.open(fileName)
+        else:
+            fobj = self._getShared(fileName)
+        if dig is not None:
+            self._digestFile(fobj, dig)
+
+        if metrics is not None:
+            metrics.addTiming(instrument.STAGE_DOWNLOAD, fileName,
+                time.time() - start)
+            fobj.seek(0, 2)
+            metrics.addBytes(instrument.STAGE_DOWNLOAD, fileName,
+                fobj.tell())
+            fobj.seek(0)
 
         if not os.path.basename(fileName).endswith('.gz'):
             return self.FileWrapper.create(fobj, dig)
-        return self.FileWrapper.create(gzip.GzipFile(fileobj=fobj, mode="r"),
-            dig)
+
+        fobj = gzip.GzipFile(fileobj=fobj, mode="r")
+        # Closing the GzipFile closes the downloaded file too
+        fobj.myfileobj = fobj.fileobj
+        if metrics is not None:
+            fobj = instrument.MeteredFile(fobj, metrics,
+                instrument.STAGE_DECOMPRESS, fileName)
+        return self.FileWrapper.create(fobj, dig)
+
+    def _getShared(self, fileName):
+        """
+        Download a file into a temporary file. Threads getting the same
+        file at the same time wait for the first one and open its download.
+        If that fails, the next thread tries again.
+        @return open temporary file
+        """
+
+        url = self._getCacheUrl(fileName)
+        flight = self._acquireFlight(url)
+        try:
+            if flight[2] is None:
+                fd, path = tempfile.mkstemp(prefix='mdparse')
+                try:
+                    fobj = os.fdopen(fd, 'wb')
+                    try:
+                        self._download(fileName, fobj)
+                    finally:
+                        fobj.close()
+                except:
+                    os.unlink(path)
+                    raise
+                flight[2] = path
+            return open(flight[2], 'rb')
+        finally:
+            self._releaseFlight(url)
+
+    def _acquireFlight(self, url):
+        self._flightsLock.acquire()
+        try:
+            flight = self._flights.get(url)
+            if flight is None:
+                flight = self._flights[url] = [ threading.Lock(), 0, None ]
+            flight[1] += 1
+        finally:
+            self._flightsLock.release()
+        flight[0].acquire()
+        return flight
+
+    def _releaseFlight(self, url):
+        self._flightsLock.acquire()
+        try:
+            flight = self._flights[url]
+            flight[0].release()
+            flight[1] -= 1
+            if flight[1]:
+                return
+            del self._flights[url]
+        finally:
+            self._flightsLock.release()
+        # Everybody opened the file, it goes away once they close it
+        if flight[2] is not None:
+            os.unlink(flight[2])
+
+    def _download(self, fileName, fobj):
+        """
+        Copy a file from the storage backend into fobj.
+        """
+
+        if self._isHedged(fileName):
+            inf = self._storage.openHedged(fileName)
+        else:
+            inf = self._storage.open(fileName)
+        try:
+            util.copyfileobj(inf, fobj)
+        finally:
+            inf.close()
+
+    def _getCacheUrl(self, fileName):
+        """
+        @return url identifying a file in the shared cache, the same for
+        all mirrors of the repository
+        """
+
+        return "%s/%s" % (self._repoUrl, fileName.lstrip('/'))
+
+    def open(self, fileName):
+        """
+        Open a file from the repository as it is stored, without spooling it
+        to a temporary file or decompressing it.
+        @param fileName: relative path to file
+        @type fileName: string
+        @return file-like object
+        """
+
+        return self._storage.open(fileName)
 
     @classmethod
-    def _getTempFileObject(cls):
+    def _digestFile(cls, fobj, digest):
         """
-        Generate a tempory file object.
-        @return file object
+        Feed the contents of a seekable file to digest and rewind it.
         """
 
-        return tempfile.TemporaryFile(prefix='mdparse')
+        while True:
+            buf = fobj.read(cls.BUFFER_SIZE)
+            if not buf:
+                break
+            digest.update(buf)
+        fobj.seek(0)
 
     def _getRealUrl(self, path):
         """
@@ -82,7 +465,7 @@ class Repository(object):
         @return full repository url
         """
 
-        return "%s/%s" % (self._repoUrl, path.lstrip('/'))
+        return self._storage.getRealUrl(path)
 
     class FileWrapper(object):
         __slots__ = [ 'file', 'sha1sum' ]
@@ -0,0 +1,125 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+RPM version comparison.
+
+Versions are converted into sort keys that order the same way rpmvercmp
+does, so comparing and sorting only compares tuples. Keys are memoized since
+the same versions show up over and over in repository metadata.
+"""
+
+__all__ = ('versionKey', 'evrKey', 'rpmvercmp', 'evrcmp',
+    'getLatestPackages', )
+
+import re
+
+# Segment types, in the order rpmvercmp sorts them. The end of the version
+# string sorts after a tilde but before a caret or any other segment.
+_TILDE = (0, )
+_END = (1, )
+_CARET = (2, )
+_ALPHA = 3
+_NUMERIC = 4
+
+_segmentRe = re.compile(r'(~)|(\^)|([0-9]+)|([a-zA-Z]+)')
+
+# Memoized keys. The caches are cleared when they grow past MAX_CACHE_SIZE.
+MAX_CACHE_SIZE = 200000
+_versionKeys = {}
+_evrKeys = {}
+
+
+def _computeVersionKey(version):
+    key = []
+    for tilde, caret, numeric, alpha in _segmentRe.findall(version):
+        if tilde:
+            key.append(_TILDE)
+        elif caret:
+            key.append(_CARET)
+        elif numeric:
+            key.append((_NUMERIC, int(numeric)))
+        else:
+            key.append((_ALPHA, alpha))
+    key.append(_END)
+    return tuple(key)
+
+def versionKey(version):
+    """
+    Get the sort key of a version or release string.
+    """
+
+    key = _versionKeys.get(version)
+    if key is None:
+        if len(_versionKeys) >= MAX_CACHE_SIZE:
+            _versionKeys.clear()
+        key = _computeVersionKey(version or '')
+        _versionKeys[version] = key
+    return key
+
+def evrKey(epoch, version, release):
+    """
+    Get the sort key of an epoch, version, release triple. A missing epoch
+    is treated as 0.
+    """
+
+    evr = (epoch, version, release)
+    key = _evrKeys.get(evr)
+    if key is None:
+        if len(_evrKeys) >= MAX_CACHE_SIZE:
+            _evrKeys.clear()
+        try:
+            epochNum = int(epoch or 0)
+        except ValueError:
+            epochNum = 0
+        key = (epochNum, versionKey(version), versionKey(release))
+        _evrKeys[evr] = key
+    return key
+
+def rpmvercmp(first, second):
+    """
+    Compare two version or release strings like rpm does.
+    @return -1, 0 or 1
+    """
+
+    return cmp(versionKey(first), versionKey(second))
+
+def evrcmp(first, second):
+    """
+    Compare two (epoch, version, release) triples.
+    @return -1, 0 or 1
+    """
+
+    return cmp(evrKey(*first), evrKey(*second))
+
+def getLatestPackages(packages):
+    """
+    Reduce packages to the newest one per name and arch in a single pass.
+    Only the current winner of each name and arch is kept.
+    @param packages: iterable of packages, for example the result of
+    Client.getPackageDetail()
+    @return dictionary of (name, arch) to package
+    """
+
+    latest = {}
+    for pkg in packages:
+        key = (pkg.name, pkg.arch)
+        evr = evrKey(pkg.epoch, pkg.version, pkg.release)
+        current = latest.get(key)
+        if current is None or evr > current[0]:
+            latest[key] = (evr, pkg)
+    return dict((key, pkg) for key, (_, pkg) in latest.iteritems())
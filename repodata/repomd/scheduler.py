@@ -0,0 +1,288 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Adaptive polling of many repositories under a request budget.
+
+Each repository is polled at a fraction of the time it is expected to go
+without changing. That expectation is the smoothed time between the changes
+seen so far, or the time since the last change when that is longer, so
+busy repositories are polled often and repositories that have not changed
+in weeks are barely polled at all. Change times are taken from the data
+timestamps in repomd.xml where possible, so they do not depend on when the
+change happened to be noticed.
+
+Polls are paid for from a token bucket holding budget requests that refills
+over period seconds. When more repositories are due than the budget
+allows, the most overdue ones are polled first.
+
+Example:
+> scheduler = RefreshScheduler(budget=1000, period=3600)
+> for url in urls:
+>     scheduler.addClient(url, repomd.Client(url))
+> while True:
+>     for name in scheduler.runOnce():
+>         print '%s changed' % name
+>     time.sleep(max(0, scheduler.getNextPollTime() - time.time()))
+"""
+
+__all__ = ('RefreshScheduler', 'RepoState', )
+
+import time
+
+from conary.lib.http import http_error
+
+from errors import RepoMdError, XmlErrors
+
+
+class RepoState(object):
+    """
+    Polling state of one repository.
+    @ivar interval: seconds between the last poll and the next one
+    @ivar changeInterval: smoothed seconds between changes, None until two
+    changes have been seen
+    @ivar history: (poll time, revision, timestamp) of the latest changes
+    @ivar stale: report the repository as changed on the next poll
+    """
+
+    __slots__ = ('name', 'client', 'interval', 'nextPoll', 'lastPoll',
+                 'lastChange', 'changeInterval', 'fingerprint', 'history',
+                 'polls', 'changes', 'failures', 'stale', )
+
+    def __init__(self, name, client, nextPoll, interval):
+        self.name = name
+        self.client = client
+        self.interval = interval
+        self.nextPoll = nextPoll
+        self.lastPoll = None
+        self.lastChange = None
+        self.changeInterval = None
+        self.fingerprint = None
+        self.history = []
+        self.polls = 0
+        self.changes = 0
+        self.failures = 0
+        self.stale = False
+
+
+class RefreshScheduler(object):
+    """
+    Decide when to poll each of a set of repository clients.
+    @ivar polls: number of polls of repositories that had been polled
+    before, the first poll of a repository can not see a change
+    @ivar changes: number of those polls that found a change
+    """
+
+    # Errors that fail one poll rather than the scheduler
+    PollErrors = (http_error.TransportError, RepoMdError,
+        IOError) + XmlErrors
+
+    MIN_INTERVAL = 300
+    MAX_INTERVAL = 86400
+    # Fraction of the expected time without a change to wait between polls
+    POLL_FRACTION = 0.5
+    # Weight of the latest time between changes in changeInterval
+    SMOOTHING = 0.3
+    HISTORY_SIZE = 20
+
+    def __init__(self, budget, period=3600, minInterval=None,
+            maxInterval=None, clock=time.time):
+        """
+        @param budget: number of polls allowed per period
+        @param period: seconds the budget applies to
+        @param minInterval: shortest time between polls of a repository
+        @param maxInterval: longest time between polls of a repository
+        @param clock: function returning the current time
+        """
+
+        self._rate = float(budget) / period
+        self._capacity = float(budget)
+        self._tokens = float(budget)
+        self._clock = clock
+        self._lastRefill = clock()
+        self._minInterval = minInterval or self.MIN_INTERVAL
+        self._maxInterval = maxInterval or self.MAX_INTERVAL
+        self._states = {}
+
+        self.polls = 0
+        self.changes = 0
+
+    def addClient(self, name, client):
+        """
+        Add a repository, it is polled on the next run.
+        @param name: name to report the repository by, for example its url
+        @param client: client of the repository, polled with its refresh()
+        method
+        @type client: repomd.Client
+        @return RepoState
+        """
+
+        state = RepoState(name, client, self._clock(), self._minInterval)
+        self._states[name] = state
+        return state
+
+    def removeClient(self, name):
+        del self._states[name]
+
+    def markStale(self, name):
+        """
+        Report a repository as changed on its next successful poll, even if
+        it did not change again. For callers that failed to load a change.
+        """
+
+        self._states[name].stale = True
+
+    def getState(self, name):
+        """
+        @return RepoState of a repository
+        """
+
+        return self._states[name]
+
+    def getSchedule(self):
+        """
+        @return RepoState of all repositories, next to be polled first
+        """
+
+        return sorted(self._states.itervalues(),
+            key=lambda x: (x.nextPoll, x.name))
+
+    def getNextPollTime(self):
+        """
+        @return time the next repository is due and the budget allows a
+        poll, or None if there are no repositories
+        """
+
+        if not self._states:
+            return None
+        nextPoll = min(x.nextPoll for x in self._states.itervalues())
+        now = self._clock()
+        self._refill(now)
+        if self._tokens < 1:
+            nextPoll = max(nextPoll, now + (1 - self._tokens) / self._rate)
+        return nextPoll
+
+    @property
+    def hitRate(self):
+        """
+        Fraction of polls that found a change.
+        """
+
+        if not self.polls:
+            return 0.0
+        return float(self.changes) / self.polls
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity,
+            self._tokens + (now - self._lastRefill) * self._rate)
+        self._lastRefill = now
+
+    def runOnce(self):
+        """
+        Poll the repositories that are due, as far as the budget allows.
+        @return names of the repositories that changed
+        """
+
+        now = self._clock()
+        self._refill(now)
+
+        def overdue(state):
+            if state.lastPoll is None:
+                return float('inf')
+            return (now - state.lastPoll) / state.interval
+
+        due = [ x for x in self._states.itervalues() if x.nextPoll <= now ]
+        due.sort(key=overdue, reverse=True)
+
+        changed = []
+        for state in due:
+            if self._tokens < 1:
+                break
+            self._tokens -= 1
+            if self._poll(state, now):
+                changed.append(state.name)
+        return changed
+
+    def _poll(self, state, now):
+        """
+        Refresh one repository and schedule its next poll.
+        @return True if the repository changed
+        """
+
+        try:
+            state.client.refresh()
+            repomdXml = state.client.repomdXml
+        except self.PollErrors:
+            # Back off from failing repositories
+            state.failures += 1
+            state.interval = min(self._maxInterval, state.interval * 2)
+            state.nextPoll = now + state.interval
+            return False
+
+        fingerprint = repomdXml.getFingerprint()
+        timestamp = repomdXml.getTimestamp()
+
+        changed = False
+        if state.fingerprint is None:
+            # Nothing to compare with, start from the age of the metadata
+            state.lastChange = now
+            if timestamp is not None and timestamp <= now:
+                state.lastChange = timestamp
+        else:
+            self.polls += 1
+            if fingerprint != state.fingerprint:
+                changed = True
+                self.changes += 1
+                self._recordChange(state, now, timestamp)
+
+        state.polls += 1
+        state.fingerprint = fingerprint
+        if changed:
+            state.history.append((now, repomdXml.revision, timestamp))
+            del state.history[:-self.HISTORY_SIZE]
+
+        state.lastPoll = now
+        state.interval = self._getInterval(state, now)
+        state.nextPoll = now + state.interval
+        if state.stale:
+            # Not a change of the repository, it does not count in the
+            # statistics
+            state.stale = False
+            return True
+        return changed
+
+    def _recordChange(self, state, now, timestamp):
+        # The metadata timestamp is when the change happened, as long as it
+        # is newer than the last change. Otherwise only the poll time is
+        # known.
+        changeTime = now
+        if timestamp is not None and state.lastChange < timestamp <= now:
+            changeTime = timestamp
+
+        gap = changeTime - state.lastChange
+        if state.changeInterval is None:
+            state.changeInterval = gap
+        else:
+            state.changeInterval = (self.SMOOTHING * gap +
+                (1 - self.SMOOTHING) * state.changeInterval)
+        state.lastChange = changeTime
+        state.changes += 1
+
+    def _getInterval(self, state, now):
+        expected = max(now - state.lastChange, state.changeInterval or 0)
+        return max(self._minInterval, min(self._maxInterval,
+            expected * self.POLL_FRACTION))
@@ -0,0 +1,512 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Local HTTP service answering metadata queries from indexed repositories
+kept in memory.
+
+Every repository is loaded into a RepoIndex once. A background thread polls
+repomd.xml through a RefreshScheduler and builds a new index when it
+changes, then swaps it in; queries see either the old or the new index,
+never a mix. Answers are JSON:
+
+  GET /repos
+  GET /packages?name=curl[&epoch=&version=&release=&arch=]
+  GET /whatprovides?capability=libcurl.so.4
+  GET /fileowner?path=/usr/bin/curl
+  GET /advisories?id=|cve=|reference=|package=[&arch=]
+
+Every query except /repos takes an optional repo parameter to only search
+one repository. Results carry the name of the repository they came from.
+
+Example:
+> service = MetadataService(('127.0.0.1', 8080))
+> service.addRepository('sles11', repomd.Client(url))
+> service.start()
+
+or from the command line:
+
+  python -m repodata.repomd.service --port 8080 sles11=http://...
+"""
+
+__all__ = ('RepoIndex', 'MetadataService', 'packageToDict',
+    'updateToDict', )
+
+import sys
+import time
+import json
+import urlparse
+import logging
+import optparse
+import threading
+import SocketServer
+import BaseHTTPServer
+
+from conary.lib.http import http_error
+
+from repodata import repomd
+from errors import RepoMdError, XmlErrors
+from scheduler import RefreshScheduler
+
+log = logging.getLogger(__name__)
+
+
+def packageToDict(pkg):
+    """
+    @return JSON compatible summary of a package
+    """
+
+    return dict(name=pkg.name, epoch=pkg.epoch, version=pkg.version,
+        release=pkg.release, arch=pkg.arch, checksum=pkg.checksum,
+        checksumType=pkg.checksumType, location=pkg.location,
+        summary=pkg.summary, sourcerpm=pkg.sourcerpm, size=pkg.packageSize)
+
+def updateToDict(update):
+    """
+    @return JSON compatible summary of an updateinfo entry
+    """
+
+    return dict(id=update.id, type=update.type, status=update.status,
+        title=update.title, issued=update.issued,
+        references=[ dict(type=x.type, id=x.id, href=x.href)
+                     for x in update.references or () ],
+        packages=[ dict(name=x.name, epoch=x.epoch, version=x.version,
+                        release=x.release, arch=x.arch, filename=x.filename)
+                   for x in update.pkglist or () ])
+
+
+def _append(table, key, pkg):
+    pkgs = table.get(key)
+    if pkgs is None:
+        table[key] = [ pkg ]
+    elif pkgs[-1] is not pkg:
+        pkgs.append(pkg)
+
+
+class RepoIndex(object):
+    """
+    Lookup tables over one revision of a repository. An index does not
+    change once it is built and is safe to query from several threads.
+    """
+
+    def __init__(self, name, client):
+        """
+        @param name: name of the repository
+        @param client: client to read the repository with
+        @type client: repomd.Client
+        """
+
+        self.name = name
+        self.loaded = time.time()
+
+        repomdXml = client.repomdXml
+        self.revision = repomdXml.revision
+        self.timestamp = repomdXml.getTimestamp()
+
+        self._byName = {}
+        self._provides = {}
+        self._files = {}
+        byPkgid = {}
+        self.packageCount = 0
+        for pkg in client.getPackageDetail():
+            self.packageCount += 1
+            _append(self._byName, pkg.name, pkg)
+            for dep in pkg.getDependencies('provides'):
+                _append(self._provides, dep.name, pkg)
+            for fileObj in pkg.files or ():
+                _append(self._files, fileObj.name, pkg)
+            if pkg.pkgid is not None:
+                byPkgid[pkg.pkgid] = pkg
+
+        # primary.xml only lists some of the files of each package
+        if repomdXml.getRepoData('filelists') is not None:
+            for fileList in client.getFileLists():
+                pkg = byPkgid.get(fileList.pkgid)
+                if pkg is None:
+                    continue
+                for fileObj in fileList.files or ():
+                    _append(self._files, fileObj.name, pkg)
+
+        self.updates = client.getUpdateIndex()
+
+    def findPackages(self, name, epoch=None, version=None, release=None,
+            arch=None):
+        """
+        Find packages by name and optionally epoch, version, release and
+        arch.
+        @return list of packages
+        """
+
+        return [ x for x in self._byName.get(name, ())
+                 if (epoch is None or (x.epoch or '0') == epoch) and
+                    (version is None or x.version == version) and
+                    (release is None or x.release == release) and
+                    (arch is None or x.arch == arch) ]
+
+    def getFileOwners(self, path):
+        """
+        @return list of packages containing a file
+        """
+
+        return list(self._files.get(path, ()))
+
+    def whatProvides(self, capability):
+        """
+        Find the packages providing a capability. Capabilities starting
+        with a slash are looked up as files as well.
+        @return list of packages
+        """
+
+        pkgs = list(self._provides.get(capability, ()))
+        if capability.startswith('/'):
+            seen = set(id(x) for x in pkgs)
+            pkgs.extend(x for x in self._files.get(capability, ())
+                        if id(x) not in seen)
+        return pkgs
+
+    def findAdvisories(self, advisoryId=None, cve=None, reference=None,
+            package=None, arch=None):
+        """
+        Find updates by advisory id, CVE, other reference or package name.
+        @return list of updates
+        """
+
+        if advisoryId is not None:
+            update = self.updates.getAdvisory(advisoryId)
+            return update is not None and [ update ] or []
+        if cve is not None:
+            return self.updates.findByCve(cve)
+        if reference is not None:
+            return self.updates.findByReference(reference)
+        if package is not None:
+            return self.updates.findByPackage(package, arch)
+        return []
+
+
+class QueryError(Exception):
+    """
+    Raised for queries that can not be answered, carries the HTTP status.
+    """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = urlparse.urlparse(self.path)[2:5]
+        params = dict((key, values[-1]) for key, values in
+                      urlparse.parse_qs(query).iteritems())
+        try:
+            status, result = 200, self.server.service.query(path, params)
+        except QueryError, e:
+            status, result = e.status, dict(error=str(e))
+
+        body = json.dumps(result)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        log.debug(fmt, *args)
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MetadataService(object):
+    """
+    HTTP service over the indexes of a set of repositories.
+    """
+
+    RepoIndexFactory = RepoIndex
+
+    # Errors that keep the old index of a repository in service
+    LoadErrors = (http_error.TransportError, RepoMdError,
+        IOError) + XmlErrors
+
+    # Longest time the refresh thread sleeps between checking for due
+    # repositories
+    CHECK_INTERVAL = 30
+
+    def __init__(self, address=('127.0.0.1', 0), budget=600, period=3600,
+            minInterval=60, maxInterval=3600):
+        """
+        @param address: (host, port) to listen on, port 0 picks a free one
+        @param budget: number of repomd.xml polls allowed per period, see
+        repomd.scheduler.RefreshScheduler
+        @param period: seconds the budget applies to
+        @param minInterval: shortest time between polls of a repository
+        @param maxInterval: longest time between polls of a repository
+        """
+
+        # Name -> RepoIndex. The dictionary is replaced, never changed, so
+        # a query keeps a consistent view of all repositories.
+        self._indexes = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._scheduler = RefreshScheduler(budget, period,
+            minInterval=minInterval, maxInterval=maxInterval)
+
+        self._server = _Server(address, _Handler)
+        self._server.service = self
+        self._threads = []
+        self._stopped = threading.Event()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._server.server_address[:2]
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    def _setIndex(self, name, index):
+        self._lock.acquire()
+        try:
+            indexes = dict(self._indexes)
+            if index is None:
+                indexes.pop(name, None)
+            else:
+                indexes[name] = index
+            self._indexes = indexes
+        finally:
+            self._lock.release()
+
+    def addRepository(self, name, client):
+        """
+        Load a repository and start serving it.
+        @type client: repomd.Client
+        @return RepoIndex
+        """
+
+        index = self.RepoIndexFactory(name, client)
+        self._lock.acquire()
+        try:
+            self._clients[name] = client
+            self._scheduler.addClient(name, client)
+        finally:
+            self._lock.release()
+        self._setIndex(name, index)
+        return index
+
+    def removeRepository(self, name):
+        self._lock.acquire()
+        try:
+            del self._clients[name]
+            self._scheduler.removeClient(name)
+        finally:
+            self._lock.release()
+        self._setIndex(name, None)
+
+    def getIndex(self, name):
+        """
+        @return current RepoIndex of a repository
+        """
+
+        return self._indexes[name]
+
+    def refresh(self):
+        """
+        Poll the repositories that are due and reload the ones that
+        changed. Called periodically by the refresh thread.
+        @return names of the reloaded repositories
+        """
+
+        self._lock.acquire()
+        try:
+            changed = self._scheduler.runOnce()
+            clients = [ (x, self._clients[x]) for x in changed ]
+        finally:
+            self._lock.release()
+
+        reloaded = []
+        for name, client in clients:
+            try:
+                index = self.RepoIndexFactory(name, client)
+            except self.LoadErrors, e:
+                log.error("Unable to reload %s: %s", name, e)
+                # The scheduler already took the new metadata as seen,
+                # have it report the change again on the next poll
+                self._lock.acquire()
+                try:
+                    if name in self._clients:
+                        self._scheduler.markStale(name)
+                finally:
+                    self._lock.release()
+                continue
+            # The repository may have been removed meanwhile
+            if name in self._clients:
+                self._setIndex(name, index)
+                reloaded.append(name)
+        return reloaded
+
+    def _refreshLoop(self):
+        while not self._stopped.isSet():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving and refreshing the other repositories
+                log.exception("Refreshing repositories failed")
+            nextPoll = self._scheduler.getNextPollTime()
+            timeout = self.CHECK_INTERVAL
+            if nextPoll is not None:
+                timeout = max(0, min(timeout, nextPoll - time.time()))
+            self._stopped.wait(timeout)
+
+    def start(self):
+        """
+        Start serving requests and refreshing repositories in background
+        threads.
+        """
+
+        for target, kwargs in ((self._server.serve_forever,
+                                dict(poll_interval=0.5)),
+                               (self._refreshLoop, {})):
+            thread = threading.Thread(target=target, kwargs=kwargs)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        Stop the background threads, if they were started, and close the
+        listening socket.
+        """
+
+        self._stopped.set()
+        if self._threads:
+            self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def query(self, path, params):
+        """
+        Answer a query.
+        @param path: endpoint, for example /packages
+        @param params: dictionary of query parameters
+        @return JSON compatible result
+        @raise QueryError: for unknown endpoints, repositories or missing
+        parameters
+        """
+
+        indexes = self._indexes
+        if path.rstrip('/') == '/repos':
+            return [ dict(name=x.name, revision=x.revision,
+                          timestamp=x.timestamp, loaded=x.loaded,
+                          packages=x.packageCount)
+                     for _, x in sorted(indexes.iteritems()) ]
+
+        handler = self._queries.get(path.rstrip('/'))
+        if handler is None:
+            raise QueryError(404, 'unknown query %s' % path)
+
+        repo = params.pop('repo', None)
+        if repo is not None:
+            if repo not in indexes:
+                raise QueryError(404, 'unknown repository %s' % repo)
+            indexes = { repo: indexes[repo] }
+
+        results = []
+        for name, index in sorted(indexes.iteritems()):
+            for result in handler(self, index, params):
+                result['repo'] = name
+                results.append(result)
+        return results
+
+    @classmethod
+    def _getParam(cls, params, name):
+        value = params.get(name)
+        if not value:
+            raise QueryError(400, 'missing parameter %s' % name)
+        return value
+
+    def _queryPackages(self, index, params):
+        pkgs = index.findPackages(self._getParam(params, 'name'),
+            epoch=params.get('epoch'), version=params.get('version'),
+            release=params.get('release'), arch=params.get('arch'))
+        return [ packageToDict(x) for x in pkgs ]
+
+    def _queryProvides(self, index, params):
+        return [ packageToDict(x) for x in
+                 index.whatProvides(self._getParam(params, 'capability')) ]
+
+    def _queryFileOwner(self, index, params):
+        return [ packageToDict(x) for x in
+                 index.getFileOwners(self._getParam(params, 'path')) ]
+
+    def _queryAdvisories(self, index, params):
+        keys = ('id', 'cve', 'reference', 'package')
+        if not [ x for x in keys if params.get(x) ]:
+            raise QueryError(400, 'missing parameter, one of %s' %
+                ', '.join(keys))
+        updates = index.findAdvisories(advisoryId=params.get('id'),
+            cve=params.get('cve'), reference=params.get('reference'),
+            package=params.get('package'), arch=params.get('arch'))
+        return [ updateToDict(x) for x in updates ]
+
+    _queries = {
+        '/packages': _queryPackages,
+        '/whatprovides': _queryProvides,
+        '/fileowner': _queryFileOwner,
+        '/advisories': _queryAdvisories,
+    }
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] name=url [name=url ...]')
+    parser.add_option('--address', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--budget', type='int', default=600,
+                      help='repomd.xml polls per hour')
+    parser.add_option('--cache-dir', dest='cacheDir',
+                      help='metadata cache shared with other processes')
+    options, repos = parser.parse_args(args)
+    if not repos:
+        parser.error('no repositories given')
+
+    logging.basicConfig(level=logging.INFO)
+    service = MetadataService((options.address, options.port),
+        budget=options.budget)
+    for repo in repos:
+        name, _, url = repo.partition('=')
+        if not url:
+            parser.error('repositories are given as name=url')
+        log.info("Loading %s from %s", name, url)
+        service.addRepository(name, repomd.Client(url,
+            cacheDir=options.cacheDir))
+
+    service.start()
+    log.info("Serving on %s", service.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
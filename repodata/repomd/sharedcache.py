@@ -0,0 +1,261 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Metadata cache shared by all processes on a host.
+
+Files are stored under a name derived from their url and checksum, so an
+entry never changes once it is written and a new revision of the metadata
+gets a new entry. Filling an entry holds an exclusive flock on its lock
+file: the first process to get there downloads the file, the others block
+on the lock and then read the finished file. Within a process, threads
+asking for the same entry wait for the one thread that is filling it, so
+the lock file is only contended between processes.
+
+Example:
+> client = repomd.Client(url, cacheDir='/var/cache/repodata')
+"""
+
+__all__ = ('SharedCache', )
+
+import os
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+
+import checksum as checksumlib
+
+
+class SharedCache(object):
+    """
+    Directory of downloaded metadata files, keyed by url and checksum.
+    @ivar hits: number of fetches answered from the cache by this instance
+    @ivar fills: number of files downloaded by this instance
+    """
+
+    TMP_PREFIX = '.tmp-'
+    # Seconds after which prune() considers a partial download abandoned.
+    # Its mtime changes while data arrives, so only stalled ones get here.
+    STALE_TMP_AGE = 24 * 3600
+
+    def __init__(self, cacheDir):
+        self._cacheDir = cacheDir
+        if not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(cacheDir):
+                    raise
+
+        self.hits = 0
+        self.fills = 0
+
+        # Entry name -> [ lock, number of threads using it ]
+        self._flights = {}
+        self._flightsLock = threading.Lock()
+
+    def getPath(self, url, checksum):
+        """
+        @return path of the cache entry for a url and checksum
+        """
+
+        key = hashlib.sha1('%s\0%s' % (url, checksum)).hexdigest()
+        name = os.path.basename(url.rstrip('/')) or 'index'
+        return os.path.join(self._cacheDir, '%s-%s' % (key, name))
+
+    def _acquireFlight(self, path):
+        self._flightsLock.acquire()
+        try:
+            flight = self._flights.get(path)
+            if flight is None:
+                flight = self._flights[path] = [ threading.Lock(), 0 ]
+            flight[1] += 1
+        finally:
+            self._flightsLock.release()
+        flight[0].acquire()
+
+    def _releaseFlight(self, path):
+        self._flightsLock.acquire()
+        try:
+            flight = self._flights[path]
+            flight[0].release()
+            flight[1] -= 1
+            if not flight[1]:
+                del self._flights[path]
+        finally:
+            self._flightsLock.release()
+
+    def _lookup(self, path):
+        if not os.path.exists(path):
+            return False
+        # Keep entries in use from being pruned
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._count('hits')
+        return True
+
+    def fetch(self, url, checksum, checksumType, download):
+        """
+        Get the cache entry of a file, downloading it if no process has
+        done so yet.
+        @param url: location of the file, only used as part of the key
+        @param checksum: checksum of the file from the metadata
+        @param checksumType: type of checksum, for example sha256
+        @param download: function writing the contents of the file to the
+        file object passed to it
+        @return path of the cached file
+        @raise ChecksumMismatchError: if the downloaded file does not have
+        the expected checksum, nothing is cached in that case
+        """
+
+        path = self.getPath(url, checksum)
+        if self._lookup(path):
+            return path
+
+        self._acquireFlight(path)
+        try:
+            if self._lookup(path):
+                return path
+
+            lockFile = self._lock(path + '.lock')
+            try:
+                if self._lookup(path):
+                    return path
+                self._fill(path, checksum, checksumType, download)
+                return path
+            finally:
+                # Closing the file drops the lock
+                lockFile.close()
+        finally:
+            self._releaseFlight(path)
+
+    @classmethod
+    def _lock(cls, lockPath):
+        """
+        Open and exclusively lock a lock file. prune() may remove a lock
+        file between opening and locking it, that lock would not exclude
+        anybody, so the new file is locked instead.
+        @return the open lock file
+        """
+
+        while True:
+            lockFile = open(lockPath, 'a')
+            try:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX)
+                try:
+                    current = os.stat(lockPath).st_ino
+                except OSError:
+                    current = None
+                if current == os.fstat(lockFile.fileno()).st_ino:
+                    return lockFile
+            except:
+                lockFile.close()
+                raise
+            lockFile.close()
+
+    def _fill(self, path, checksum, checksumType, download):
+        fd, tmpPath = tempfile.mkstemp(dir=self._cacheDir,
+            prefix=self.TMP_PREFIX)
+        try:
+            fobj = os.fdopen(fd, 'wb')
+            try:
+                download(fobj)
+            finally:
+                fobj.close()
+            actual = checksumlib.fileChecksum(tmpPath, checksumType)
+            if actual != checksum:
+                raise checksumlib.ChecksumMismatchError(path, checksum,
+                    actual)
+            os.chmod(tmpPath, 0644)
+            os.rename(tmpPath, path)
+        except:
+            os.unlink(tmpPath)
+            raise
+        self._count('fills')
+
+    def _count(self, counter):
+        self._flightsLock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._flightsLock.release()
+
+    def prune(self, maxAge):
+        """
+        Remove entries that have not been used for maxAge seconds, and the
+        lock files of entries that are gone unless another process holds
+        them. Partial downloads are only removed once they stalled for
+        STALE_TMP_AGE seconds.
+        @return number of entries removed
+        """
+
+        now = time.time()
+        cutoff = now - maxAge
+        tmpCutoff = now - max(maxAge, self.STALE_TMP_AGE)
+        removed = 0
+        names = os.listdir(self._cacheDir)
+        for name in names:
+            if name.endswith('.lock'):
+                continue
+            path = os.path.join(self._cacheDir, name)
+            if name.startswith(self.TMP_PREFIX):
+                limit = tmpCutoff
+            else:
+                limit = cutoff
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                pass
+
+        for name in names:
+            if not name.endswith('.lock'):
+                continue
+            path = os.path.join(self._cacheDir, name)
+            if not os.path.exists(path[:-len('.lock')]):
+                self._removeLock(path)
+        return removed
+
+    @classmethod
+    def _removeLock(cls, lockPath):
+        """
+        Remove a lock file nobody holds. Fillers that opened it before it
+        is gone notice in _lock() and lock a new one.
+        """
+
+        try:
+            lockFile = open(lockPath, 'r')
+        except IOError:
+            return
+        try:
+            try:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # Held by a process filling the entry
+                return
+            try:
+                os.unlink(lockPath)
+            except OSError:
+                pass
+        finally:
+            lockFile.close()
@@ -0,0 +1,371 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Cache of parsed repository metadata, stored in a compact binary form and
+keyed by the checksum repomd.xml lists for the source file.
+"""
+
+__all__ = ('SnapshotCache', )
+
+import os
+import marshal
+import tempfile
+
+from packagexml import _File, _Dependency, _entryFactories
+from updateinfoxml import _Update, _Reference, _UpdateInfoPackage
+from patchxml import _Patch, getPatchPackageClass
+
+# Attributes of _Package that are stored as-is in a snapshot record.
+PACKAGE_FIELDS = ('name', 'arch', 'epoch', 'version', 'release',
+                  'checksum', 'checksumType', 'summary', 'description',
+                  'fileTimestamp', 'buildTimestamp', 'packageSize',
+                  'installedSize', 'archiveSize', 'location', 'license',
+                  'vendor', 'group', 'buildhost', 'sourcerpm', 'headerStart',
+                  'headerEnd', 'licenseToConfirm', 'pkgid')
+
+# Attributes that are not part of _Package.__slots__.
+PACKAGE_EXTRA_FIELDS = ('packager', 'url')
+
+DEPENDENCY_FIELDS = _Dependency.__slots__
+
+UPDATE_FIELDS = ('status', 'emailfrom', 'type', 'id', 'title', 'release',
+                 'issued', 'description', 'summary')
+
+REFERENCE_FIELDS = ('href', 'id', 'title', 'type')
+
+UPDATE_PACKAGE_FIELDS = ('name', 'arch', 'epoch', 'version', 'release',
+                         'filename', 'location', 'reboot_suggested',
+                         'restart_suggested', 'relogin_suggested')
+
+PATCH_FIELDS = ('name', 'summary', 'description', 'version', 'release',
+                'rebootNeeded', 'licenseToConfirm', 'packageManager',
+                'category')
+
+PATCH_DEPENDENCY_FIELDS = ('requires', 'recommends', 'provides',
+                           'supplements', 'conflicts', 'obsoletes')
+
+
+def _getText(value):
+    """
+    Elements that are not bound to a string type finalize to nodes, store
+    their text instead.
+    """
+
+    if hasattr(value, 'getText'):
+        return value.getText()
+    return value
+
+def _dependencyListToRecord(entries):
+    return tuple((dep.getName(), ) +
+                 tuple(getattr(dep, x) for x in DEPENDENCY_FIELDS)
+                 for dep in entries)
+
+def _dependencyGroupsToRecord(groups):
+    # Groups are kept in document order, repeated relations included.
+    if groups is None:
+        return None
+    return tuple((group.getName(),
+                  _dependencyListToRecord(group.iterChildren()))
+                 for group in groups)
+
+def _recordToDependencyList(entries):
+    return [ _entryFactories[x[0]](*x[1:]) for x in entries ]
+
+def packageToRecord(pkg):
+    """
+    Convert a parsed package into a tuple of builtin types.
+    """
+
+    fields = tuple(getattr(pkg, x) for x in PACKAGE_FIELDS)
+    extra = tuple(_getText(getattr(pkg, x, None))
+                  for x in PACKAGE_EXTRA_FIELDS)
+
+    files = None
+    if pkg.files is not None:
+        files = tuple((x.name, x.type) for x in pkg.files)
+
+    return (fields, extra, files, _dependencyGroupsToRecord(pkg.format))
+
+def recordToPackage(record, factory):
+    """
+    Rebuild a package instance from a snapshot record.
+    """
+
+    fields, extra, files, deps = record
+
+    pkg = factory()
+    for attr, value in zip(PACKAGE_FIELDS, fields):
+        setattr(pkg, attr, value)
+    for attr, value in zip(PACKAGE_EXTRA_FIELDS, extra):
+        if value is not None:
+            setattr(pkg, attr, value)
+
+    if files is not None:
+        pkg.files = [ _File(name, type=type) for name, type in files ]
+
+    if deps is not None:
+        pkg.setDependencyGroups([
+            (name, _recordToDependencyList(entries))
+            for name, entries in deps ])
+
+    return pkg
+
+
+def updateToRecord(update):
+    """
+    Convert a parsed updateinfo entry into a tuple of builtin types.
+    """
+
+    fields = tuple(getattr(update, x) for x in UPDATE_FIELDS)
+
+    references = None
+    if update.references is not None:
+        references = tuple(tuple(getattr(ref, x) for x in REFERENCE_FIELDS)
+                           for ref in update.references)
+
+    pkglist = None
+    if update.pkglist is not None:
+        pkglist = tuple(tuple(getattr(pkg, x) for x in UPDATE_PACKAGE_FIELDS)
+                        for pkg in update.pkglist)
+
+    return (fields, references, pkglist)
+
+def _fromValues(factory, names, values):
+    node = factory()
+    for attr, value in zip(names, values):
+        setattr(node, attr, value)
+    return node
+
+def recordToUpdate(record):
+    """
+    Rebuild an updateinfo entry from a snapshot record.
+    """
+
+    fields, references, pkglist = record
+
+    update = _fromValues(_Update, UPDATE_FIELDS, fields)
+    if references is not None:
+        update.references = [ _fromValues(_Reference, REFERENCE_FIELDS, x)
+                              for x in references ]
+    if pkglist is not None:
+        update.pkglist = [ _fromValues(_UpdateInfoPackage,
+                                       UPDATE_PACKAGE_FIELDS, x)
+                           for x in pkglist ]
+    return update
+
+
+def patchToRecord(patch):
+    """
+    Convert a parsed patch into a tuple of builtin types.
+    """
+
+    fields = tuple(_getText(getattr(patch, x)) for x in PATCH_FIELDS)
+
+    deps = tuple(None if getattr(patch, x) is None
+                 else _dependencyListToRecord(getattr(patch, x))
+                 for x in PATCH_DEPENDENCY_FIELDS)
+
+    packages = None
+    if patch.packages is not None:
+        packages = tuple((packageToRecord(x), x.type)
+                         for x in patch.packages)
+
+    return (fields, deps, packages)
+
+def recordToPatch(record, factory):
+    """
+    Rebuild a patch from a snapshot record.
+    @param factory: package class the patch parser was set up with
+    """
+
+    fields, deps, packages = record
+
+    patch = _fromValues(_Patch, PATCH_FIELDS, fields)
+    for attr, entries in zip(PATCH_DEPENDENCY_FIELDS, deps):
+        if entries is not None:
+            setattr(patch, attr, _recordToDependencyList(entries))
+
+    if packages is not None:
+        packageClass = getPatchPackageClass(factory)
+        patch.packages = []
+        for pkgRecord, pkgType in packages:
+            pkg = recordToPackage(pkgRecord, packageClass)
+            pkg.type = pkgType
+            patch.packages.append(pkg)
+
+    return patch
+
+
+class SnapshotCache(object):
+    """
+    Directory of parse results. Each snapshot is a marshaled list of records
+    named after the kind of data and the checksum of the source file, so a
+    changed repository never matches a stale snapshot. Only the most recently
+    used snapshots are kept.
+    """
+
+    MAX_SNAPSHOTS = 16
+    FORMAT_VERSION = 3
+
+    def __init__(self, cacheDir, maxSnapshots=None):
+        self._cacheDir = cacheDir
+        if maxSnapshots is None:
+            maxSnapshots = self.MAX_SNAPSHOTS
+        self._maxSnapshots = maxSnapshots
+
+        if not os.path.isdir(self._cacheDir):
+            os.makedirs(self._cacheDir)
+
+    def _getPath(self, kind, checksum):
+        return os.path.join(self._cacheDir, '%s-%s.snap' % (kind, checksum))
+
+    def has(self, kind, checksum):
+        """
+        @return True if a snapshot is stored for kind and checksum
+        """
+
+        return os.path.exists(self._getPath(kind, checksum))
+
+    def load(self, kind, checksum):
+        """
+        Load the records stored for kind and checksum.
+        @return list of records or None if there is no usable snapshot
+        """
+
+        path = self._getPath(kind, checksum)
+        try:
+            fobj = open(path, 'rb')
+        except IOError:
+            return None
+
+        try:
+            try:
+                version, records = marshal.load(fobj)
+            except (EOFError, ValueError, TypeError):
+                version, records = None, None
+        finally:
+            fobj.close()
+
+        if version != self.FORMAT_VERSION:
+            self._remove(path)
+            return None
+
+        # Mark the snapshot as recently used for eviction
+        os.utime(path, None)
+        return records
+
+    def store(self, kind, checksum, records):
+        """
+        Atomically write a snapshot and evict old ones.
+        """
+
+        fd, tmpPath = tempfile.mkstemp(dir=self._cacheDir, prefix='.snap')
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump((self.FORMAT_VERSION, records), fobj, 2)
+        finally:
+            fobj.close()
+        os.rename(tmpPath, self._getPath(kind, checksum))
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used snapshots above the size limit.
+        """
+
+        snapshots = []
+        for fileName in os.listdir(self._cacheDir):
+            if not fileName.endswith('.snap') or fileName.startswith('.'):
+                continue
+            path = os.path.join(self._cacheDir, fileName)
+            try:
+                snapshots.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+
+        snapshots.sort(reverse=True)
+        for _, path in snapshots[self._maxSnapshots:]:
+            self._remove(path)
+
+    @classmethod
+    def _remove(cls, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def iterNodes(self, node, toRecord, fromRecord, repository=None):
+        """
+        Iterate over the parsed contents of a data node, loading them from
+        a snapshot when one matches the node checksum. Otherwise the file is
+        parsed and a snapshot is written once iteration completes.
+        @param node: data element from repomd.xml
+        @param toRecord: function converting a parsed node into a record
+        @param fromRecord: function converting a record back into a node
+        @param repository: repository to read the file from instead of the
+        one the node was parsed from
+        @return iterator of nodes
+        """
+
+        records = self.load(node.type, node.checksum)
+        if records is not None:
+            return (fromRecord(x) for x in records)
+        return self._parseAndStore(node, toRecord, repository)
+
+    def _parseAndStore(self, node, toRecord, repository):
+        records = []
+        for sn in node.iterSubnodes(repository):
+            records.append(toRecord(sn))
+            yield sn
+        self.store(node.type, node.checksum, records)
+
+    def iterPackages(self, node, factory, repository=None):
+        """
+        Iterate over the packages of a primary data node.
+        @param factory: package class to instantiate from snapshot records
+        """
+
+        return self.iterNodes(node, packageToRecord,
+            lambda x: recordToPackage(x, factory), repository)
+
+    def iterUpdates(self, node, repository=None):
+        """
+        Iterate over the entries of an updateinfo data node.
+        """
+
+        return self.iterNodes(node, updateToRecord, recordToUpdate,
+            repository)
+
+    def getUpdateIndex(self, node, factory, repository=None):
+        """
+        Get the index over the entries of an updateinfo data node. The
+        lookup tables are stored next to the updates, so a matching
+        snapshot is loaded without rebuilding the index.
+        @param factory: index class, for example updateindex.UpdateInfoIndex
+        """
+
+        tables = self.load('updateindex', node.checksum)
+        if tables is not None:
+            updates = [ x for x in self.iterUpdates(node, repository) ]
+            if len(updates) == len(tables[0]):
+                return factory.fromTables(updates, tables)
+
+        index = factory(self.iterUpdates(node, repository))
+        self.store('updateindex', node.checksum, index.getTables())
+        return index
@@ -0,0 +1,267 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Storage backends used by Repository to access repository files.
+
+Besides urls and local directories, repositories can be read from memory
+and from tar archives, without writing the files to disk first:
+
+> files = { 'repodata/repomd.xml': blob, 'repodata/primary.xml.gz': blob2 }
+> client = repomd.Client('memory:', storage=BufferStorage(files))
+> client = repomd.Client('snapshot', storage=TarStorage('2009-02-01.tar'))
+"""
+
+__all__ = ('Storage', 'URLStorage', 'LocalStorage', 'BufferStorage',
+    'TarStorage', 'isLocalUrl', 'getLocalPath', )
+
+import os
+import urllib
+import tarfile
+import urlparse
+import threading
+import cStringIO
+
+from conary.lib.http import http_error
+
+
+def isLocalUrl(repoUrl):
+    """
+    Check if a repository url refers to the local filesystem, either through
+    a file:// url or as a plain path without a scheme. Whether the path
+    exists does not matter, LocalStorage reports missing directories.
+    """
+
+    return urlparse.urlparse(repoUrl)[0] in ('', 'file')
+
+def getLocalPath(repoUrl):
+    """
+    Convert a file:// url or a plain directory path to a directory path.
+    """
+
+    scheme, _, path = urlparse.urlparse(repoUrl)[:3]
+    if scheme == 'file':
+        return urllib.url2pathname(path)
+    return repoUrl
+
+
+class Storage(object):
+    """
+    Base class for accessing files of a repository.
+    """
+
+    # Set by backends whose open() returns regular, seekable files that can
+    # be handed to the decompressor and parser without spooling.
+    IsSeekable = False
+
+    def open(self, path):
+        """
+        Open a file from the repository.
+        @param path: relative path to file
+        @type path: string
+        @return file-like object
+        """
+
+        raise NotImplementedError
+
+    def getRealUrl(self, path):
+        """
+        @param path: relative path to repository file
+        @type path: string
+        @return full location of the file
+        """
+
+        raise NotImplementedError
+
+    def withDeadline(self, deadline):
+        """
+        Get a storage that gives up on requests once deadline passed,
+        sharing everything else with this one. Backends that do not send
+        requests return themselves.
+        @type deadline: repodata.retry.Deadline
+        """
+
+        return self
+
+
+class URLStorage(Storage):
+    """
+    Access repository files over any url supported by URLOpener.
+    """
+
+    def __init__(self, repoUrl, opener):
+        self._repoUrl = repoUrl.rstrip('/')
+        self._opener = opener
+
+    def open(self, path):
+        return self._opener.open(self.getRealUrl(path))
+
+    def withDeadline(self, deadline):
+        return self.__class__(self._repoUrl,
+            self._opener.withDeadline(deadline))
+
+    def getRealUrl(self, path):
+        return "%s/%s" % (self._repoUrl, path.lstrip('/'))
+
+
+class LocalStorage(Storage):
+    """
+    Access repository files on the local filesystem in place.
+    """
+
+    IsSeekable = True
+
+    def __init__(self, repoUrl):
+        self._root = getLocalPath(repoUrl).rstrip(os.sep) or os.sep
+        if not os.path.isdir(self._root):
+            raise http_error.TransportError(
+                "Repository directory %s does not exist" % self._root)
+
+    def open(self, path):
+        realPath = self.getRealUrl(path)
+        try:
+            return open(realPath, 'rb')
+        except IOError, e:
+            raise http_error.TransportError("Unable to open %s: %s" %
+                (realPath, e))
+
+    def getRealUrl(self, path):
+        return os.path.join(self._root, path.lstrip('/'))
+
+
+class BufferStorage(Storage):
+    """
+    Access repository files held in memory. The contents are not copied,
+    files are read straight from the objects passed in.
+    """
+
+    IsSeekable = True
+
+    def __init__(self, files):
+        """
+        @param files: dictionary of relative path to file contents, as
+        strings, buffers or memoryviews
+        """
+
+        self._files = dict((path.lstrip('/'), data)
+                           for path, data in files.iteritems())
+
+    def open(self, path):
+        data = self._files.get(path.lstrip('/'))
+        if data is None:
+            raise http_error.TransportError("Unable to open %s: no such "
+                "file in memory" % path)
+        return cStringIO.StringIO(data)
+
+    def getRealUrl(self, path):
+        return path.lstrip('/')
+
+
+class _MemberFile(object):
+    """
+    Read only file over a member of a tar archive. All members share the
+    file object of the archive, reads are serialized with a lock so members
+    can be read from several threads.
+    """
+
+    def __init__(self, fobj, lock, offset, size):
+        self._fobj = fobj
+        self._lock = lock
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def read(self, size=-1):
+        remaining = self._size - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        self._lock.acquire()
+        try:
+            self._fobj.seek(self._offset + self._pos)
+            data = self._fobj.read(size)
+        finally:
+            self._lock.release()
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._size
+        self._pos = max(0, min(offset, self._size))
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        pass
+
+
+class TarStorage(Storage):
+    """
+    Access repository files stored in a tar archive, without extracting
+    them. Compressed archives work as well, but seeking backwards in them
+    decompresses the archive again from the start.
+    """
+
+    IsSeekable = True
+
+    def __init__(self, archive, root=None):
+        """
+        @param archive: path or file object of the archive
+        @param root: directory of the repository inside the archive, by
+        default the directory containing repodata/repomd.xml
+        """
+
+        if isinstance(archive, basestring):
+            self._name = archive
+            self._tar = tarfile.open(archive, 'r')
+        else:
+            self._name = getattr(archive, 'name', 'archive')
+            self._tar = tarfile.open(fileobj=archive, mode='r')
+        self._lock = threading.Lock()
+
+        self._members = {}
+        for member in self._tar.getmembers():
+            if member.isfile():
+                self._members[os.path.normpath(member.name)] = member
+
+        if root is None:
+            root = ''
+            for name in self._members:
+                if (name == 'repodata/repomd.xml' or
+                        name.endswith('/repodata/repomd.xml')):
+                    root = name[:-len('repodata/repomd.xml')]
+                    break
+        self._root = root.strip('/')
+
+    def _getMemberName(self, path):
+        return os.path.normpath(os.path.join(self._root, path.lstrip('/')))
+
+    def open(self, path):
+        member = self._members.get(self._getMemberName(path))
+        if member is None:
+            raise http_error.TransportError("Unable to open %s: no such "
+                "member in %s" % (path, self._name))
+        return _MemberFile(self._tar.fileobj, self._lock,
+            member.offset_data, member.size)
+
+    def getRealUrl(self, path):
+        return '%s:%s' % (self._name, self._getMemberName(path))
@@ -0,0 +1,198 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Index of updateinfo advisories by advisory id, reference and package.
+
+Example:
+> index = client.getUpdateIndex()
+> for update in index.findByCve('CVE-2009-0723'):
+>     print update.id, update.title
+"""
+
+__all__ = ('UpdateInfoIndex', 'parseIssued', )
+
+import time
+import calendar
+
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+
+def parseIssued(issued):
+    """
+    Convert the issued date of an update to seconds since the epoch. SuSE
+    repositories use timestamps, others use formatted dates.
+    @return integer or None if the date can not be parsed
+    """
+
+    if issued is None:
+        return None
+    issued = issued.strip()
+    if issued.isdigit():
+        return int(issued)
+    for fmt in _DATE_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(issued, fmt))
+        except ValueError:
+            pass
+    return None
+
+
+class UpdateInfoIndex(object):
+    """
+    Lookup tables over updateinfo entries, built in one pass.
+    """
+
+    def __init__(self, updates=()):
+        self._updates = []
+        self._issued = {}
+        self._byId = {}
+        self._byReference = {}
+        self._byPackage = {}
+
+        for update in updates:
+            self.add(update)
+
+    def __len__(self):
+        return len(self._updates)
+
+    @classmethod
+    def _append(cls, table, key, update):
+        updates = table.get(key)
+        if updates is None:
+            table[key] = [ update ]
+        elif updates[-1] is not update:
+            updates.append(update)
+
+    def add(self, update):
+        """
+        Add an updateinfo entry to the index.
+        @type update: repomd.updateinfoxml._Update
+        """
+
+        self._updates.append(update)
+        self._issued[id(update)] = parseIssued(update.issued)
+        self._byId[update.id] = update
+
+        for ref in update.references or ():
+            self._append(self._byReference, (ref.type, ref.id), update)
+            self._append(self._byReference, (None, ref.id), update)
+
+        for pkg in update.pkglist or ():
+            self._append(self._byPackage, (pkg.name, pkg.arch), update)
+            self._append(self._byPackage, (pkg.name, None), update)
+
+    def getTables(self):
+        """
+        Get the lookup tables with updates replaced by their position in
+        iterUpdates(), for storing the index next to the updates.
+        @return tuple of builtin types
+        """
+
+        positions = dict((id(x), i) for i, x in enumerate(self._updates))
+        def convert(table):
+            return tuple((key, tuple(positions[id(x)] for x in updates))
+                         for key, updates in sorted(table.iteritems()))
+        return (tuple(self._issued[id(x)] for x in self._updates),
+                convert(self._byReference), convert(self._byPackage))
+
+    @classmethod
+    def fromTables(cls, updates, tables):
+        """
+        Rebuild an index from getTables() without walking the updates.
+        @param updates: updates in the order of iterUpdates()
+        @param tables: result of getTables()
+        """
+
+        issued, byReference, byPackage = tables
+        index = cls()
+        index._updates = list(updates)
+        index._issued = dict((id(x), y) for x, y in zip(updates, issued))
+        index._byId = dict((x.id, x) for x in updates)
+        index._byReference = dict((key, [ updates[x] for x in positions ])
+                                  for key, positions in byReference)
+        index._byPackage = dict((key, [ updates[x] for x in positions ])
+                                for key, positions in byPackage)
+        return index
+
+    def _filter(self, updates, issuedAfter, issuedBefore):
+        """
+        Restrict updates to those issued in [issuedAfter, issuedBefore).
+        Updates without a usable issued date are dropped when filtering.
+        """
+
+        if issuedAfter is None and issuedBefore is None:
+            return list(updates)
+
+        ret = []
+        for update in updates:
+            issued = self._issued[id(update)]
+            if issued is None:
+                continue
+            if issuedAfter is not None and issued < issuedAfter:
+                continue
+            if issuedBefore is not None and issued >= issuedBefore:
+                continue
+            ret.append(update)
+        return ret
+
+    def getAdvisory(self, advisoryId):
+        """
+        @return update with the given id or None
+        """
+
+        return self._byId.get(advisoryId)
+
+    def iterUpdates(self, issuedAfter=None, issuedBefore=None):
+        """
+        Iterate over all updates, optionally restricted to an issue date
+        range given in seconds since the epoch.
+        """
+
+        return iter(self._filter(self._updates, issuedAfter, issuedBefore))
+
+    def findByReference(self, refId, refType=None, issuedAfter=None,
+            issuedBefore=None):
+        """
+        Find updates referring to a bug, CVE or other reference.
+        @param refId: reference id, for example 481480 or CVE-2009-0723
+        @param refType: optional reference type, for example bugzilla or cve
+        @return list of updates
+        """
+
+        return self._filter(self._byReference.get((refType, refId), ()),
+            issuedAfter, issuedBefore)
+
+    def findByCve(self, cve, issuedAfter=None, issuedBefore=None):
+        """
+        Find updates fixing a CVE.
+        @return list of updates
+        """
+
+        return self.findByReference(cve, 'cve', issuedAfter, issuedBefore)
+
+    def findByPackage(self, name, arch=None, issuedAfter=None,
+            issuedBefore=None):
+        """
+        Find updates containing a package.
+        @param name: package name
+        @param arch: optional package architecture
+        @return list of updates
+        """
+
+        return self._filter(self._byPackage.get((name, arch), ()),
+            issuedAfter, issuedBefore)
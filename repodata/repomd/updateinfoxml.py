@@ -110,6 +110,8 @@ class _References(SlotNode):
 
     __slots__ = ()
 
+    _attributeNames = frozenset(['href', 'id', 'title', 'type'])
+
     def addChild(self, child):
         if child.getName() != 'reference':
             raise UnknownElementError(child)
@@ -119,17 +121,11 @@ class _References(SlotNode):
         child.title = None
         child.type = None
 
+        attributeNames = self._attributeNames
         for attr, value in child.iterAttributes():
-            if attr == 'href':
-                child.href = value
-            elif attr == 'id':
-                child.id = value
-            elif attr == 'title':
-                child.title = value
-            elif attr == 'type':
-                child.type = value
-            else:
+            if attr not in attributeNames:
                 raise UnknownAttributeError(child, attr)
+            setattr(child, attr, value)
 
         SlotNode.addChild(self, child)
 
@@ -149,6 +145,9 @@ class _Collection(SlotNode):
 
     __slots__ = ()
 
+    _attributeNames = frozenset(['name', 'arch', 'epoch', 'version',
+        'release'])
+
     def addChild(self, child):
         """
         Update child attributes.
@@ -159,22 +158,17 @@ class _Collection(SlotNode):
 
         child.name = None
         child.arch = None
+        child.epoch = None
         child.version = None
         child.release = None
 
         child.location = ''
 
+        attributeNames = self._attributeNames
         for attr, value in child.iterAttributes():
-            if attr == 'name':
-                child.name = value
-            elif attr == 'arch':
-                child.arch = value
-            elif attr == 'version':
-                child.version = value
-            elif attr == 'release':
-                child.release = value
-            else:
+            if attr not in attributeNames:
                 raise UnknownAttributeError(child, attr)
+            setattr(child, attr, value)
 
         SlotNode.addChild(self, child)
 
@@ -193,22 +187,19 @@ class _UpdateInfoPackage(SlotNode):
     # W0201 - Attribute $foo defined outside __init__
     # pylint: disable-msg=W0201
 
+    # Children whose text is stored in the attribute of the same name
+    _textChildren = frozenset(['filename', 'reboot_suggested',
+        'restart_suggested', 'relogin_suggested'])
+
     def addChild(self, child):
         """
         Parse children of pkglist.collection
         """
 
         n = child.getName()
-        if n == 'filename':
-            self.filename = child.finalize()
-        elif n == 'reboot_suggested':
-            self.reboot_suggested = child.finalize()
-        elif n == 'restart_suggested':
-            self.restart_suggested = child.finalize()
-        elif n == 'relogin_suggested':
-            self.relogin_suggested = child.finalize()
-        else:
+        if n not in self._textChildren:
             raise UnknownElementError(child)
+        setattr(self, n, child.finalize())
 
 
 class UpdateInfoXml(XmlStreamedParser):
@@ -216,20 +207,20 @@ class UpdateInfoXml(XmlStreamedParser):
     Bind all types for parsing updateinfo.xml.
     """
 
-    def _registerTypes(self):
+    def _registerTypes(self, registry):
         """
         Setup parser.
         """
 
-        self._databinder.registerType(_Updates, name='updates')
-        self._databinder.registerType(_Update, name='update')
-        self._databinder.registerType(_References, name='references')
-        self._databinder.registerType(_Reference, name='reference')
-        self._databinder.registerType(_Collection, name='collection')
-        self._databinder.registerType(_UpdateInfoPackage, name='package')
-
-        self._databinder.registerType(xmllib.StringNode, name='id')
-        self._databinder.registerType(xmllib.StringNode, name='title')
-        self._databinder.registerType(xmllib.StringNode, name='release')
-        self._databinder.registerType(xmllib.StringNode, name='description')
-        self._databinder.registerType(xmllib.StringNode, name='filename')
+        registry.registerType(_Updates, name='updates')
+        registry.registerType(_Update, name='update')
+        registry.registerType(_References, name='references')
+        registry.registerType(_Reference, name='reference')
+        registry.registerType(_Collection, name='collection')
+        registry.registerType(_UpdateInfoPackage, name='package')
+
+        registry.registerType(xmllib.StringNode, name='id')
+        registry.registerType(xmllib.StringNode, name='title')
+        registry.registerType(xmllib.StringNode, name='release')
+        registry.registerType(xmllib.StringNode, name='description')
+        registry.registerType(xmllib.StringNode, name='filename')
@@ -0,0 +1,186 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Verify a local mirror against the package metadata of a repository.
+
+Every package file is checked for existence and size first, files of the
+right size are then hashed by a pool of processes. Files in the mirror that
+the metadata does not list are reported as extra.
+
+Example:
+> report = client.verifyMirror('/srv/mirror/sles')
+> for location, reason in report.corrupt:
+>     print 'corrupt: %s (%s)' % (location, reason)
+> for location in report.missing + report.extra:
+>     print location
+"""
+
+__all__ = ('MirrorVerifier', 'VerifyReport', )
+
+import os
+import multiprocessing
+
+import checksum
+
+# Results of checking a single file
+OK = 'ok'
+MISSING = 'missing'
+CORRUPT = 'corrupt'
+
+
+def checkFile(task):
+    """
+    Check one mirror file. Runs in the worker processes.
+    @param task: (location, path, size, checksum, checksum type)
+    @return (location, status, reason, bytes hashed)
+    """
+
+    location, path, size, expected, checksumType = task
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (location, MISSING, None, 0)
+
+    if size is not None and st.st_size != size:
+        return (location, CORRUPT, 'size %d, expected %d' %
+            (st.st_size, size), 0)
+
+    try:
+        actual = checksum.fileChecksum(path, checksumType)
+    except checksum.UnsupportedChecksumError, e:
+        return (location, CORRUPT, str(e), 0)
+    if actual is None:
+        return (location, MISSING, None, 0)
+    if actual != expected:
+        return (location, CORRUPT, '%s %s, expected %s' %
+            (checksumType, actual, expected), st.st_size)
+    return (location, OK, None, st.st_size)
+
+
+class VerifyReport(object):
+    """
+    Outcome of verifying a mirror.
+    @ivar verified: number of files with the right size and checksum
+    @ivar missing: locations listed in the metadata but not in the mirror
+    @ivar corrupt: list of (location, reason) for files with the wrong size
+    or checksum
+    @ivar extra: locations in the mirror that the metadata does not list
+    @ivar bytes: number of bytes hashed
+    """
+
+    __slots__ = ('verified', 'missing', 'corrupt', 'extra', 'bytes')
+
+    def __init__(self):
+        self.verified = 0
+        self.missing = []
+        self.corrupt = []
+        self.extra = []
+        self.bytes = 0
+
+    def isClean(self):
+        """
+        @return True if nothing is missing, corrupt or extra
+        """
+
+        return not (self.missing or self.corrupt or self.extra)
+
+
+class MirrorVerifier(object):
+    """
+    Verify package files with a pool of processes, so hashing is not bound
+    to a single core.
+    """
+
+    # Number of files handed to a worker process at a time
+    CHUNK_SIZE = 16
+
+    # Top level directories of a mirror that are not package files
+    IGNORE_DIRS = ('repodata', )
+
+    def __init__(self, processes=None, ignoreDirs=None):
+        """
+        @param processes: number of worker processes, defaults to the number
+        of CPUs
+        @param ignoreDirs: top level directories left out of the search for
+        extra files
+        """
+
+        self._processes = processes
+        if ignoreDirs is None:
+            ignoreDirs = self.IGNORE_DIRS
+        self._ignoreDirs = frozenset(ignoreDirs)
+
+    @classmethod
+    def _iterTasks(cls, packages, mirrorDir, expected):
+        for pkg in packages:
+            location = os.path.normpath(pkg.location.lstrip('/'))
+            expected.add(location)
+            size = pkg.packageSize
+            if size is not None:
+                size = int(size)
+            yield (location, os.path.join(mirrorDir, location), size,
+                   pkg.checksum, pkg.checksumType)
+
+    def _findExtra(self, mirrorDir, expected):
+        extra = []
+        for dirPath, dirNames, fileNames in os.walk(mirrorDir):
+            relDir = os.path.relpath(dirPath, mirrorDir)
+            if relDir == os.curdir:
+                relDir = ''
+                dirNames[:] = [ x for x in dirNames
+                                if x not in self._ignoreDirs ]
+            for fileName in fileNames:
+                location = os.path.join(relDir, fileName)
+                if location not in expected:
+                    extra.append(location)
+        extra.sort()
+        return extra
+
+    def verify(self, packages, mirrorDir):
+        """
+        Verify the files of packages in mirrorDir.
+        @param packages: iterable of repomd.packagexml._Package, consumed as
+        the workers make progress
+        @param mirrorDir: root directory of the mirror
+        @rtype: VerifyReport
+        """
+
+        report = VerifyReport()
+        expected = set()
+        tasks = self._iterTasks(packages, mirrorDir, expected)
+
+        pool = multiprocessing.Pool(self._processes)
+        try:
+            for location, status, reason, size in pool.imap_unordered(
+                    checkFile, tasks, self.CHUNK_SIZE):
+                report.bytes += size
+                if status == OK:
+                    report.verified += 1
+                elif status == MISSING:
+                    report.missing.append(location)
+                else:
+                    report.corrupt.append((location, reason))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        report.missing.sort()
+        report.corrupt.sort()
+        report.extra = self._findExtra(mirrorDir, expected)
+        return report
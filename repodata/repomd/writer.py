@@ -0,0 +1,546 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Write repository metadata.
+
+RepoMdWriter streams packages into primary.xml.gz and filelists.xml.gz,
+updates into updateinfo.xml.gz, and describes the written files in
+repomd.xml. PackageScanner turns a directory of rpms into packages for the
+writer, reusing the entries of rpms whose path, size and modification time
+did not change since the previous scan and checksumming the others in a pool
+of processes.
+
+The library does not read rpm headers itself, the scanner takes a function
+that creates a package from the header of an rpm file.
+
+Example:
+> scanner = PackageScanner(readHeader, cachePath='/srv/repo/.scancache')
+> writer = RepoMdWriter('/srv/repo')
+> writer.writePackages(scanner.scan('/srv/repo'))
+> writer.writeUpdateInfo(updates)
+> writer.finish()
+"""
+
+__all__ = ('RepoMdWriter', 'PackageScanner', )
+
+import os
+import gzip
+import time
+import marshal
+import tempfile
+import multiprocessing
+from xml.sax.saxutils import escape, quoteattr
+
+import checksum
+from packagexml import _Package, RELATIONS, RELATION_ELEMENTS
+from snapshot import _getText, packageToRecord, recordToPackage
+
+# Map of _Dependency attributes to rpm:entry attributes, in output order
+ENTRY_ATTRIBUTES = (('kind', 'kind'), ('name', 'name'), ('flags', 'flags'),
+                    ('epoch', 'epoch'), ('version', 'ver'),
+                    ('release', 'rel'), ('pre', 'pre'))
+
+# Files listed in primary.xml as well as in filelists.xml, like createrepo
+# does, so dependencies on them can be resolved from primary alone: files
+# below /etc, files in a bin or sbin directory and the sendmail binary.
+PRIMARY_FILE_PREFIX = '/etc/'
+PRIMARY_FILE_DIRS = frozenset(['bin', 'sbin'])
+PRIMARY_FILE_NAMES = frozenset(['/usr/lib/sendmail'])
+
+NS_COMMON = 'http://linux.duke.edu/metadata/common'
+NS_RPM = 'http://linux.duke.edu/metadata/rpm'
+NS_SUSE = 'http://novell.com/package/metadata/suse/common'
+NS_FILELISTS = 'http://linux.duke.edu/metadata/filelists'
+NS_REPO = 'http://linux.duke.edu/metadata/repo'
+NS_UPDATEINFO = 'http://novell.com/package/metadata/suse/updateinfo'
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def _attrs(*pairs):
+    """
+    Format attributes, leaving out those without a value.
+    """
+
+    return ''.join(' %s=%s' % (name, quoteattr(_encode(value)))
+                   for name, value in pairs if value is not None)
+
+def _text(name, value, indent):
+    if value is None:
+        return ''
+    return '%s<%s>%s</%s>\n' % (indent, name, escape(_encode(value)), name)
+
+def _isPrimaryFile(fileName):
+    if fileName.startswith(PRIMARY_FILE_PREFIX):
+        return True
+    if fileName in PRIMARY_FILE_NAMES:
+        return True
+    return not PRIMARY_FILE_DIRS.isdisjoint(fileName.split('/')[:-1])
+
+def formatPrimaryPackage(pkg):
+    """
+    @return the package element of a package in primary.xml
+    """
+
+    out = [ '<package type="rpm">\n' ]
+    out.append(_text('name', pkg.name, '  '))
+    out.append(_text('arch', pkg.arch, '  '))
+    out.append('  <version%s/>\n' % _attrs(('epoch', pkg.epoch),
+        ('ver', pkg.version), ('rel', pkg.release)))
+    if pkg.checksum is not None:
+        pkgid = pkg.pkgid is not None and 'YES' or None
+        out.append('  <checksum%s>%s</checksum>\n' % (
+            _attrs(('type', pkg.checksumType), ('pkgid', pkgid)),
+            escape(_encode(pkg.checksum))))
+    out.append(_text('summary', pkg.summary, '  '))
+    out.append(_text('description', pkg.description, '  '))
+    out.append(_text('packager', _getText(getattr(pkg, 'packager', None)),
+        '  '))
+    out.append(_text('url', _getText(getattr(pkg, 'url', None)), '  '))
+    out.append('  <time%s/>\n' % _attrs(('file', pkg.fileTimestamp),
+        ('build', pkg.buildTimestamp)))
+    out.append('  <size%s/>\n' % _attrs(('package', pkg.packageSize),
+        ('installed', pkg.installedSize), ('archive', pkg.archiveSize)))
+    out.append('  <location%s/>\n' % _attrs(('href', pkg.location)))
+
+    out.append('  <format>\n')
+    out.append(_text('rpm:license', pkg.license, '    '))
+    out.append(_text('rpm:vendor', pkg.vendor, '    '))
+    out.append(_text('rpm:group', pkg.group, '    '))
+    out.append(_text('rpm:buildhost', pkg.buildhost, '    '))
+    out.append(_text('rpm:sourcerpm', pkg.sourcerpm, '    '))
+    if pkg.headerStart is not None or pkg.headerEnd is not None:
+        out.append('    <rpm:header-range%s/>\n' % _attrs(
+            ('start', pkg.headerStart), ('end', pkg.headerEnd)))
+    for relation in RELATIONS:
+        entries = pkg.getDependencies(relation)
+        if not entries:
+            continue
+        element = RELATION_ELEMENTS[relation]
+        entryName = element.split(':')[0] + ':entry'
+        out.append('    <%s>\n' % element)
+        for dep in entries:
+            out.append('      <%s%s/>\n' % (entryName, _attrs(*[
+                (attr, getattr(dep, slot))
+                for slot, attr in ENTRY_ATTRIBUTES ])))
+        out.append('    </%s>\n' % element)
+    for fileObj in pkg.files or ():
+        if _isPrimaryFile(fileObj.name):
+            out.append('    <file%s>%s</file>\n' % (
+                _attrs(('type', fileObj.type)),
+                escape(_encode(fileObj.name))))
+    out.append('  </format>\n')
+
+    if pkg.licenseToConfirm is not None:
+        out.append(_text('suse:license-to-confirm', pkg.licenseToConfirm,
+            '  '))
+    out.append('</package>\n')
+    return ''.join(out)
+
+def formatFileListsPackage(pkg):
+    """
+    @return the package element of a package in filelists.xml
+    """
+
+    out = [ '<package%s>\n' % _attrs(('pkgid', pkg.pkgid or pkg.checksum),
+        ('name', pkg.name), ('arch', pkg.arch)) ]
+    out.append('  <version%s/>\n' % _attrs(('epoch', pkg.epoch),
+        ('ver', pkg.version), ('rel', pkg.release)))
+    for fileObj in pkg.files or ():
+        out.append('  <file%s>%s</file>\n' % (_attrs(('type', fileObj.type)),
+            escape(_encode(fileObj.name))))
+    out.append('</package>\n')
+    return ''.join(out)
+
+def formatUpdate(update):
+    """
+    @return the update element of an advisory in updateinfo.xml
+    """
+
+    out = [ '<update%s>\n' % _attrs(('status', update.status),
+        ('from', update.emailfrom), ('type', update.type)) ]
+    out.append(_text('id', update.id, '  '))
+    out.append(_text('title', update.title, '  '))
+    out.append(_text('release', update.release, '  '))
+    if update.issued is not None:
+        out.append('  <issued%s/>\n' % _attrs(('date', update.issued)))
+    if update.references is not None:
+        out.append('  <references>\n')
+        for ref in update.references:
+            out.append('    <reference%s/>\n' % _attrs(('href', ref.href),
+                ('id', ref.id), ('title', ref.title), ('type', ref.type)))
+        out.append('  </references>\n')
+    out.append(_text('description', update.description, '  '))
+    if update.pkglist is not None:
+        out.append('  <pkglist>\n    <collection>\n')
+        for pkg in update.pkglist:
+            out.append('      <package%s>\n' % _attrs(('name', pkg.name),
+                ('arch', pkg.arch), ('epoch', pkg.epoch),
+                ('version', pkg.version), ('release', pkg.release)))
+            for name in ('filename', 'reboot_suggested',
+                         'restart_suggested', 'relogin_suggested'):
+                out.append(_text(name, getattr(pkg, name, None),
+                    '        '))
+            out.append('      </package>\n')
+        out.append('    </collection>\n  </pkglist>\n')
+    out.append('</update>\n')
+    return ''.join(out)
+
+
+class _MetadataFile(object):
+    """
+    Compressed metadata file that tracks the checksum and size of both its
+    compressed and uncompressed contents.
+    """
+
+    def __init__(self, path, checksumType, timestamp):
+        self.path = path
+        self._raw = open(path, 'wb')
+        self._packed = _CountingFile(self._raw, checksumType)
+        self._opened = _CountingFile(gzip.GzipFile(
+            os.path.basename(path)[:-3], 'wb', 9, self._packed,
+            mtime=timestamp), checksumType)
+
+    def write(self, data):
+        self._opened.write(data)
+
+    def close(self):
+        self._opened.close()
+        self._raw.close()
+        return (self._packed.digest.hexdigest(), self._packed.size,
+                self._opened.digest.hexdigest(), self._opened.size)
+
+
+class _CountingFile(object):
+    """
+    Write-only file wrapper computing a digest and size of what is written.
+    """
+
+    def __init__(self, fobj, checksumType):
+        self._fobj = fobj
+        self.digest = checksum.getDigest(checksumType)
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        self._fobj.write(data)
+
+    def flush(self):
+        self._fobj.flush()
+
+    def close(self):
+        self._fobj.close()
+
+
+class RepoMdWriter(object):
+    """
+    Write the metadata of a repository to the repodata directory below
+    destDir. Data files are written under temporary names and moved into
+    place by finish(), which writes repomd.xml last.
+    """
+
+    CHECKSUM_TYPE = 'sha256'
+
+    def __init__(self, destDir, checksumType=None, timestamp=None,
+            revision=None):
+        """
+        @param destDir: repository root
+        @param checksumType: checksum type used in repomd.xml
+        @param timestamp: timestamp of the data files, defaults to now
+        @param revision: repository revision, defaults to the timestamp
+        """
+
+        self._mdDir = os.path.join(destDir, 'repodata')
+        self._checksumType = checksumType or self.CHECKSUM_TYPE
+        if timestamp is None:
+            timestamp = int(time.time())
+        self._timestamp = timestamp
+        self._revision = revision is None and timestamp or revision
+        # type -> (temporary path, checksum, size, open checksum, open size)
+        self._entries = {}
+
+        if not os.path.isdir(self._mdDir):
+            os.makedirs(self._mdDir)
+
+    def _open(self, dataType):
+        fd, path = tempfile.mkstemp(dir=self._mdDir,
+            prefix='.%s' % dataType, suffix='.xml.gz')
+        os.close(fd)
+        return _MetadataFile(path, self._checksumType, self._timestamp)
+
+    def _close(self, dataType, mdFile):
+        self._entries[dataType] = (mdFile.path, ) + mdFile.close()
+
+    def writePackages(self, packages):
+        """
+        Write primary.xml.gz and filelists.xml.gz in one pass over packages.
+        The package elements are spooled to disk until the number of packages
+        for the root elements is known, so memory use does not grow with the
+        number of packages.
+        @param packages: iterable of repomd.packagexml._Package
+        """
+
+        primary = tempfile.TemporaryFile(prefix='primary', dir=self._mdDir)
+        fileLists = tempfile.TemporaryFile(prefix='filelists',
+            dir=self._mdDir)
+        try:
+            count = 0
+            for pkg in packages:
+                primary.write(formatPrimaryPackage(pkg))
+                fileLists.write(formatFileListsPackage(pkg))
+                count += 1
+
+            mdFile = self._open('primary')
+            mdFile.write(XML_HEADER)
+            mdFile.write('<metadata xmlns="%s" xmlns:rpm="%s" xmlns:suse="%s"'
+                ' packages="%d">\n' % (NS_COMMON, NS_RPM, NS_SUSE, count))
+            self._copy(primary, mdFile)
+            mdFile.write('</metadata>\n')
+            self._close('primary', mdFile)
+
+            mdFile = self._open('filelists')
+            mdFile.write(XML_HEADER)
+            mdFile.write('<filelists xmlns="%s" packages="%d">\n' %
+                (NS_FILELISTS, count))
+            self._copy(fileLists, mdFile)
+            mdFile.write('</filelists>\n')
+            self._close('filelists', mdFile)
+        finally:
+            primary.close()
+            fileLists.close()
+
+    @classmethod
+    def _copy(cls, spool, mdFile):
+        spool.seek(0)
+        while True:
+            buf = spool.read(checksum.BUFFER_SIZE)
+            if not buf:
+                break
+            mdFile.write(buf)
+
+    def writeUpdateInfo(self, updates):
+        """
+        Write updateinfo.xml.gz.
+        @param updates: iterable of repomd.updateinfoxml._Update
+        """
+
+        mdFile = self._open('updateinfo')
+        mdFile.write(XML_HEADER)
+        mdFile.write('<updates xmlns="%s">\n' % NS_UPDATEINFO)
+        for update in updates:
+            mdFile.write(formatUpdate(update))
+        mdFile.write('</updates>\n')
+        self._close('updateinfo', mdFile)
+
+    def finish(self):
+        """
+        Move the data files into place and write repomd.xml.
+        @return path of repomd.xml
+        """
+
+        out = [ XML_HEADER ]
+        out.append('<repomd xmlns="%s" xmlns:rpm="%s">\n' % (NS_REPO, NS_RPM))
+        out.append(_text('revision', self._revision, '  '))
+        for dataType in sorted(self._entries):
+            tmpPath, packed, size, opened, openSize = \
+                self._entries[dataType]
+            fileName = '%s.xml.gz' % dataType
+            os.chmod(tmpPath, 0644)
+            os.rename(tmpPath, os.path.join(self._mdDir, fileName))
+
+            out.append('  <data type="%s">\n' % dataType)
+            out.append('    <checksum type="%s">%s</checksum>\n' %
+                (self._checksumType, packed))
+            out.append('    <open-checksum type="%s">%s</open-checksum>\n' %
+                (self._checksumType, opened))
+            out.append('    <location href="repodata/%s"/>\n' % fileName)
+            out.append(_text('timestamp', self._timestamp, '    '))
+            out.append(_text('size', size, '    '))
+            out.append(_text('open-size', openSize, '    '))
+            out.append('  </data>\n')
+        out.append('</repomd>\n')
+        self._entries = {}
+
+        fd, tmpPath = tempfile.mkstemp(dir=self._mdDir, prefix='.repomd')
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            fobj.write(''.join(out))
+        finally:
+            fobj.close()
+        os.chmod(tmpPath, 0644)
+        path = os.path.join(self._mdDir, 'repomd.xml')
+        os.rename(tmpPath, path)
+        return path
+
+
+# readHeader function of the scanner, set in each worker process
+_workerReadHeader = None
+
+def _initWorker(readHeader):
+    # Worker processes are forked, so readHeader does not have to be
+    # picklable.
+    global _workerReadHeader
+    _workerReadHeader = readHeader
+
+def _scanRpm(task):
+    """
+    Checksum one rpm and read its header. Runs in the worker processes.
+    @param task: (rpm directory, location, size, mtime, checksum type)
+    @return snapshot record of the package
+    """
+
+    rpmDir, location, size, mtime, checksumType = task
+    path = os.path.join(rpmDir, location)
+    pkg = _workerReadHeader(path)
+    pkg.location = location
+    pkg.checksum = pkg.pkgid = checksum.fileChecksum(path, checksumType)
+    pkg.checksumType = checksumType
+    pkg.packageSize = str(size)
+    pkg.fileTimestamp = str(mtime)
+    return packageToRecord(pkg)
+
+
+class PackageScanner(object):
+    """
+    Create packages for the rpms below a directory. Entries of rpms whose
+    path, size and modification time match the previous scan are taken from
+    a cache file, only new and changed rpms are checksummed and read, both
+    in a pool of processes.
+    """
+
+    FORMAT_VERSION = 1
+    CHECKSUM_TYPE = 'sha256'
+    PackageFactory = _Package
+
+    # Number of rpms handed to a worker process at a time
+    CHUNK_SIZE = 4
+
+    def __init__(self, readHeader, cachePath=None, checksumType=None,
+            processes=None):
+        """
+        @param readHeader: function creating a package from the header of
+        the rpm at the given path, called in the worker processes. The
+        location, checksum and file size and time of the package are filled
+        in by the scanner.
+        @param cachePath: optional file keeping the entries between scans
+        @param checksumType: checksum type of the packages
+        @param processes: number of worker processes, defaults to the
+        number of CPUs
+        """
+
+        self._readHeader = readHeader
+        self._cachePath = cachePath
+        self._checksumType = checksumType or self.CHECKSUM_TYPE
+        self._processes = processes
+
+    def _loadCache(self):
+        if self._cachePath is None:
+            return {}
+        try:
+            fobj = open(self._cachePath, 'rb')
+        except IOError:
+            return {}
+        try:
+            try:
+                version, checksumType, entries = marshal.load(fobj)
+            except (EOFError, ValueError, TypeError):
+                return {}
+        finally:
+            fobj.close()
+        if (version != self.FORMAT_VERSION or
+                checksumType != self._checksumType):
+            return {}
+        return entries
+
+    def _saveCache(self, entries):
+        if self._cachePath is None:
+            return
+        fd, tmpPath = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._cachePath)),
+            prefix='.scancache')
+        fobj = os.fdopen(fd, 'wb')
+        try:
+            marshal.dump((self.FORMAT_VERSION, self._checksumType, entries),
+                fobj, 2)
+        finally:
+            fobj.close()
+        os.rename(tmpPath, self._cachePath)
+
+    @classmethod
+    def _findRpms(cls, rpmDir):
+        """
+        @return sorted list of (location, size, mtime)
+        """
+
+        rpms = []
+        for dirPath, dirNames, fileNames in os.walk(rpmDir):
+            if dirPath == rpmDir and 'repodata' in dirNames:
+                dirNames.remove('repodata')
+            dirNames.sort()
+            for fileName in fileNames:
+                if not fileName.endswith('.rpm') or fileName.startswith('.'):
+                    continue
+                path = os.path.join(dirPath, fileName)
+                st = os.stat(path)
+                rpms.append((os.path.relpath(path, rpmDir), st.st_size,
+                             int(st.st_mtime)))
+        rpms.sort()
+        return rpms
+
+    def scan(self, rpmDir):
+        """
+        Iterate over the packages for the rpms below rpmDir, ordered by
+        location. The cache is updated once iteration completes.
+        @return iterator of packages
+        """
+
+        rpms = self._findRpms(rpmDir)
+        cache = self._loadCache()
+        changed = [ (rpmDir, location, size, mtime, self._checksumType)
+                    for location, size, mtime in rpms
+                    if cache.get(location, (None, None))[:2] != (size, mtime) ]
+
+        pool = None
+        scanned = iter(())
+        if changed:
+            pool = multiprocessing.Pool(self._processes, _initWorker,
+                (self._readHeader, ))
+            scanned = pool.imap(_scanRpm, changed, self.CHUNK_SIZE)
+
+        newCache = {}
+        try:
+            for location, size, mtime in rpms:
+                entry = cache.get(location)
+                if entry is not None and entry[:2] == (size, mtime):
+                    record = entry[2]
+                else:
+                    record = scanned.next()
+                newCache[location] = (size, mtime, record)
+                yield recordToPackage(record, self.PackageFactory)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        self._saveCache(newCache)
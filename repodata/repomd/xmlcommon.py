@@ -21,58 +21,248 @@ Base module for common super classes for repomd.
 
 __all__ = ('XmlFileParser', 'SlotNode')
 
+import time
+import threading
+
 from rpath_xmllib import api1 as xmllib
 
+import instrument
+
+class _TypeRegistry(object):
+    """
+    Records registerType calls and keeps a pool of databinders set up with
+    them. A databinder is only used by one parse at a time, idle ones are
+    reused by the next parse.
+    """
+
+    def __init__(self):
+        self._types = []
+        # Databinder class -> idle databinders
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def registerType(self, klass, **kwargs):
+        self._types.append((klass, kwargs))
+
+    def acquire(self, factory):
+        """
+        @param factory: databinder class
+        @return databinder with all types registered, for one parse
+        """
+
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(factory)
+            if idle:
+                return idle.pop()
+        finally:
+            self._lock.release()
+
+        databinder = factory()
+        for klass, kwargs in self._types:
+            databinder.registerType(klass, **kwargs)
+        return databinder
+
+    def release(self, factory, databinder):
+        """
+        Return a databinder after a complete parse. Databinders of parses
+        that failed or were not read to the end are not returned.
+        """
+
+        self._lock.acquire()
+        try:
+            self._idle.setdefault(factory, []).append(databinder)
+        finally:
+            self._lock.release()
+
+
 class XmlFileParser(object):
     """
     Base class for handling databinder setup.
     """
     DataBinderFactory = xmllib.DataBinder
 
-    def __init__(self, repository, path):
+    # Type registries built by _registerTypes, keyed by parser class and
+    # package factory. Shared by all parser instances.
+    _registries = {}
+
+    def __init__(self, repository, path, checksum=None, checksumType=None):
         self._repository = repository
         self._path = path
+        # Checksum of the file from the metadata pointing to it, lets the
+        # repository serve the file from a shared cache
+        self._checksum = checksum
+        self._checksumType = checksumType
 
-        self._databinder = self.DataBinderFactory()
-        self._registerTypes()
+        self._registry = None
+        self._compileTypes()
 
         self._data = None
 
-    def _registerTypes(self):
+    def _compileTypes(self):
         """
-        Method stub for sub classes to implement.
+        Look up the type registry of this parser class, building it with
+        _registerTypes on first use.
         """
 
-    def parse(self):
+        key = (self.__class__, getattr(self, 'PackageFactory', None))
+        registry = self._registries.get(key)
+        if registry is None:
+            registry = _TypeRegistry()
+            self._registerTypes(registry)
+            self._registries[key] = registry
+        self._registry = registry
+
+    def _getDataBinder(self):
+        """
+        Get a databinder for one parse from the pool of the type registry.
+        Databinders keep state while parsing, so parsers do not keep one
+        and can be used from several threads at once.
+        """
+
+        return self._registry.acquire(self.DataBinderFactory)
+
+    def _releaseDataBinder(self, databinder):
+        self._registry.release(self.DataBinderFactory, databinder)
+
+    def _registerTypes(self, registry):
+        """
+        Method stub for sub classes to implement. This is called once per
+        parser class and package factory, registrations are recorded and
+        reused for later instances.
+        @param registry: takes the registerType calls of a databinder
+        """
+
+    def _open(self, repository=None):
+        """
+        Get the file to parse from the repository.
+        @param repository: repository to read from instead of the one the
+        parser was set up with
+        @return file object
+        """
+
+        if repository is None:
+            repository = self._repository
+        return repository.get(self._path, checksum=self._checksum,
+            checksumType=self._checksumType)
+
+    def parse(self, repository=None):
         """
         Parse an xml file.
+        @param repository: repository to read from instead of the one the
+        parser was set up with
         @return sub class xmllib.BaseNode
         """
 
         # W0212 - Access to a protected member _parser of a client class
         # pylint: disable-msg=W0212
 
-        fn = self._repository.get(self._path)
-        data = self._databinder.parseFile(fn)
+        if repository is None:
+            repository = self._repository
+        metrics = getattr(repository, 'metrics', None)
+        fn = self._open(repository)
+        if metrics is not None:
+            start = time.time()
+
+        databinder = self._getDataBinder()
+        try:
+            data = databinder.parseFile(fn)
+        finally:
+            fn.close()
+        self._releaseDataBinder(databinder)
 
+        # The children are new nodes, only reachable through data. They
+        # belong to the repository of this parser, not to one passed in for
+        # a single parse, like a view with a deadline.
+        owner = self._repository
+        if owner is None:
+            owner = repository
         for child in data.iterChildren():
             if hasattr(child, '_parser') and child._parser is not None:
-                child._parser._repository = self._repository
+                child._parser._repository = owner
+
+        if metrics is not None:
+            elapsed = time.time() - start - getattr(fn, 'seconds', 0.0)
+            metrics.addTiming(instrument.STAGE_PARSE, self._path, elapsed)
+            counts = {}
+            instrument.countNodes(data, counts)
+            metrics.addNodes(self._path, counts)
 
         return data
 
 class XmlStreamedParser(XmlFileParser):
     DataBinderFactory = xmllib.StreamingDataBinder
-    def parse(self):
+    def parse(self, repository=None):
         """
         Parse an xml file.
+        @param repository: repository to read from instead of the one the
+        parser was set up with
         @return iterator of instances of sub class xmllib.BaseNode
         """
 
-        fn = self._repository.get(self._path)
-        iterator = self._databinder.parseFile(fn)
+        if repository is None:
+            repository = self._repository
+        metrics = getattr(repository, 'metrics', None)
+        fn = self._open(repository)
+        iterator = self._iterPooled(self._getDataBinder(), fn)
+        if metrics is not None:
+            return self._iterMetered(iterator, fn, metrics)
         return iterator
 
+    def _iterPooled(self, databinder, fn):
+        """
+        Stream the nodes of fn, handing the databinder back once the
+        document was read to the end. fn is closed once iteration ends.
+        """
+
+        try:
+            for node in databinder.parseFile(fn):
+                yield node
+        finally:
+            fn.close()
+        self._releaseDataBinder(databinder)
+
+    def _iterMetered(self, iterator, fn, metrics):
+        """
+        Wrap a parse iterator to report parse time, excluding the time the
+        consumer spends between items, and the nodes it yields.
+        """
+
+        elapsed = 0.0
+        counts = {}
+        iterator = iter(iterator)
+        while True:
+            start = time.time()
+            try:
+                node = iterator.next()
+            except StopIteration:
+                elapsed += time.time() - start
+                break
+            elapsed += time.time() - start
+            instrument.countNodes(node, counts)
+            yield node
+
+        elapsed -= getattr(fn, 'seconds', 0.0)
+        metrics.addTiming(instrument.STAGE_PARSE, self._path, elapsed)
+        metrics.addNodes(self._path, counts)
+
+# Map of SlotNode subclass to the names of all slots defined in its MRO.
+_slotNames = {}
+
+def _compileSlots(cls):
+    """
+    Collect the __slots__ entries of cls and its base classes.
+    """
+
+    names = []
+    for klass in cls.__mro__:
+        for attr in klass.__dict__.get('__slots__', ()):
+            if attr not in names:
+                names.append(attr)
+    names = tuple(names)
+    _slotNames[cls] = names
+    return names
+
 class SlotNode(xmllib.BaseNode):
     """
     XML node class that initializes all __slots__ entries to None.
@@ -81,8 +271,10 @@ class SlotNode(xmllib.BaseNode):
     __slots__ = ()
 
     def __init__(self, *args, **kw):
-        for cls in self.__class__.__mro__:
-            if hasattr(cls, '__slots__'):
-                for attr in cls.__slots__:
-                    setattr(self, attr, None)
+        cls = self.__class__
+        names = _slotNames.get(cls)
+        if names is None:
+            names = _compileSlots(cls)
+        for attr in names:
+            setattr(self, attr, None)
         xmllib.BaseNode.__init__(self, *args, **kw)
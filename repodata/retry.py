@@ -0,0 +1,346 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Retry policy for repository requests.
+
+A RetryPolicy retries failed requests with capped exponential backoff and
+full jitter, so workers hitting the same host do not retry in lockstep. Each
+request has a time budget, and an optional Deadline bounds all requests of a
+sync. No attempt is sent once the budget is spent, and an attempt that does
+not finish within what is left of it is given up. HTTP errors that will not
+go away by retrying fail right away, and a CircuitBreaker stops requests to
+a host after repeated failures until it had some time to recover.
+
+Attempts are not run in separate threads. The caller gets the time left for
+each attempt and applies it as a socket timeout.
+"""
+
+__all__ = ('RetryPolicy', 'CircuitBreaker', 'Deadline', 'HostLimiter',
+    'HostUnavailableError', 'DeadlineExceededError', 'defaultBreaker', )
+
+import time
+import socket
+import random
+import logging
+import threading
+
+from conary.lib.http import http_error
+
+log = logging.getLogger(__name__)
+
+
+class HostUnavailableError(http_error.TransportError):
+    """
+    Raised without sending a request when the circuit breaker of a host is
+    open.
+    """
+
+
+class DeadlineExceededError(http_error.TransportError):
+    """
+    Raised when the time budget of a request runs out, before or while
+    sending it.
+    """
+
+
+class Deadline(object):
+    """
+    Point in time by which a set of requests has to finish. A deadline is
+    never moved, each set of requests gets a new one.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    @classmethod
+    def earliest(cls, *deadlines):
+        """
+        @return the deadline of deadlines that expires first, None entries
+        are skipped
+        """
+
+        deadlines = [ x for x in deadlines if x is not None ]
+        if not deadlines:
+            return None
+        return min(deadlines, key=lambda x: x.expires)
+
+    def remaining(self):
+        return max(self.expires - time.time(), 0.0)
+
+    def isExpired(self):
+        return time.time() >= self.expires
+
+
+class CircuitBreaker(object):
+    """
+    Per host circuit breaker. After FAILURE_THRESHOLD consecutive failures a
+    host is considered down and requests to it fail immediately. Once
+    RESET_TIMEOUT seconds have passed a single trial request is let through;
+    its outcome closes the circuit again or restarts the timeout.
+    """
+
+    FAILURE_THRESHOLD = 5
+    RESET_TIMEOUT = 30
+
+    def __init__(self, failureThreshold=None, resetTimeout=None,
+            clock=time.time):
+        self._failureThreshold = failureThreshold or self.FAILURE_THRESHOLD
+        if resetTimeout is None:
+            resetTimeout = self.RESET_TIMEOUT
+        self._resetTimeout = resetTimeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        # host -> [ consecutive failures, time the circuit opened or None ]
+        self._hosts = {}
+
+    def allow(self, host):
+        """
+        @return True if a request to host may be sent
+        """
+
+        self._lock.acquire()
+        try:
+            state = self._hosts.get(host)
+            if state is None or state[1] is None:
+                return True
+            now = self._clock()
+            if now - state[1] < self._resetTimeout:
+                return False
+            # Half open, let one request through and wait for its outcome
+            state[1] = now
+            return True
+        finally:
+            self._lock.release()
+
+    def isOpen(self, host):
+        self._lock.acquire()
+        try:
+            state = self._hosts.get(host)
+            return state is not None and state[1] is not None
+        finally:
+            self._lock.release()
+
+    def recordSuccess(self, host):
+        self._lock.acquire()
+        try:
+            self._hosts.pop(host, None)
+        finally:
+            self._lock.release()
+
+    def recordFailure(self, host):
+        self._lock.acquire()
+        try:
+            state = self._hosts.setdefault(host, [ 0, None ])
+            state[0] += 1
+            if state[0] >= self._failureThreshold:
+                state[1] = self._clock()
+        finally:
+            self._lock.release()
+
+class HostLimiter(object):
+    """
+    Limit the number of concurrent transfers per host. A slot is taken for
+    each request actually sent to a host and given back once its response
+    is closed or fails, so backoff between retries and failover to another
+    host do not hold it.
+    """
+
+    MAX_PER_HOST = 4
+
+    def __init__(self, maxPerHost=None):
+        self._maxPerHost = maxPerHost or self.MAX_PER_HOST
+        self._cond = threading.Condition()
+        # host -> number of transfers in progress
+        self._active = {}
+
+    def acquire(self, host):
+        self._cond.acquire()
+        try:
+            while self._active.get(host, 0) >= self._maxPerHost:
+                self._cond.wait()
+            self._active[host] = self._active.get(host, 0) + 1
+        finally:
+            self._cond.release()
+
+    def release(self, host):
+        self._cond.acquire()
+        try:
+            self._active[host] -= 1
+            if not self._active[host]:
+                del self._active[host]
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def getActive(self, host):
+        """
+        @return number of transfers to host in progress
+        """
+
+        self._cond.acquire()
+        try:
+            return self._active.get(host, 0)
+        finally:
+            self._cond.release()
+
+
+# Breaker shared by all retry policies that do not bring their own
+defaultBreaker = CircuitBreaker()
+
+
+class RetryPolicy(object):
+    """
+    Decide whether and when to retry a failed request.
+    """
+
+    MAX_ATTEMPTS = 6
+    BASE_DELAY = 0.5
+    MAX_DELAY = 10.0
+    # Total seconds one request may take, including retries
+    REQUEST_TIMEOUT = 120.0
+
+    BACKOFF_FACTOR = 2
+
+    # HTTP errors that may go away when retried. Other 4xx errors are fatal.
+    RETRYABLE_ERRORS = frozenset([ 408, 425, 429, 500, 502, 503, 504 ])
+    FATAL_ERRORS = frozenset()
+    FATAL_SOCKET_ERRORS = frozenset([ socket.EAI_NONAME ])
+
+    def __init__(self, maxAttempts=None, baseDelay=None, maxDelay=None,
+            requestTimeout=None, breaker=None, sleep=time.sleep,
+            rng=None, backoffFactor=None, fatalErrors=None,
+            fatalSocketErrors=None, logger=None):
+        """
+        @param maxAttempts: number of attempts per request
+        @param baseDelay: backoff cap of the first retry in seconds,
+        multiplied by backoffFactor for each further retry
+        @param maxDelay: upper bound of the backoff cap
+        @param requestTimeout: total seconds per request
+        @param breaker: circuit breaker, defaults to the shared one
+        @type breaker: CircuitBreaker
+        @param fatalErrors: HTTP error codes never retried, on top of those
+        not in RETRYABLE_ERRORS
+        @param fatalSocketErrors: socket error numbers never retried
+        @param logger: logger for retried errors, defaults to the one of
+        this module
+        """
+
+        self.maxAttempts = maxAttempts or self.MAX_ATTEMPTS
+        self.baseDelay = baseDelay is None and self.BASE_DELAY or baseDelay
+        self.maxDelay = maxDelay is None and self.MAX_DELAY or maxDelay
+        self.requestTimeout = requestTimeout or self.REQUEST_TIMEOUT
+        self.backoffFactor = backoffFactor or self.BACKOFF_FACTOR
+        if fatalErrors is None:
+            fatalErrors = self.FATAL_ERRORS
+        self.fatalErrors = fatalErrors
+        if fatalSocketErrors is None:
+            fatalSocketErrors = self.FATAL_SOCKET_ERRORS
+        self.fatalSocketErrors = fatalSocketErrors
+        if breaker is None:
+            breaker = defaultBreaker
+        self.breaker = breaker
+        self._sleep = sleep
+        self._random = rng or random.Random()
+        self._log = logger or log
+
+    def getDelay(self, retry):
+        """
+        Full jitter backoff: a random delay between zero and the capped
+        exponential backoff.
+        @param retry: number of the retry, starting at 1
+        """
+
+        cap = min(self.maxDelay,
+                  self.baseDelay * (self.backoffFactor ** (retry - 1)))
+        return self._random.uniform(0, cap)
+
+    def isRetryable(self, error):
+        """
+        @return True if a request that failed with error may be retried
+        """
+
+        if isinstance(error, HostUnavailableError):
+            return False
+        errcode = getattr(error, 'errcode', None)
+        if errcode is not None:
+            return (errcode in self.RETRYABLE_ERRORS and
+                    errcode not in self.fatalErrors)
+        if isinstance(error, IOError) and error.args:
+            return error.args[0] not in self.fatalSocketErrors
+        return True
+
+    @classmethod
+    def _isHostFailure(cls, error):
+        """
+        Client errors come from a healthy host, server errors and connection
+        failures count against it.
+        """
+
+        errcode = getattr(error, 'errcode', None)
+        return errcode is None or errcode >= 500
+
+    def call(self, func, host=None, deadline=None, passTimeout=False):
+        """
+        Call func until it succeeds, fails with a fatal error, runs out of
+        attempts or time.
+        @param host: host the request goes to, for the circuit breaker
+        @param deadline: optional deadline of the whole sync
+        @type deadline: Deadline
+        @param passTimeout: call func with the seconds left for the
+        attempt, which it has to give up after, for example as a socket
+        timeout
+        @return the result of func
+        """
+
+        expires = time.time() + self.requestTimeout
+        if deadline is not None:
+            expires = min(expires, deadline.expires)
+
+        attempt = 0
+        while True:
+            remaining = expires - time.time()
+            if remaining <= 0:
+                raise DeadlineExceededError('No time left for the request')
+            if host is not None and not self.breaker.allow(host):
+                raise HostUnavailableError('Host %s is unavailable' % host)
+            attempt += 1
+            try:
+                if passTimeout:
+                    ret = func(remaining)
+                else:
+                    ret = func()
+            except (http_error.TransportError, IOError), e:
+                if host is not None:
+                    if self._isHostFailure(e):
+                        self.breaker.recordFailure(host)
+                    else:
+                        self.breaker.recordSuccess(host)
+                if not self.isRetryable(e) or attempt >= self.maxAttempts:
+                    raise
+                delay = self.getDelay(attempt)
+                if time.time() + delay >= expires:
+                    raise
+                self._log.error("Error: %s; retrying after %.3f seconds",
+                    e, delay)
+                self._sleep(delay)
+                continue
+
+            if host is not None:
+                self.breaker.recordSuccess(host)
+            return ret
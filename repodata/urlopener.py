@@ -15,54 +15,187 @@
 #
 
 
-import logging
-import socket
 import sys
+import copy
+import time
+import socket
+import logging
+import threading
+import urlparse
 
-from conary.lib import timeutil
+from conary.lib.http import connection
 from conary.lib.http import http_error
 from conary.lib.http import opener
 from conary.repository import transport
 
+from repodata import retry
+
 log = logging.getLogger(__name__)
 
 TransportError = http_error.TransportError
 
+# Seconds left for the request sent from each thread, applied to the sockets
+# of the connections it opens
+_requestTimeout = threading.local()
+
+
+class _TimeoutConnection(connection.Connection):
+    """
+    Connection whose socket gives up after the time left for the request it
+    was opened for, so a hung server does not block the caller.
+    """
+
+    def connectSocket(self):
+        sock = connection.Connection.connectSocket(self)
+        timeout = getattr(_requestTimeout, 'seconds', None)
+        if timeout is not None:
+            sock.settimeout(timeout)
+        return sock
+
 
 class URLOpener(opener.URLOpener):
-    # Be careful when changing these constants. The exponential backoff will
+    """
+    URL opener that retries failed requests according to a retry policy.
+    """
+
+    RetryPolicyFactory = retry.RetryPolicy
+    connectionFactory = _TimeoutConnection
+
+    # Settings of the retry policy created when none is passed in. Be
+    # careful when changing these constants. The exponential backoff will
     # make the sleep times go up really fast. RBL-7871 for details
     RETRIES_ON_ERROR = 6
     BACKOFF_FACTOR = 1.8
     FATAL_ERRORS = set([ 404 ])
     FATAL_SOCKET_ERRORS = set([ socket.EAI_NONAME ])
 
+    def __init__(self, *args, **kwargs):
+        """
+        @param retryPolicy: optional policy, by default a RetryPolicyFactory
+        instance set up with RETRIES_ON_ERROR, BACKOFF_FACTOR, FATAL_ERRORS
+        and FATAL_SOCKET_ERRORS
+        @type retryPolicy: repodata.retry.RetryPolicy
+        @param deadline: optional deadline of all requests of the opener
+        @type deadline: repodata.retry.Deadline
+        @param hostLimiter: optional limit of concurrent transfers per host
+        @type hostLimiter: repodata.retry.HostLimiter
+        """
+
+        self.retryPolicy = kwargs.pop('retryPolicy', None)
+        if self.retryPolicy is None:
+            self.retryPolicy = self._createRetryPolicy()
+        self.deadline = kwargs.pop('deadline', None)
+        self.hostLimiter = kwargs.pop('hostLimiter', None)
+        opener.URLOpener.__init__(self, *args, **kwargs)
+
+    def _createRetryPolicy(self):
+        return self.RetryPolicyFactory(maxAttempts=self.RETRIES_ON_ERROR,
+            backoffFactor=self.BACKOFF_FACTOR,
+            fatalErrors=frozenset(self.FATAL_ERRORS),
+            fatalSocketErrors=frozenset(self.FATAL_SOCKET_ERRORS),
+            logger=log)
+
+    def withDeadline(self, deadline):
+        """
+        Get an opener sharing the settings of this one whose requests have
+        to finish by deadline, or by the deadline of this opener if that is
+        earlier.
+        @type deadline: repodata.retry.Deadline
+        """
+
+        ret = copy.copy(self)
+        ret.deadline = retry.Deadline.earliest(self.deadline, deadline)
+        return ret
+
     def open(self, url, data=None, headers=()):
-        timer = timeutil.BackoffTimer()
-        timer.factor = self.BACKOFF_FACTOR
-        # TODO: push down retry logic to conary
-
-        for i in range(self.RETRIES_ON_ERROR):
-            try:
-                return opener.URLOpener.open(self, url, data=data,
-                        headers=headers)
-            except http_error.TransportError, e:
-                # If the error is in a specific set, there's no need to retry
-                if e.errcode in self.FATAL_ERRORS:
-                    raise
-                log.error("Error: %s; retrying after %.3f seconds", e,
-                    timer.delay)
-                timer.sleep()
-            except IOError, err:
-                if err.args[0] in self.FATAL_SOCKET_ERRORS:
-                    raise
-                timer.sleep()
-
-        exc_info = sys.exc_info()
-        e = exc_info[1]
-        if isinstance(e, IOError):
-            raise http_error.TransportError("Unable to download: %s" % e), None, exc_info[2]
-        raise exc_info[0], exc_info[1], exc_info[2]
+        host = urlparse.urlparse(url)[1] or None
+        try:
+            return self.retryPolicy.call(
+                lambda timeout: self._limitedOpen(url, data, headers, host,
+                    timeout),
+                host=host, deadline=self.deadline, passTimeout=True)
+        except http_error.TransportError:
+            raise
+        except IOError, e:
+            raise http_error.TransportError("Unable to download: %s" % e), \
+                None, sys.exc_info()[2]
+
+    def _limitedOpen(self, url, data, headers, host, timeout):
+        """
+        Send one request, holding a slot of the host limiter until the
+        response is closed. Reading the response fails once timeout seconds
+        have passed.
+        """
+
+        expires = time.time() + timeout
+        if self.hostLimiter is None or host is None:
+            return _LimitedResponse(self._open(url, data, headers, timeout),
+                None, expires)
+        self.hostLimiter.acquire(host)
+        try:
+            response = self._open(url, data, headers, timeout)
+        except:
+            self.hostLimiter.release(host)
+            raise
+        return _LimitedResponse(response,
+            lambda: self.hostLimiter.release(host), expires)
+
+    def _open(self, url, data, headers, timeout):
+        """
+        Send one request without retrying it.
+        @param timeout: seconds the sockets of the request may block
+        """
+
+        previous = getattr(_requestTimeout, 'seconds', None)
+        _requestTimeout.seconds = timeout
+        try:
+            return opener.URLOpener.open(self, url, data=data,
+                headers=headers)
+        finally:
+            _requestTimeout.seconds = previous
+
+
+class _LimitedResponse(object):
+    """
+    Response that gives back its host limiter slot when it is closed or
+    read to the end, and fails reads once the time for its request is up.
+    """
+
+    def __init__(self, response, release, expires):
+        self._response = response
+        self._release = release
+        self._expires = expires
+
+    def _checkExpired(self):
+        if time.time() >= self._expires:
+            self.close()
+            raise retry.DeadlineExceededError(
+                'Response did not arrive in time')
+
+    def read(self, *args):
+        self._checkExpired()
+        buf = self._response.read(*args)
+        if not buf:
+            self._done()
+        return buf
+
+    def __iter__(self):
+        for line in self._response:
+            self._checkExpired()
+            yield line
+        self._done()
+
+    def close(self):
+        self._done()
+        self._response.close()
+
+    def _done(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
 
 
 class Transport(transport.Transport):
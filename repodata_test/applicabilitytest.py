@@ -0,0 +1,56 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from repodata import repomd
+from repodata_test import repomdtest
+
+
+class ApplicabilityTest(repomdtest.BaseTest):
+    def testEvaluate(self):
+        client = repomd.Client(self.getRepositoryUrl('suse-1'))
+        engine = client.getApplicabilityEngine()
+
+        results = engine.evaluate({
+            'old': [
+                ('curl', '0', '7.19.0', '11.20.1', 'i586'),
+                ('libcurl4', '0', '7.19.0', '11.20.1', 'i586'),
+                ('lcms', None, '1.17', '77.9', 'i586'),
+                ('bash', '0', '3.2', '147.3', 'i586'),
+            ],
+            'current': [
+                ('curl', '0', '7.19.0', '11.21.1', 'i586'),
+                ('lcms', '0', '1.17', '77.12.10', 'i586'),
+            ],
+            'otherarch': [
+                ('curl', '0', '7.19.0', '11.20.1', 'x86_64'),
+            ],
+            'empty': [],
+        })
+
+        self.failUnlessEqual(dict((x, [ y.id for y in results[x] ])
+            for x in results), {
+                'old': ['slessp0-lcms', 'slessp0-curl'],
+                'current': [],
+                'otherarch': [],
+                'empty': [],
+            })
+
+    def testEpoch(self):
+        client = repomd.Client(self.getRepositoryUrl('suse-1'))
+        engine = client.getApplicabilityEngine()
+        self.failUnlessEqual(engine.getApplicable(
+            [ ('curl', '1', '7.18.0', '1', 'i586') ]), [])
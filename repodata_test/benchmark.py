@@ -0,0 +1,369 @@
+#!/usr/bin/python
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Parse throughput benchmarks over generated repositories.
+
+Each benchmark runs in a forked child so the reported peak RSS only covers
+that benchmark. Results can be saved as a baseline and later runs compared
+against it:
+
+  python -m repodata_test.benchmark --packages 20000 --save-baseline b.json
+  python -m repodata_test.benchmark --packages 20000 --baseline b.json
+
+--micro runs per-element microbenchmarks of node construction, parser setup
+and package element dispatch instead, next to the uncompiled
+implementations they replaced.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import marshal
+import optparse
+import resource
+import tempfile
+
+from rpath_xmllib import api1 as xmllib
+
+from repodata import repomd
+from repodata.repomd import packagexml, patchxml, primaryxml, xmlcommon
+from repodata.repomd import lazyxml
+from repodata_test.generator import RepositoryGenerator
+
+# Client method and the data type whose uncompressed size is used for MB/sec
+BENCHMARKS = (
+    ('getPackageDetail', 'primary'),
+    ('getFileLists', 'filelists'),
+    ('getUpdateInfo', 'updateinfo'),
+    ('getPatchDetail', 'patches'),
+)
+
+# Relative slowdown, or growth of peak RSS, reported as a regression
+TOLERANCE = 0.15
+
+
+def _runBenchmark(repoDir, methodName, size):
+    client = repomd.Client(repoDir)
+    # Fetch repomd.xml outside of the timed section
+    client.repomdXml
+
+    start = time.time()
+    count = 0
+    for _ in getattr(client, methodName)():
+        count += 1
+    elapsed = max(time.time() - start, 1e-6)
+
+    return dict(
+        count=count,
+        seconds=elapsed,
+        items_per_sec=count / elapsed,
+        mb_per_sec=size / elapsed / (1024 * 1024),
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+def runIsolated(func, *args):
+    """
+    Run func in a forked child and return its result.
+    """
+
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        status = 0
+        try:
+            try:
+                os.write(wfd, marshal.dumps(func(*args)))
+            except:
+                status = 1
+                import traceback
+                traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    os.close(wfd)
+    chunks = []
+    while True:
+        chunk = os.read(rfd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(rfd)
+    _, status = os.waitpid(pid, 0)
+    if status:
+        raise RuntimeError('benchmark %s failed' % func.__name__)
+    return marshal.loads(''.join(chunks))
+
+def runBenchmarks(generator, workDir=None):
+    """
+    Generate a repository and run all benchmarks against it.
+    @return dictionary of benchmark name to result dictionary
+    """
+
+    tmpDir = tempfile.mkdtemp(prefix='repodata-bench-', dir=workDir)
+    try:
+        sizes = generator.generate(tmpDir)
+        results = {}
+        for methodName, dataType in BENCHMARKS:
+            results[methodName] = runIsolated(_runBenchmark, tmpDir,
+                methodName, sizes.get(dataType, 0))
+        return results
+    finally:
+        shutil.rmtree(tmpDir)
+
+def compareResults(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare results against a baseline.
+    @return list of regression descriptions
+    """
+
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        new, old = results[name], baseline[name]
+        for key in ('items_per_sec', 'mb_per_sec'):
+            if new[key] < old[key] * (1 - tolerance):
+                regressions.append('%s: %s dropped from %.1f to %.1f' %
+                                   (name, key, old[key], new[key]))
+        if new['peak_rss_kb'] > old['peak_rss_kb'] * (1 + tolerance):
+            regressions.append('%s: peak_rss_kb grew from %d to %d' %
+                               (name, old['peak_rss_kb'],
+                                new['peak_rss_kb']))
+    return regressions
+
+def formatResults(results):
+    lines = [ '%-18s %10s %12s %10s %12s' % ('benchmark', 'items',
+              'items/sec', 'MB/sec', 'peak RSS kB') ]
+    for methodName, _ in BENCHMARKS:
+        r = results[methodName]
+        lines.append('%-18s %10d %12.1f %10.2f %12d' % (methodName,
+                     r['count'], r['items_per_sec'], r['mb_per_sec'],
+                     r['peak_rss_kb']))
+    return '\n'.join(lines)
+
+def _timePerCall(func, iterations):
+    """
+    @return microseconds per call of func
+    """
+
+    start = time.time()
+    for _ in xrange(iterations):
+        func()
+    return (time.time() - start) / iterations * 1e6
+
+def _newPackage():
+    return packagexml._Package()
+
+def _newPackageWalkingMro():
+    # SlotNode.__init__ before slot names were compiled per class
+    node = packagexml._Package.__new__(packagexml._Package)
+    for cls in node.__class__.__mro__:
+        if hasattr(cls, '__slots__'):
+            for attr in cls.__slots__:
+                setattr(node, attr, None)
+    xmllib.BaseNode.__init__(node)
+    return node
+
+def _newPatchParser():
+    return patchxml.PatchXml(None, 'repodata/patch.xml')
+
+def _newPatchParserUncached():
+    # Parser setup before type registries were shared between instances
+    xmlcommon.XmlFileParser._registries.clear()
+    return patchxml.PatchXml(None, 'repodata/patch.xml')
+
+class _PackageChildren(xmllib.BaseNode):
+    """
+    Keeps the children of a package element instead of handling them.
+    """
+
+    WillYield = True
+
+def _getPackageChildren():
+    """
+    @return child nodes of one generated package element
+    """
+
+    workDir = tempfile.mkdtemp(prefix='repodata-bench-')
+    try:
+        RepositoryGenerator(packages=1).generate(workDir)
+        client = repomd.Client(workDir)
+        fobj = client.repomdXml.getRepoData('primary')._parser._open()
+        scanner = lazyxml.FragmentScanner(fobj, 'package')
+        fragment = iter(scanner).next()
+        decoder = lazyxml.FragmentDecoder(primaryxml.PrimaryXml,
+            _PackageChildren, scanner.rootStart, scanner.rootName)
+        return list(decoder.decode(fragment).iterChildren())
+    finally:
+        shutil.rmtree(workDir)
+
+_packageChildren = []
+
+def _dispatchChildren():
+    pkg = packagexml._Package()
+    for child in _packageChildren:
+        pkg.addChild(child)
+
+def _addChildChained(pkg, child):
+    # _Package.addChild before it dispatched through _childHandlers and
+    # _formatHandlers
+    n = child.getName()
+    if n == 'name':
+        pkg.name = child.finalize()
+    elif n == 'arch':
+        pkg.arch = child.finalize()
+    elif n == 'version':
+        pkg.epoch = child.getAttribute('epoch')
+        pkg.version = child.getAttribute('ver')
+        pkg.release = child.getAttribute('rel')
+    elif n == 'checksum':
+        pkg.checksum = child.finalize()
+        pkg.checksumType = child.getAttribute('type')
+        if child.getAttribute('pkgid') == 'YES':
+            pkg.pkgid = pkg.checksum
+    elif n == 'summary':
+        pkg.summary = child.finalize()
+    elif n == 'description':
+        pkg.description = child.finalize()
+    elif n == 'packager':
+        pkg.packager = child.finalize()
+    elif n == 'url':
+        pkg.url = child.finalize()
+    elif n == 'time':
+        pkg.fileTimestamp = child.getAttribute('file')
+        pkg.buildTimestamp = child.getAttribute('build')
+    elif n == 'size':
+        pkg.packageSize = child.getAttribute('package')
+        pkg.installedSize = child.getAttribute('installed')
+        pkg.archiveSize = child.getAttribute('archive')
+    elif n == 'location':
+        pkg.location = child.getAttribute('href')
+    elif n == 'file':
+        if pkg.files is None:
+            pkg.files = []
+        pkg.files.append(packagexml._File(child.getText(),
+            type=child.getAttribute('type')))
+    elif n == 'format':
+        formatNodes = []
+        for node in child.iterChildren():
+            nn = node.getName()
+            if nn == 'rpm:license':
+                pkg.license = node.getText()
+            elif nn == 'rpm:vendor':
+                pkg.vendor = node.getText()
+            elif nn == 'rpm:group':
+                pkg.group = node.getText()
+            elif nn == 'rpm:buildhost':
+                pkg.buildhost = node.getText()
+            elif nn == 'rpm:sourcerpm':
+                pkg.sourcerpm = node.getText()
+            elif nn == 'rpm:header-range':
+                pkg.headerStart = node.getAttribute('start')
+                pkg.headerEnd = node.getAttribute('end')
+            elif nn in ('rpm:provides', 'rpm:requires', 'rpm:obsoletes',
+                    'rpm:recommends', 'rpm:conflicts', 'suse:freshens',
+                    'rpm:enhances', 'rpm:supplements', 'rpm:suggests'):
+                formatNodes.append(node)
+            elif nn != 'file':
+                raise packagexml.UnknownElementError(node)
+    elif n == 'suse:license-to-confirm':
+        pkg.licenseToConfirm = child.finalize()
+    elif n != 'pkgfiles':
+        raise packagexml.UnknownElementError(child)
+
+def _dispatchChildrenChained():
+    pkg = packagexml._Package()
+    for child in _packageChildren:
+        _addChildChained(pkg, child)
+
+MICRO_BENCHMARKS = (
+    ('package node', _newPackage, _newPackageWalkingMro),
+    ('patch parser', _newPatchParser, _newPatchParserUncached),
+    ('package children', _dispatchChildren, _dispatchChildrenChained),
+)
+
+def runMicroBenchmarks(iterations=20000):
+    """
+    @return list of (name, usec per call, usec per call of the uncompiled
+    implementation)
+    """
+
+    if not _packageChildren:
+        _packageChildren.extend(_getPackageChildren())
+
+    results = []
+    for name, func, reference in MICRO_BENCHMARKS:
+        # Warm up caches
+        func()
+        results.append((name, _timePerCall(func, iterations),
+                        _timePerCall(reference, iterations)))
+    return results
+
+def formatMicroResults(results):
+    lines = [ '%-18s %12s %14s %8s' % ('microbenchmark', 'usec/call',
+              'uncompiled', 'speedup') ]
+    for name, compiled, reference in results:
+        lines.append('%-18s %12.2f %14.2f %7.1fx' % (name, compiled,
+                     reference, reference / max(compiled, 1e-9)))
+    return '\n'.join(lines)
+
+def main(args=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--packages', type='int', default=5000)
+    parser.add_option('--files', type='int', default=20)
+    parser.add_option('--dependencies', type='int', default=20)
+    parser.add_option('--updates', type='int', default=1000)
+    parser.add_option('--patches', type='int', default=200)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--baseline', help='compare against this baseline')
+    parser.add_option('--save-baseline', dest='saveBaseline',
+                      help='store results as a baseline')
+    parser.add_option('--tolerance', type='float', default=TOLERANCE)
+    parser.add_option('--micro', action='store_true',
+                      help='run node construction microbenchmarks')
+    options, _ = parser.parse_args(args)
+
+    if options.micro:
+        print formatMicroResults(runMicroBenchmarks())
+        return 0
+
+    generator = RepositoryGenerator(packages=options.packages,
+        files=options.files, dependencies=options.dependencies,
+        updates=options.updates, patches=options.patches, seed=options.seed)
+    results = runBenchmarks(generator)
+    print formatResults(results)
+
+    if options.saveBaseline:
+        json.dump(results, open(options.saveBaseline, 'w'), indent=2,
+                  sort_keys=True)
+
+    if options.baseline:
+        baseline = json.load(open(options.baseline))
+        regressions = compareResults(results, baseline, options.tolerance)
+        for regression in regressions:
+            print 'REGRESSION: %s' % regression
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import shutil
+import tempfile
+import threading
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import instrument
+from repodata_test.generator import RepositoryGenerator
+from repodata_test.httpserver import RepositoryServer
+
+THREADS = 16
+ROUNDS = 3
+
+
+def _summarize(client):
+    """
+    Read everything through one client.
+    @return comparable summary of the results
+    """
+
+    return (
+        sorted((x.name, x.version, x.checksum, len(x.format or ()))
+               for x in client.getPackageDetail()),
+        sorted((x.name, x.version, x.checksum, x.summary)
+               for x in client.getPackageDetail(lazy=True)),
+        sorted((x.pkgid, len(x.files)) for x in client.getFileLists()),
+        sorted((x.id, len(x.pkglist)) for x in client.getUpdateInfo()),
+        sorted((x.name, x.version, len(x.packages))
+               for x in client.getPatchDetail()),
+    )
+
+
+class ConcurrencyTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        RepositoryGenerator(packages=30).generate(self.workDir)
+        self.server = RepositoryServer(self.workDir).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def testSharedClient(self):
+        expected = _summarize(repomd.Client(self.server.url))
+        self.failUnlessEqual(len(expected[0]), 30)
+        del self.server.requests[:]
+
+        metrics = instrument.CollectingSink()
+        client = repomd.Client(self.server.url, metrics=metrics)
+        results = []
+        errors = []
+        start = threading.Event()
+
+        def run():
+            start.wait()
+            try:
+                for _ in range(ROUNDS):
+                    results.append(_summarize(client))
+            except Exception, e:
+                errors.append(e)
+                raise
+
+        threads = [ threading.Thread(target=run) for _ in range(THREADS) ]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.failUnlessEqual(errors, [])
+        self.failUnlessEqual(len(results), THREADS * ROUNDS)
+        for result in results:
+            self.failUnlessEqual(result, expected)
+
+        # repomd.xml was fetched once for all threads
+        self.failUnlessEqual(len([ x for x in self.server.requests
+                                   if x.endswith('repomd.xml') ]), 1)
+        self.failUnlessEqual(metrics.nodes['Package'], THREADS * ROUNDS * 30)
+        self.failUnlessEqual(metrics.nodes['_PackageFL'],
+            THREADS * ROUNDS * 30)
+
+    def testDataBinderPool(self):
+        client = repomd.Client(self.workDir)
+        parser = client.repomdXml.getRepoData('primary')._parser
+        first = parser._getDataBinder()
+        parser._releaseDataBinder(first)
+        # A parse read to the end hands its databinder back for the next
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 30)
+        self.failUnless(parser._getDataBinder() is first)
+        self.failIf(parser._getDataBinder() is first)
+
+        # A parse that is not finished keeps its databinder
+        parser._releaseDataBinder(first)
+        packages = iter(client.getPackageDetail())
+        packages.next()
+        self.failIf(parser._getDataBinder() is first)
@@ -0,0 +1,186 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import httplib
+import hashlib
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import packagexml
+from repodata.repomd.downloader import BulkDownloader
+from repodata.repomd.repository import Repository
+from repodata_test.httpserver import RepositoryServer
+
+
+class DownloaderTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        self.srcDir = os.path.join(self.workDir, 'src')
+        self.destDir = os.path.join(self.workDir, 'dest')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _addPackage(self, location, contents, checksumType='sha256'):
+        path = os.path.join(self.srcDir, location)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        file(path, 'w').write(contents)
+        pkg = packagexml._Package()
+        pkg.location = location
+        pkg.checksumType = checksumType
+        algorithm = checksumType == 'sha' and 'sha1' or checksumType
+        pkg.checksum = hashlib.new(algorithm, contents).hexdigest()
+        return pkg
+
+    def testDownloadPackages(self):
+        pkgs = [ self._addPackage('Packages/pkg%d.rpm' % i, 'rpm %d' % i * i)
+                 for i in range(1, 6) ]
+        pkgs.append(self._addPackage('Packages/old.rpm', 'old', 'sha'))
+
+        corrupt = self._addPackage('Packages/corrupt.rpm', 'corrupt')
+        corrupt.checksum = '0' * 64
+        missing = packagexml._Package()
+        missing.location = 'Packages/missing.rpm'
+        missing.checksum = '0' * 64
+        missing.checksumType = 'sha256'
+
+        # One file is already up to date
+        os.makedirs(os.path.join(self.destDir, 'Packages'))
+        shutil.copy(os.path.join(self.srcDir, 'Packages/pkg1.rpm'),
+            os.path.join(self.destDir, 'Packages/pkg1.rpm'))
+
+        client = repomd.Client(self.srcDir)
+        report = client.downloadPackages(pkgs + [ corrupt, missing ],
+            self.destDir, maxWorkers=3)
+
+        self.failUnlessEqual(report.skipped, [ 'Packages/pkg1.rpm' ])
+        self.failUnlessEqual(sorted(report.downloaded),
+            sorted(x.location for x in pkgs[1:]))
+        self.failUnlessEqual(sorted(x[0] for x in report.failed),
+            [ 'Packages/corrupt.rpm', 'Packages/missing.rpm' ])
+        self.failUnlessEqual(report.bytes,
+            sum(len('rpm %d' % i * i) for i in range(2, 6)) + 3)
+        self.failUnless(report.throughput > 0)
+
+        for pkg in pkgs:
+            self.failUnlessEqual(
+                file(os.path.join(self.destDir, pkg.location)).read(),
+                file(os.path.join(self.srcDir, pkg.location)).read())
+        # Nothing is left behind for failed files
+        self.failUnlessEqual(sorted(os.listdir(
+            os.path.join(self.destDir, 'Packages'))),
+            sorted(os.path.basename(x.location) for x in pkgs))
+
+        report = client.downloadPackages(pkgs, self.destDir)
+        self.failUnlessEqual(len(report.skipped), len(pkgs))
+        self.failUnlessEqual(report.downloaded, [])
+
+    def testOutsideLocation(self):
+        pkg = self._addPackage('pkg.rpm', 'rpm')
+        pkg.location = '../pkg.rpm'
+        report = repomd.Client(self.srcDir).downloadPackages([ pkg ],
+            self.destDir)
+        self.failUnlessEqual([ x[0] for x in report.failed ],
+            [ '../pkg.rpm' ])
+
+    def testUnverified(self):
+        # Without a checksum files are downloaded and never skipped
+        pkg = self._addPackage('pkg.rpm', 'rpm')
+        pkg.checksum = None
+        missing = packagexml._Package()
+        missing.location = 'missing.rpm'
+        client = repomd.Client(self.srcDir)
+        report = client.downloadPackages([ pkg, missing ], self.destDir)
+        self.failUnlessEqual(report.downloaded, [ 'pkg.rpm' ])
+        self.failUnlessEqual([ x[0] for x in report.failed ],
+            [ 'missing.rpm' ])
+        report = client.downloadPackages([ pkg ], self.destDir)
+        self.failUnlessEqual(report.downloaded, [ 'pkg.rpm' ])
+        self.failUnlessEqual(report.skipped, [])
+
+    def testUnexpectedError(self):
+        pkgs = [ self._addPackage('pkg%d.rpm' % i, 'rpm') for i in range(4) ]
+
+        class BrokenRepository(Repository):
+            def open(slf, fileName):
+                if fileName == 'pkg2.rpm':
+                    raise httplib.IncompleteRead('rp')
+                return Repository.open(slf, fileName)
+
+        downloader = BulkDownloader(BrokenRepository(self.srcDir),
+            maxWorkers=2)
+        report = downloader.download(pkgs, self.destDir)
+        self.failUnlessEqual(sorted(report.downloaded),
+            [ 'pkg0.rpm', 'pkg1.rpm', 'pkg3.rpm' ])
+        self.failUnlessEqual([ x[0] for x in report.failed ], [ 'pkg2.rpm' ])
+
+    def testBoundedQueue(self):
+        pkgs = [ self._addPackage('pkg%d.rpm' % i, 'rpm') for i in range(40) ]
+        opened = []
+        produced = []
+
+        class CountingRepository(Repository):
+            def open(slf, fileName):
+                opened.append(fileName)
+                return Repository.open(slf, fileName)
+
+        def iterPackages():
+            for pkg in pkgs:
+                # Workers and the queue hold at most this many packages
+                self.failUnless(len(produced) - len(opened) <= 2 * 2 + 2)
+                produced.append(pkg)
+                yield pkg
+
+        downloader = BulkDownloader(CountingRepository(self.srcDir),
+            maxWorkers=2)
+        report = downloader.download(iterPackages(), self.destDir)
+        self.failUnlessEqual(len(report.downloaded), 40)
+
+    def testUmask(self):
+        pkg = self._addPackage('pkg.rpm', 'rpm')
+        umask = os.umask(027)
+        try:
+            report = repomd.Client(self.srcDir).downloadPackages([ pkg ],
+                self.destDir)
+        finally:
+            os.umask(umask)
+        self.failUnlessEqual(report.downloaded, [ 'pkg.rpm' ])
+        self.failUnlessEqual(
+            os.stat(os.path.join(self.destDir, 'pkg.rpm')).st_mode & 0777,
+            0640)
+
+    def testMirrors(self):
+        pkgs = [ self._addPackage('pkg%d.rpm' % i, 'rpm') for i in range(8) ]
+        server = RepositoryServer(self.srcDir, delay=0.02).start()
+        try:
+            file(os.path.join(self.srcDir, 'mirrors.txt'), 'w').write(
+                server.url + '\n')
+            client = repomd.Client(server.url,
+                mirrorList=server.url + '/mirrors.txt')
+            fetched = server.requests.count('/mirrors.txt')
+            report = client.downloadPackages(pkgs, self.destDir,
+                maxWorkers=6, maxPerHost=2)
+        finally:
+            server.stop()
+        self.failUnlessEqual(len(report.downloaded), 8)
+        # The mirror list is fetched once, not by every worker
+        self.failUnlessEqual(server.requests.count('/mirrors.txt'),
+            fetched + 1)
@@ -0,0 +1,90 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import instrument
+from repodata.repomd.fileliststore import FileListStore
+from repodata_test.generator import RepositoryGenerator
+
+
+class FileListStoreTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        self.first = os.path.join(self.workDir, 'first')
+        self.second = os.path.join(self.workDir, 'second')
+        RepositoryGenerator(packages=5, files=3).generate(self.first)
+        RepositoryGenerator(packages=8, files=3).generate(self.second)
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    @classmethod
+    def _describe(cls, pkgs):
+        return [ (x.pkgid, x.getNevra(), x.files is None,
+                  [ (f.name, f.type) for f in x.files or () ])
+                 for x in pkgs ]
+
+    def testSharedFileLists(self):
+        store = FileListStore()
+        first = list(repomd.Client(self.first,
+            fileListStore=store).getFileLists())
+        self.failUnlessEqual(len(store), 5)
+        second = list(repomd.Client(self.second,
+            fileListStore=store).getFileLists())
+        self.failUnlessEqual(len(store), 8)
+
+        self.failUnlessEqual(self._describe(first),
+            self._describe(repomd.Client(self.first).getFileLists()))
+        self.failUnlessEqual(self._describe(second),
+            self._describe(repomd.Client(self.second).getFileLists()))
+
+        # Every package is in the store now
+        self.failUnlessEqual(self._describe(repomd.Client(self.first,
+            fileListStore=store).getFileLists()), self._describe(first))
+        self.failIfEqual(first[0].getNevra()[2], None)
+
+        # Packages in both repositories share one file list
+        for pkg, other in zip(first, second):
+            self.failUnlessEqual(pkg.pkgid, other.pkgid)
+            self.failUnless(pkg.files is other.files)
+            self.failUnless(type(pkg.files) is tuple)
+        self.failIf(second[5].files is None)
+
+    def testMetrics(self):
+        metrics = instrument.CollectingSink()
+        store = FileListStore()
+        pkgs = list(repomd.Client(self.first, fileListStore=store,
+            metrics=metrics).getFileLists())
+        self.failUnlessEqual(metrics.nodes['_PackageFL'], len(pkgs))
+        self.failUnless(instrument.STAGE_PARSE in metrics.timings)
+
+    def testSaveAndLoad(self):
+        path = os.path.join(self.workDir, 'store', 'filelists')
+        store = FileListStore(path)
+        expected = self._describe(repomd.Client(self.first,
+            fileListStore=store).getFileLists())
+        store.save()
+
+        store = FileListStore(path)
+        self.failUnlessEqual(len(store), 5)
+        self.failUnlessEqual(self._describe(repomd.Client(self.first,
+            fileListStore=store).getFileLists()), expected)
@@ -0,0 +1,323 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Deterministic generator of synthetic repository metadata trees, used by the
+tests and the parse benchmarks.
+"""
+
+import os
+import gzip
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+from conary.lib import digestlib
+
+ARCHES = ('i586', 'x86_64', 'noarch')
+FLAGS = ('EQ', 'GE', 'LE', 'GT', 'LT')
+UPDATE_TYPES = ('security', 'recommended', 'optional')
+
+# All generated files use the same timestamp so the output, and therefore
+# the checksums in repomd.xml, only depend on the generator settings.
+TIMESTAMP = 1274094576
+
+
+class _DigestFile(object):
+    """
+    Write-only file wrapper computing a digest of what is written.
+    """
+
+    def __init__(self, fobj):
+        self._fobj = fobj
+        self.digest = digestlib.sha1()
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.digest.update(data)
+        self.size += len(data)
+        self._fobj.write(data)
+
+    def flush(self):
+        self._fobj.flush()
+
+    def close(self):
+        self._fobj.close()
+
+
+class RepositoryGenerator(object):
+    """
+    Generate a repodata tree with a configurable number of packages, files
+    per package, dependencies per package, updateinfo entries and patches.
+    """
+
+    def __init__(self, packages=100, files=10, dependencies=10, updates=10,
+            patches=5, seed=0):
+        self.packages = packages
+        self.files = files
+        self.dependencies = dependencies
+        self.updates = updates
+        self.patches = patches
+        self.seed = seed
+
+        self._pkgs = None
+
+    def generate(self, destDir):
+        """
+        Write the repository to destDir.
+        @return dictionary of data type to uncompressed size in bytes
+        """
+
+        rng = random.Random(self.seed)
+        self._pkgs = [ self._makePackage(rng, i)
+                       for i in range(self.packages) ]
+
+        mdDir = os.path.join(destDir, 'repodata')
+        if not os.path.isdir(mdDir):
+            os.makedirs(mdDir)
+
+        entries = []
+        entries.append(self._writeGzip(mdDir, 'primary',
+            self._iterPrimary()))
+        entries.append(self._writeGzip(mdDir, 'filelists',
+            self._iterFileLists()))
+        entries.append(self._writeGzip(mdDir, 'updateinfo',
+            self._iterUpdateInfo(rng)))
+        if self.patches:
+            entries.append(self._writePatches(mdDir, rng))
+
+        self._writeRepoMd(mdDir, entries)
+        return dict((x[0], x[5]) for x in entries)
+
+    def _makePackage(self, rng, index):
+        name = 'pkg%05d' % index
+        arch = ARCHES[index % len(ARCHES)]
+        version = '%d.%d.%d' % (rng.randint(0, 9), rng.randint(0, 20),
+                                rng.randint(0, 99))
+        release = '%d.%d' % (rng.randint(1, 200), rng.randint(1, 9))
+        digest = digestlib.sha1()
+        digest.update('%s-%s-%s.%s' % (name, version, release, arch))
+        checksum = digest.hexdigest()
+        files = [ '/usr/share/%s/file%04d' % (name, x)
+                  for x in range(self.files) ]
+        requires = [ ('pkg%05d' % rng.randint(0, max(self.packages - 1, 0)),
+                      FLAGS[rng.randint(0, len(FLAGS) - 1)],
+                      '%d.%d' % (rng.randint(0, 9), rng.randint(0, 9)))
+                     for x in range(self.dependencies) ]
+        return dict(name=name, arch=arch, version=version, release=release,
+                    checksum=checksum, files=files, requires=requires,
+                    size=rng.randint(1024, 1024 * 1024))
+
+    def _iterPrimary(self):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield ('<metadata xmlns="http://linux.duke.edu/metadata/common" '
+               'xmlns:rpm="http://linux.duke.edu/metadata/rpm" '
+               'packages="%d">\n' % len(self._pkgs))
+        for pkg in self._pkgs:
+            yield '  <package type="rpm">\n'
+            yield '    <name>%(name)s</name>\n' % pkg
+            yield '    <arch>%(arch)s</arch>\n' % pkg
+            yield ('    <version epoch="0" ver="%(version)s" '
+                   'rel="%(release)s"/>\n' % pkg)
+            yield ('    <checksum type="sha" pkgid="YES">%(checksum)s'
+                   '</checksum>\n' % pkg)
+            yield '    <summary>Synthetic package %(name)s</summary>\n' % pkg
+            yield ('    <description>%s</description>\n' %
+                   escape('Synthetic package %(name)s <%(arch)s>.\n' % pkg
+                          * 4))
+            yield '    <packager>http://example.com</packager>\n'
+            yield '    <url>http://example.com/%(name)s</url>\n' % pkg
+            yield ('    <time file="%d" build="%d"/>\n' %
+                   (TIMESTAMP, TIMESTAMP))
+            yield ('    <size package="%(size)d" installed="%(size)d" '
+                   'archive="%(size)d"/>\n' % pkg)
+            yield ('    <location href="rpm/%(arch)s/%(name)s-%(version)s-'
+                   '%(release)s.%(arch)s.rpm"/>\n' % pkg)
+            yield '    <format>\n'
+            yield '      <rpm:license>GPL</rpm:license>\n'
+            yield '      <rpm:vendor>Example</rpm:vendor>\n'
+            yield '      <rpm:group>System/Benchmark</rpm:group>\n'
+            yield '      <rpm:buildhost>build.example.com</rpm:buildhost>\n'
+            yield ('      <rpm:sourcerpm>%(name)s-%(version)s-%(release)s'
+                   '.src.rpm</rpm:sourcerpm>\n' % pkg)
+            yield '      <rpm:header-range start="360" end="4096"/>\n'
+            yield '      <rpm:provides>\n'
+            yield ('        <rpm:entry name="%(name)s" flags="EQ" epoch="0" '
+                   'ver="%(version)s" rel="%(release)s"/>\n' % pkg)
+            yield '      </rpm:provides>\n'
+            if pkg['requires']:
+                yield '      <rpm:requires>\n'
+                for name, flags, version in pkg['requires']:
+                    yield ('        <rpm:entry name="%s" flags="%s" '
+                           'epoch="0" ver="%s"/>\n' % (name, flags, version))
+                yield '      </rpm:requires>\n'
+            for fileName in pkg['files'][:1]:
+                yield '      <file>%s</file>\n' % fileName
+            yield '    </format>\n'
+            yield '  </package>\n'
+        yield '</metadata>\n'
+
+    def _iterFileLists(self):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield ('<filelists xmlns="http://linux.duke.edu/metadata/filelists" '
+               'packages="%d">\n' % len(self._pkgs))
+        for pkg in self._pkgs:
+            yield ('  <package pkgid="%(checksum)s" name="%(name)s" '
+                   'arch="%(arch)s">\n' % pkg)
+            yield ('    <version epoch="0" ver="%(version)s" '
+                   'rel="%(release)s"/>\n' % pkg)
+            for fileName in pkg['files']:
+                yield '    <file>%s</file>\n' % fileName
+            yield '    <file type="dir">/usr/share/%(name)s</file>\n' % pkg
+            yield '  </package>\n'
+        yield '</filelists>\n'
+
+    def _iterUpdateInfo(self, rng):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield ('<updates xmlns="http://novell.com/package/metadata/suse/'
+               'updateinfo">\n')
+        for i in range(self.updates):
+            updateType = UPDATE_TYPES[i % len(UPDATE_TYPES)]
+            yield ('  <update status="stable" from="maint@example.com" '
+                   'type="%s" version="%d">\n' % (updateType, i))
+            yield '    <id>update-%05d</id>\n' % i
+            yield '    <title>%s update %d</title>\n' % (updateType, i)
+            yield '    <release>Synthetic</release>\n'
+            yield '    <issued date="%d"/>\n' % (TIMESTAMP + i * 3600)
+            yield '    <references>\n'
+            yield ('      <reference href="http://example.com/%d" id="%d" '
+                   'title="bug number %d" type="bugzilla"/>\n' % (i, i, i))
+            yield ('      <reference href="http://example.com/CVE-2010-%04d" '
+                   'id="CVE-2010-%04d" title="CVE-2010-%04d" type="cve"/>\n'
+                   % (i, i, i))
+            yield '    </references>\n'
+            yield '    <description>Fixes issue %d.</description>\n' % i
+            yield '    <pkglist>\n'
+            yield '      <collection>\n'
+            for pkg in rng.sample(self._pkgs, min(3, len(self._pkgs))):
+                yield ('        <package name="%(name)s" arch="%(arch)s" '
+                       'version="%(version)s" release="%(release)s">\n'
+                       % pkg)
+                yield ('          <filename>%(name)s-%(version)s-%(release)s'
+                       '.%(arch)s.rpm</filename>\n' % pkg)
+                yield '        </package>\n'
+            yield '      </collection>\n'
+            yield '    </pkglist>\n'
+            yield '  </update>\n'
+        yield '</updates>\n'
+
+    def _iterPatch(self, patchId, index, pkgs):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield ('<patch xmlns="http://novell.com/package/metadata/suse/patch" '
+               'xmlns:yum="http://linux.duke.edu/metadata/common" '
+               'xmlns:rpm="http://linux.duke.edu/metadata/rpm" '
+               'xmlns:suse="http://novell.com/package/metadata/suse/common" '
+               'patchid=%s timestamp="%d" engine="1.0">\n'
+               % (quoteattr(patchId), TIMESTAMP))
+        yield '  <yum:name>%s</yum:name>\n' % patchId
+        yield '  <summary lang="en">Synthetic patch %d</summary>\n' % index
+        yield ('  <description lang="en">Fixes issue %d.</description>\n'
+               % index)
+        yield '  <yum:version ver="%d" rel="0"/>\n' % (index + 1000)
+        yield '  <rpm:requires>\n'
+        for pkg in pkgs:
+            yield ('    <rpm:entry kind="atom" name="%(name)s" epoch="0" '
+                   'ver="%(version)s" rel="%(release)s" flags="EQ"/>\n' % pkg)
+        yield '  </rpm:requires>\n'
+        yield '  <category>recommended</category>\n'
+        yield '  <atoms>\n'
+        for pkg in pkgs:
+            yield ('    <package '
+                   'xmlns="http://linux.duke.edu/metadata/common" '
+                   'type="rpm">\n')
+            yield '      <name>%(name)s</name>\n' % pkg
+            yield '      <arch>%(arch)s</arch>\n' % pkg
+            yield ('      <version epoch="0" ver="%(version)s" '
+                   'rel="%(release)s"/>\n' % pkg)
+            yield ('      <checksum type="sha" pkgid="YES">%(checksum)s'
+                   '</checksum>\n' % pkg)
+            yield ('      <location href="rpm/%(arch)s/%(name)s-%(version)s-'
+                   '%(release)s.%(arch)s.rpm"/>\n' % pkg)
+            yield '    </package>\n'
+        yield '  </atoms>\n'
+        yield '</patch>\n'
+
+    def _writeGzip(self, mdDir, dataType, lines):
+        fileName = '%s.xml.gz' % dataType
+        path = os.path.join(mdDir, fileName)
+        raw = open(path, 'wb')
+        packed = _DigestFile(raw)
+        opened = _DigestFile(gzip.GzipFile(fileName, 'wb', 9, packed,
+                                           mtime=TIMESTAMP))
+        for line in lines:
+            opened.write(line)
+        opened.close()
+        raw.close()
+        return (dataType, 'repodata/%s' % fileName,
+                packed.digest.hexdigest(), opened.digest.hexdigest(),
+                packed.size, opened.size)
+
+    def _writePlain(self, mdDir, fileName, lines):
+        fobj = _DigestFile(open(os.path.join(mdDir, fileName), 'wb'))
+        for line in lines:
+            fobj.write(line)
+        fobj.close()
+        return fobj
+
+    def _writePatches(self, mdDir, rng):
+        patchEntries = []
+        totalSize = 0
+        for i in range(self.patches):
+            patchId = 'synthetic-%05d' % i
+            fileName = 'patch-%s.xml' % patchId
+            pkgs = rng.sample(self._pkgs, min(2, len(self._pkgs)))
+            fobj = self._writePlain(mdDir, fileName,
+                self._iterPatch(patchId, i, pkgs))
+            totalSize += fobj.size
+            patchEntries.append((patchId, fobj.digest.hexdigest(),
+                                 'repodata/%s' % fileName))
+
+        lines = [ '<?xml version="1.0" encoding="UTF-8"?>\n',
+                  '<patches xmlns="http://novell.com/package/metadata/suse/'
+                  'patches">\n' ]
+        for patchId, checksum, location in patchEntries:
+            lines.append('  <patch id="%s">\n' % patchId)
+            lines.append('    <checksum type="sha">%s</checksum>\n'
+                         % checksum)
+            lines.append('    <location href="%s"/>\n' % location)
+            lines.append('  </patch>\n')
+        lines.append('</patches>\n')
+
+        fobj = self._writePlain(mdDir, 'patches.xml', lines)
+        checksum = fobj.digest.hexdigest()
+        return ('patches', 'repodata/patches.xml', checksum, checksum,
+                fobj.size, totalSize + fobj.size)
+
+    def _writeRepoMd(self, mdDir, entries):
+        lines = [ '<?xml version="1.0"?>\n', '<repomd>\n' ]
+        for dataType, location, checksum, openChecksum, _, _ in entries:
+            lines.append('  <data type="%s">\n' % dataType)
+            lines.append('    <location href="%s"/>\n' % location)
+            lines.append('    <checksum type="sha">%s</checksum>\n'
+                         % checksum)
+            lines.append('    <timestamp>%d</timestamp>\n' % TIMESTAMP)
+            lines.append('    <open-checksum type="sha">%s</open-checksum>\n'
+                         % openChecksum)
+            lines.append('  </data>\n')
+        lines.append('</repomd>\n')
+        self._writePlain(mdDir, 'repomd.xml', lines)
@@ -0,0 +1,76 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata_test import benchmark
+from repodata_test.generator import RepositoryGenerator
+
+
+class GeneratorTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def testGenerate(self):
+        gen = RepositoryGenerator(packages=7, files=3, dependencies=4,
+            updates=5, patches=2)
+        gen.generate(self.workDir)
+        client = repomd.Client(self.workDir)
+
+        pkgs = [ x for x in client.getPackageDetail() ]
+        self.failUnlessEqual(len(pkgs), 7)
+        self.failUnlessEqual(pkgs[0].name, 'pkg00000')
+        requires = [ x for x in pkgs[0].format
+                     if x.getName() == 'rpm:requires' ][0]
+        self.failUnlessEqual(len(requires.getChildren('entry', 'rpm')), 4)
+
+        fileLists = [ x for x in client.getFileLists() ]
+        self.failUnlessEqual([ x.pkgid for x in fileLists ],
+            [ x.pkgid for x in pkgs ])
+        self.failUnlessEqual(len(fileLists[0].files), 4)
+
+        self.failUnlessEqual(len([ x for x in client.getUpdateInfo() ]), 5)
+        self.failUnlessEqual(len(client.getPatchDetail()), 2)
+
+    def testDeterministic(self):
+        first = os.path.join(self.workDir, 'first')
+        second = os.path.join(self.workDir, 'second')
+        RepositoryGenerator(packages=5, seed=3).generate(first)
+        RepositoryGenerator(packages=5, seed=3).generate(second)
+        self.failUnlessEqual(
+            file(os.path.join(first, 'repodata', 'repomd.xml')).read(),
+            file(os.path.join(second, 'repodata', 'repomd.xml')).read())
+
+    def testCompareResults(self):
+        baseline = dict(getPackageDetail=dict(items_per_sec=1000.0,
+            mb_per_sec=10.0, peak_rss_kb=10000))
+        results = dict(getPackageDetail=dict(items_per_sec=950.0,
+            mb_per_sec=9.5, peak_rss_kb=10500))
+        self.failUnlessEqual(benchmark.compareResults(results, baseline), [])
+
+        results = dict(getPackageDetail=dict(items_per_sec=500.0,
+            mb_per_sec=5.0, peak_rss_kb=20000))
+        self.failUnlessEqual(len(benchmark.compareResults(results,
+            baseline)), 3)
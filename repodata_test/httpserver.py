@@ -0,0 +1,98 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Local HTTP server standing in for a remote repository or mirror in tests.
+"""
+
+import os
+import time
+import shutil
+import urllib
+import threading
+import SocketServer
+import BaseHTTPServer
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server.owner
+        server.requests.append(self.path)
+        if server.delay:
+            time.sleep(server.delay)
+        if server.errorCode is not None:
+            self.send_error(server.errorCode)
+            return
+
+        path = os.path.join(server.rootDir,
+            urllib.unquote(self.path.split('?', 1)[0]).lstrip('/'))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        fobj = open(path, 'rb')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(os.fstat(
+                fobj.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(fobj, self.wfile)
+        finally:
+            fobj.close()
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class RepositoryServer(object):
+    """
+    Serve the files below rootDir on a free local port from a background
+    thread.
+    @ivar delay: seconds to wait before answering each request
+    @ivar errorCode: if set, answer every request with this error
+    @ivar requests: paths of the requests received so far
+    """
+
+    def __init__(self, rootDir, delay=0, errorCode=None):
+        self.rootDir = rootDir
+        self.delay = delay
+        self.errorCode = errorCode
+        self.requests = []
+
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.owner = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+            kwargs=dict(poll_interval=0.05))
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
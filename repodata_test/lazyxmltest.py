@@ -0,0 +1,78 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import gzip
+import os
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import lazyxml
+from repodata_test.generator import RepositoryGenerator
+
+
+class FragmentScannerTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        RepositoryGenerator(packages=20, files=2).generate(self.workDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _scan(self, bufferSize):
+        fobj = gzip.GzipFile(os.path.join(self.workDir, 'repodata',
+            'primary.xml.gz'))
+        scanner = lazyxml.FragmentScanner(fobj, 'package')
+        scanner.BUFFER_SIZE = bufferSize
+        return scanner, [ x for x in scanner ]
+
+    def testBufferBoundaries(self):
+        scanner, expected = self._scan(1024 * 1024)
+        self.failUnlessEqual(len(expected), 20)
+        self.failUnless(scanner.rootStart.startswith('<metadata xmlns='))
+        self.failUnlessEqual(scanner.rootName, 'metadata')
+        for bufferSize in (1, 7, 64, 1000):
+            self.failUnlessEqual(self._scan(bufferSize)[1], expected)
+
+        for fragment in expected:
+            self.failUnless(fragment.startswith('<package type="rpm">'))
+            self.failUnless(fragment.endswith('</package>'))
+
+    def testText(self):
+        self.failUnlessEqual(lazyxml.parseText('caf&#233; &#x2f;usr '
+            '&amp;#233; &lt;&gt;&quot;&apos; &#x1F600;'),
+            'caf\xc3\xa9 /usr &#233; <>"\' \xf0\x9f\x98\x80')
+        self.failUnless(type(lazyxml.parseText('caf\xc3\xa9')) is str)
+        self.failUnlessEqual(lazyxml.parseAttributes(
+            'ver="1&#46;0" rel=\'2&amp;3\''), dict(ver='1.0', rel='2&3'))
+
+    def testLazyPackages(self):
+        client = repomd.Client(self.workDir)
+        parsed = [ x for x in client.getPackageDetail() ]
+        lazy = [ x for x in client.getPackageDetail(lazy=True) ]
+        # What the downloader and the verifier read does not decode
+        self.failUnlessEqual(
+            [ (x.location, x.packageSize, x.checksum) for x in lazy ],
+            [ (x.location, x.packageSize, x.checksum) for x in parsed ])
+        self.failIf([ x for x in lazy if x._fragment is None ])
+        for attr in ('name', 'epoch', 'version', 'release', 'arch',
+                'location', 'summary', 'description', 'packageSize',
+                'sourcerpm', 'headerStart', 'url'):
+            self.failUnlessEqual([ getattr(x, attr) for x in lazy ],
+                [ getattr(x, attr) for x in parsed ])
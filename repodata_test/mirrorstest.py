@@ -0,0 +1,215 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import shutil
+import httplib
+import tempfile
+import StringIO
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import mirrors
+from repodata.repomd.repository import Repository
+from repodata_test.generator import RepositoryGenerator
+from repodata_test.httpserver import RepositoryServer
+
+METALINK = """\
+<?xml version="1.0" encoding="utf-8"?>
+<metalink version="3.0" xmlns="http://www.metalinker.org/">
+ <files>
+  <file name="repomd.xml">
+   <resources maxconnections="1">
+    <url protocol="http" preference="90">%s/repodata/repomd.xml</url>
+    <url protocol="rsync" preference="100">rsync://example.com/repo</url>
+    <url protocol="http" preference="100">%s/repodata/repomd.xml</url>
+   </resources>
+  </file>
+ </files>
+</metalink>
+"""
+
+
+class MirrorsTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        self.repoDir = os.path.join(self.workDir, 'repo')
+        RepositoryGenerator(packages=5).generate(self.repoDir)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _startServer(self, **kwargs):
+        server = RepositoryServer(self.repoDir, **kwargs).start()
+        self.servers.append(server)
+        return server
+
+    def _writeList(self, name, contents):
+        file(os.path.join(self.repoDir, name), 'w').write(contents)
+
+    def testParseMirrorList(self):
+        urls = mirrors.parseMirrorList(StringIO.StringIO(
+            '# comment\n\nhttp://a.example.com/repo/\n'
+            'ftp://b.example.com/repo/repodata/repomd.xml\n'
+            'rsync://c.example.com/repo\n'))
+        self.failUnlessEqual(urls, [ 'http://a.example.com/repo',
+            'ftp://b.example.com/repo' ])
+
+    def testParseMetalink(self):
+        urls = mirrors.parseMetalink(StringIO.StringIO(METALINK % (
+            'http://a.example.com', 'http://b.example.com')))
+        self.failUnlessEqual(urls, [ 'http://b.example.com',
+            'http://a.example.com' ])
+
+    def testFailover(self):
+        dead = self._startServer(errorCode=500)
+        good = self._startServer()
+        self._writeList('mirrorlist', '%s\n%s\n' % (dead.url, good.url))
+
+        client = repomd.Client('http://127.0.0.1:1/unused',
+            mirrorList=good.url + '/mirrorlist')
+        registry = client.getRepos()._storage.registry
+
+        start = time.time()
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 5)
+        self.failUnless(time.time() - start < 5)
+
+        self.failUnlessEqual(registry.getStats(dead.url).failures, 1)
+        self.failUnlessEqual(registry.getStats(good.url).successes, 2)
+        self.failIf(registry.getStats(good.url).throughput is None)
+        # The failed mirror is not asked again, the unmeasured repository
+        # url is tried once it ranks first and fails as well
+        self.failUnlessEqual(len(dead.requests), 1)
+        self.failUnlessEqual(client.getRepos().getMirrors(), [ good.url,
+            dead.url, 'http://127.0.0.1:1/unused' ])
+
+    def testRankingIsShared(self):
+        slow = self._startServer(delay=0.2)
+        fast = self._startServer()
+        self._writeList('metalink', METALINK % (fast.url, slow.url))
+
+        # Both mirrors are measured once, the fast one is preferred after
+        client = repomd.Client(slow.url, metalink=fast.url + '/metalink')
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 5)
+        self.failUnlessEqual(client.getRepos().getMirrors()[0], fast.url)
+
+        # A new client starts out with the shared measurements
+        del fast.requests[:], slow.requests[:]
+        client = repomd.Client(slow.url, metalink=fast.url + '/metalink')
+        self.failUnlessEqual(len(list(client.getUpdateInfo())), 10)
+        self.failUnlessEqual(slow.requests, [])
+        self.failUnlessEqual(len(fast.requests), 3)
+
+    def testAllMirrorsFail(self):
+        dead = self._startServer(errorCode=503)
+        good = self._startServer()
+        self._writeList('mirrorlist', '%s\n' % dead.url)
+        client = repomd.Client(dead.url, mirrorList=good.url + '/mirrorlist')
+        self.failUnlessRaises(repomd.DownloadError,
+            lambda: client.repomdXml)
+
+    def _getHedgedRepository(self, servers, **kwargs):
+        self._writeList('mirrorlist',
+            ''.join(x.url + '\n' for x in servers))
+        return Repository(servers[-1].url, mirrorRegistry=
+            mirrors.MirrorRegistry(), mirrorList=servers[-1].url +
+            '/mirrorlist', **kwargs)
+
+    def _readRepoMd(self):
+        return file(os.path.join(self.repoDir, 'repodata',
+            'repomd.xml')).read()
+
+    def testHedgeWins(self):
+        stalled = self._startServer(delay=1.0)
+        fast = self._startServer()
+        repo = self._getHedgedRepository([ stalled, fast ], hedgeDelay=0.05)
+
+        start = time.time()
+        self.failUnlessEqual(repo.get('repodata/repomd.xml').read(),
+            self._readRepoMd())
+        self.failUnless(time.time() - start < 0.9)
+        self.failUnlessEqual(len(stalled.requests), 1)
+        self.failUnlessEqual((repo.hedgeStats.requests,
+            repo.hedgeStats.fired, repo.hedgeStats.won), (1, 1, 1))
+
+    def testNoHedgeWhenFast(self):
+        fast = self._startServer()
+        other = self._startServer()
+        repo = self._getHedgedRepository([ fast, other ], hedgeDelay=0.5)
+        for _ in range(3):
+            self.failUnlessEqual(repo.get('repodata/repomd.xml').read(),
+                self._readRepoMd())
+        self.failUnlessEqual((repo.hedgeStats.requests,
+            repo.hedgeStats.fired, repo.hedgeStats.won), (3, 0, 0))
+        self.failUnless(len(fast.requests) + len(other.requests) == 4)
+
+    def testPackagesNotHedged(self):
+        stalled = self._startServer(delay=0.3)
+        other = self._startServer(delay=0.3)
+        self._writeList('pkg.rpm', 'rpm')
+        repo = self._getHedgedRepository([ stalled, other ], hedgeDelay=0.05)
+
+        # Only metadata is hedged, the package is requested once
+        self.failUnlessEqual(repo.get('pkg.rpm').read(), 'rpm')
+        self.failUnlessEqual(repo.hedgeStats.requests, 0)
+        self.failUnlessEqual(len([ x for x in stalled.requests +
+            other.requests if x.endswith('pkg.rpm') ]), 1)
+
+    def testClientHedgeThroughput(self):
+        fast = self._startServer()
+        self._writeList('mirrorlist', fast.url + '\n')
+        client = repomd.Client(fast.url, mirrorList=fast.url + '/mirrorlist',
+            hedgeDelay=0.5, hedgeThroughput=1024)
+        self.failUnlessEqual(client.getRepos()._storage.hedgeThroughput, 1024)
+
+    def testHedgedFailover(self):
+        dead = self._startServer(errorCode=500)
+        good = self._startServer()
+        repo = self._getHedgedRepository([ dead, good ], hedgeDelay=5)
+        start = time.time()
+        self.failUnlessEqual(repo.get('repodata/repomd.xml').read(),
+            self._readRepoMd())
+        self.failUnless(time.time() - start < 2)
+        self.failUnlessEqual(repo.hedgeStats.fired, 0)
+
+    def testHedgedErrors(self):
+        class Opener(object):
+            def open(slf, url):
+                if 'broken' in url:
+                    raise httplib.IncompleteRead('rep')
+                return StringIO.StringIO('contents')
+
+        def openHedged(urls):
+            storage = mirrors.MirrorStorage(urls, Opener(),
+                mirrors.MirrorRegistry(), hedgeDelay=5)
+            return storage.openHedged('repodata/repomd.xml')
+
+        # Any error fails over to the next mirror and is raised once no
+        # mirror is left
+        self.failUnlessEqual(openHedged([ 'http://broken',
+            'http://good' ]).read(), 'contents')
+        self.failUnlessRaises(httplib.IncompleteRead, openHedged,
+            [ 'http://broken' ])
+        self.failUnlessRaises(repomd.DownloadError, openHedged, [])
+
+    def testHedgingNeedsMirrors(self):
+        self.failUnlessEqual(Repository(self.repoDir,
+            hedgeDelay=0.1).hedgeStats, None)
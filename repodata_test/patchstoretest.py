@@ -0,0 +1,132 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import hashlib
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import repomdxml
+from repodata_test.generator import RepositoryGenerator
+
+
+class _RepoMd(repomdxml._RepoMd):
+    __slots__ = ()
+    class Package(repomdxml._RepoMd.Package):
+        __slots__ = ()
+    PackageFactory = Package
+
+
+class _RepoMdXml(repomdxml.RepoMdXml):
+    RepoMdFactory = _RepoMd
+
+
+class _Client(repomd.Client):
+    RepoMdXmlFactory = _RepoMdXml
+
+
+class PatchStoreTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        self.repoDir = os.path.join(self.workDir, 'repo')
+        self.storePath = os.path.join(self.workDir, 'store', 'patches')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _generate(self, patches):
+        if os.path.exists(self.repoDir):
+            shutil.rmtree(self.repoDir)
+        RepositoryGenerator(packages=20, patches=patches).generate(
+            self.repoDir)
+
+    def _sync(self):
+        return repomd.Client(self.repoDir).syncPatchDetail(self.storePath)
+
+    @classmethod
+    def _describe(cls, patches):
+        return [ (x.getKey(), x.rebootNeeded, x.category,
+                  [ d.name for d in x.requires or () ],
+                  [ (p.getNevra(), p.type, p.checksum) for p in x.packages ])
+                 for x in patches ]
+
+    def testSync(self):
+        self._generate(4)
+        result = self._sync()
+        self.failUnlessEqual(len(result.patches), 4)
+        self.failUnlessEqual(len(result.fetched), 4)
+        self.failUnlessEqual(result.removed, [])
+        parsed = self._describe(result.patches)
+        self.failUnlessEqual(parsed,
+            self._describe(repomd.Client(self.repoDir).getPatchDetail()))
+
+        # Nothing changed, everything comes from the store
+        mtime = os.stat(self.storePath).st_mtime
+        result = self._sync()
+        self.failUnlessEqual(result.fetched, [])
+        self.failUnlessEqual(result.removed, [])
+        self.failUnlessEqual(self._describe(result.patches), parsed)
+        self.failUnlessEqual(os.stat(self.storePath).st_mtime, mtime)
+
+        # One patch dropped from the repository
+        self._generate(3)
+        result = self._sync()
+        self.failUnlessEqual(result.fetched, [])
+        self.failUnlessEqual(result.removed,
+            [ 'repodata/patch-synthetic-00003.xml' ])
+        self.failUnlessEqual(self._describe(result.patches), parsed[:3])
+
+    def testPackageFactory(self):
+        # Stored and freshly parsed patches use the package class of the
+        # client
+        self._generate(2)
+        client = _Client(self.repoDir)
+        fresh = client.syncPatchDetail(self.storePath)
+        stored = client.syncPatchDetail(self.storePath)
+        self.failUnlessEqual(stored.fetched, [])
+        for patches in (fresh.patches, stored.patches,
+                        client.getPatchDetail()):
+            for patch in patches:
+                for pkg in patch.packages:
+                    self.failUnless(isinstance(pkg, _RepoMd.Package))
+                    self.failUnlessEqual(pkg.type, 'rpm')
+        self.failUnlessEqual(self._describe(stored.patches),
+            self._describe(fresh.patches))
+
+    def testChangedPatch(self):
+        self._generate(2)
+        self._sync()
+
+        # Rewrite a patch file and its checksum in patches.xml
+        mdDir = os.path.join(self.repoDir, 'repodata')
+        patchesPath = os.path.join(mdDir, 'patches.xml')
+        patchPath = os.path.join(mdDir, 'patch-synthetic-00001.xml')
+        data = file(patchPath).read()
+        file(patchPath, 'w').write(data.replace('Synthetic patch 1',
+            'Changed patch 1'))
+        patches = file(patchesPath).read()
+        oldSum = hashlib.sha1(data).hexdigest()
+        newSum = hashlib.sha1(file(patchPath).read()).hexdigest()
+        self.failUnless(oldSum in patches)
+        file(patchesPath, 'w').write(patches.replace(oldSum, newSum))
+
+        result = self._sync()
+        self.failUnlessEqual(result.fetched,
+            [ 'repodata/patch-synthetic-00001.xml' ])
+        self.failUnlessEqual(result.patches[1].summary, 'Changed patch 1')
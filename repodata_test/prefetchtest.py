@@ -0,0 +1,145 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd.prefetch import Future
+from repodata.repomd.repository import Repository
+from repodata_test.generator import RepositoryGenerator
+from repodata_test.httpserver import RepositoryServer
+
+
+class PrefetchTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        RepositoryGenerator(packages=10).generate(self.workDir)
+        self.server = RepositoryServer(self.workDir).start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _count(self, name):
+        return len([ x for x in self.server.requests if name in x ])
+
+    def testFuture(self):
+        self.failUnlessEqual(Future(lambda x: x + 1, 1).result(), 2)
+        future = Future(time.sleep, 1)
+        self.failIf(future.done())
+        self.failUnlessRaises(RuntimeError, future.result, 0.01)
+        self.failUnlessRaises(ZeroDivisionError,
+            Future(lambda: 1 / 0).result)
+
+    def _waitForRequests(self, *names):
+        # Up to five seconds, only a broken prefetch takes that long
+        for _ in range(100):
+            if [ x for x in names if not self._count(x) ]:
+                time.sleep(0.05)
+        return [ self._count(x) for x in names ]
+
+    def testPrefetch(self):
+        self.server.delay = 0.5
+        client = repomd.Client(self.server.url,
+            prefetch=('primary', 'updateinfo'))
+        # Both data files are requested before anybody asks for them
+        self.failUnlessEqual(self._waitForRequests('primary', 'updateinfo'),
+            [ 1, 1 ])
+        packages = list(client.getPackageDetail())
+        updates = list(client.getUpdateInfo())
+
+        self.failUnlessEqual(len(packages), 10)
+        self.failUnlessEqual(len(updates), 10)
+        self.failUnlessEqual(self._count('repomd.xml'), 1)
+        self.failUnlessEqual(self._count('primary'), 1)
+        self.failUnlessEqual(self._count('updateinfo'), 1)
+
+        # Prefetched files are used once
+        self.server.delay = 0
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 10)
+        self.failUnlessEqual(self._count('primary'), 2)
+
+    def testDigest(self):
+        client = repomd.Client(self.server.url, prefetch=('primary', ))
+        location = client.repomdXml.getRepoData('primary').location
+        # Wait for the prefetch to finish, a get() while it is still running
+        # would share its download
+        client.getRepos()._prefetched[location].result()
+        # A digest is computed on a download of its own, the prefetched
+        # file is left for the next plain get()
+        fobj = client.getRepos().get(location, computeShaDigest=True)
+        self.failUnless(fobj.sha1sum)
+        fobj.close()
+        self.failUnlessEqual(self._count('primary'), 2)
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 10)
+        self.failUnlessEqual(self._count('primary'), 2)
+
+    def testRefreshDropsPrefetched(self):
+        client = repomd.Client(self.server.url, prefetch=('primary', ))
+        client.repomdXml
+        self._waitForRequests('primary')
+        RepositoryGenerator(packages=12).generate(self.workDir)
+        self.failUnless(client.refresh())
+        self.failUnlessEqual(client.getRepos()._prefetched, {})
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 12)
+
+    def testPrefetchError(self):
+        self.server.errorCode = 404
+        client = repomd.Client(self.server.url, prefetch=('primary', ))
+        self.failUnlessRaises(repomd.DownloadError, lambda:
+            client.repomdXml)
+
+        # The next access fetches repomd.xml again
+        self.server.errorCode = None
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 10)
+
+    def _openDownloads(self):
+        ret = []
+        for fd in os.listdir('/proc/self/fd'):
+            try:
+                path = os.readlink(os.path.join('/proc/self/fd', fd))
+            except OSError:
+                continue
+            if 'mdparse' in path:
+                ret.append(path)
+        return ret
+
+    def testSnapshotHit(self):
+        class Repo(Repository):
+            PREFETCH_TTL = 0.3
+        class Client(repomd.Client):
+            RepositoryFactory = Repo
+
+        snapshotDir = os.path.join(self.workDir, 'snapshots')
+        client = Client(self.server.url, snapshotDir=snapshotDir)
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 10)
+        self.failUnlessEqual(self._count('primary'), 1)
+
+        client = Client(self.server.url, snapshotDir=snapshotDir,
+            prefetch=('primary', 'updateinfo'))
+        self.failUnlessEqual(len(list(client.getPackageDetail())), 10)
+        # primary comes from the snapshot and is not prefetched, the
+        # updateinfo nobody reads is closed after the TTL
+        self.failUnlessEqual(self._waitForRequests('updateinfo'), [ 1 ])
+        time.sleep(0.5)
+        self.failUnlessEqual(self._count('primary'), 1)
+        self.failUnlessEqual(client.getRepos()._prefetched, {})
+        self.failUnlessEqual(self._openDownloads(), [])
@@ -16,9 +16,14 @@
 
 
 import os
+import shutil
+import tarfile
+import tempfile
 from testrunner import testhelp
 from repodata import errors
 from repodata import repomd
+from repodata.repomd import instrument, lazyxml, packagexml, patchxml
+from repodata.repomd import primaryxml, storage
 from repodata_test import resources
 
 
@@ -61,6 +66,135 @@ class RepoMDTest(BaseTest):
         self.failUnlessEqual([ x.checksum for x in pkgs ], checksums)
         self.failUnlessEqual([ x.checksumType for x in pkgs ], ['sha', 'sha'])
 
+    def testPackageDependencies(self):
+        url = self.getRepositoryUrl('suse-1')
+        client = repomd.Client(url)
+        pkg = [ x for x in client.getPackageDetail() ][0]
+
+        provides = pkg.getDependencies('provides')
+        self.failUnlessEqual([ (x.name, x.flags, x.epoch, x.version,
+            x.release) for x in provides ],
+            [ ('arpwatch', 'EQ', '0', '2.1a13', '19.2') ])
+        requires = pkg.getDependencies('requires')
+        self.failUnlessEqual(len(requires), 22)
+        self.failUnlessEqual((requires[2].name, requires[2].pre),
+            ('insserv', '1'))
+        self.failUnlessEqual(pkg.getDependencies('obsoletes'), [])
+
+        # Node based view of the same data
+        self.failUnlessEqual([ x.getName() for x in pkg.format ],
+            ['rpm:provides', 'rpm:requires'])
+        self.failUnlessEqual(
+            [ x.name for x in pkg.format[1].getChildren('entry', 'rpm') ],
+            [ x.name for x in requires ])
+
+    def testPackageFormat(self):
+        fragment = '''<package type="rpm"><name>foo</name><format>
+<rpm:requires><rpm:entry name="bar" flags="GE" ver="1"/></rpm:requires>
+<rpm:provides><rpm:entry name="foo"/></rpm:provides>
+<rpm:requires><rpm:entry name="baz" pre="1"/></rpm:requires>
+<suse:freshens><suse:entry name="foo-old"/></suse:freshens>
+</format></package>'''
+        decoder = lazyxml.FragmentDecoder(primaryxml.PrimaryXml,
+            packagexml._Package, '<metadata xmlns="http://linux.duke.edu/'
+            'metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm"'
+            ' xmlns:suse="http://novell.com/package/metadata/suse/common">',
+            'metadata')
+        pkg = decoder.decode(fragment)
+
+        # Document order, repeated elements are kept apart
+        self.failUnlessEqual([ x.getName() for x in pkg.format ],
+            ['rpm:requires', 'rpm:provides', 'rpm:requires',
+             'suse:freshens'])
+        self.failUnlessEqual([ [ y.name for y in x.iterChildren() ]
+            for x in pkg.format ], [['bar'], ['foo'], ['baz'], ['foo-old']])
+        self.failUnlessEqual([ x.name for x in
+            pkg.getDependencies('requires') ], ['bar', 'baz'])
+
+        # Entries answer like the nodes they replace
+        entry = pkg.format[0].getChildren('entry', 'rpm')[0]
+        self.failUnlessEqual(entry.getName(), 'rpm:entry')
+        self.failUnlessEqual((entry.getAttribute('ver'),
+            entry.getAttribute('flags')), ('1', 'GE'))
+        self.failUnlessEqual(pkg.format[3].iterChildren().next().getName(),
+            'suse:entry')
+        self.failUnlessEqual(repr(pkg.format[1].getChildren()[0]), 'foo')
+        self.failUnlessEqual(repr(packagexml._Dependency()), 'None')
+        self.failUnlessEqual(repr(packagexml._Dependency(name=u'f\xf6\xf6')),
+            'f\xc3\xb6\xc3\xb6')
+
+        # The view can be replaced
+        pkg.format = []
+        self.failUnlessEqual(pkg.format, [])
+        self.failUnlessEqual(len(pkg.getDependencies('requires')), 2)
+
+    def testLazyPackageDetail(self):
+        url = self.getRepositoryUrl('suse-1')
+        client = repomd.Client(url)
+        parsed = [ x for x in client.getPackageDetail() ]
+        lazy = [ x for x in client.getPackageDetail(lazy=True) ]
+
+        self.failUnlessEqual([ x.getNevra() for x in lazy ],
+            [ x.getNevra() for x in parsed ])
+        self.failUnlessEqual([ (x.checksum, x.checksumType, x.pkgid,
+            x.location) for x in lazy ], [ (x.checksum, x.checksumType,
+            x.pkgid, x.location) for x in parsed ])
+        self.failUnlessEqual(lazy[0].__class__.__name__, 'LazyPackage')
+        self.failIf(lazy[0]._fragment is None)
+
+        # Heavy attributes are decoded on first access
+        self.failUnlessEqual(lazy[0].description, parsed[0].description)
+        self.failUnless(lazy[0]._fragment is None)
+        self.failUnlessEqual(lazy[0].sourcerpm, parsed[0].sourcerpm)
+        self.failUnlessEqual(
+            [ x.name for x in lazy[1].getDependencies('requires') ],
+            [ x.name for x in parsed[1].getDependencies('requires') ])
+        self.failUnlessEqual([ x.getName() for x in lazy[1].format ],
+            [ x.getName() for x in parsed[1].format ])
+
+    def testLazyPackageText(self):
+        fragment = ('<package type="rpm"><name>caf\xc3\xa9 &amp; co</name>'
+            '<arch>noarch</arch><version epoch="0" ver="1" rel="1"/>'
+            '<summary>caf\xc3\xa9</summary></package>')
+        decoder = lazyxml.FragmentDecoder(primaryxml.PrimaryXml,
+            packagexml._Package, '<metadata>', 'metadata')
+        cls = lazyxml.getLazyPackageClass(packagexml._Package)
+        first = cls(fragment, decoder)
+        second = cls(fragment, decoder)
+
+        # Light and heavy attributes are utf-8 str, like a full parse
+        self.failUnlessEqual(first.name, 'caf\xc3\xa9 & co')
+        self.failUnless(type(first.name) is str)
+        self.failUnlessEqual(first.summary, 'caf\xc3\xa9')
+        self.failUnless(type(first.summary) is str)
+
+        # The decoder is reused for the next fragment
+        self.failUnlessEqual(second.summary, first.summary)
+        self.failUnlessEqual(decoder.decode(fragment).name, first.name)
+
+    def testPackageDetailSnapshot(self):
+        url = self.getRepositoryUrl('suse-1')
+        snapshotDir = tempfile.mkdtemp(prefix='repodata-test-')
+        try:
+            client = repomd.Client(url, snapshotDir=snapshotDir)
+            parsed = [ x for x in client.getPackageDetail() ]
+            self.failUnlessEqual(os.listdir(snapshotDir),
+                ['primary-6b5cb12e54b9262f230726db3652b1ef7f7de7da.snap'])
+
+            client = repomd.Client(url, snapshotDir=snapshotDir)
+            loaded = [ x for x in client.getPackageDetail() ]
+            self.failUnlessEqual([ x.getNevra() for x in loaded ],
+                [ x.getNevra() for x in parsed ])
+            self.failUnlessEqual([ x.location for x in loaded ],
+                [ x.location for x in parsed ])
+            self.failUnlessEqual(
+                [ [ (y.getName(), [ z.name for z in y.iterChildren() ])
+                    for y in x.format ] for x in loaded ],
+                [ [ (y.getName(), [ z.name for z in y.iterChildren() ])
+                    for y in x.format ] for x in parsed ])
+        finally:
+            shutil.rmtree(snapshotDir)
+
     def testGetFileInfoDetail(self):
         url = self.getRepositoryUrl('suse-1')
         client = repomd.Client(url)
@@ -139,6 +273,58 @@ class RepoMDTest(BaseTest):
 """)
         # We don't test the second description, it's too large
 
+    def testMergePatches(self):
+        url = self.getRepositoryUrl('suse-1')
+        first = repomd.Client(url).getPatchDetail()
+        second = repomd.Client(url).getPatchDetail()
+        counts = [ len(x.packages) for x in first ]
+
+        # Drop one package from the second copy of the first patch, the
+        # merged patch still has all of them
+        second[0].packages = second[0].packages[1:]
+        second[0].packages.reverse()
+        # Add a package the first copy of the second patch does not have
+        extra = repomd.Client(url).getPatchDetail()[0].packages[0]
+        second[1].packages.append(extra)
+        self.failIf(extra.getNevra() in
+            [ x.getNevra() for x in first[1].packages ])
+
+        # Comparing patches does not merge their packages
+        self.failUnlessEqual(cmp(first[1], second[1]), 0)
+        self.failUnlessEqual(hash(first[1]), hash(second[1]))
+        self.failUnlessEqual(len(first[1].packages), counts[1])
+        self.failUnlessEqual(len(second[1].packages), counts[1] + 1)
+
+        merged = patchxml.mergePatches(first + second)
+        self.failUnlessEqual(len(merged), 2)
+        self.failUnless(merged[0] is first[0])
+        self.failUnless(merged[1] is first[1])
+        self.failUnlessEqual([ len(x.packages) for x in merged ],
+            [ counts[0], counts[1] + 1 ])
+        self.failUnless(merged[1].packages[-1] is extra)
+
+    def testMetrics(self):
+        url = self.getRepositoryUrl('suse-1')
+        sink = instrument.CollectingSink()
+        client = repomd.Client(url, metrics=sink)
+        pkgs = [ x for x in client.getPackageDetail() ]
+        self.failUnlessEqual(len(pkgs), 2)
+
+        self.failUnlessEqual(sorted(sink.timings.keys()),
+            ['decompress', 'download', 'parse'])
+        # repomd.xml plus primary.xml.gz
+        self.failUnlessEqual(sink.bytes['download'], 1180 + 1436)
+        self.failUnless(sink.bytes['decompress'] > sink.bytes['download'])
+        self.failUnlessEqual(sink.nodes['Package'], 2)
+        self.failUnlessEqual(sink.nodes['_RepoMd'], 1)
+
+        events = []
+        client = repomd.Client(url, metrics=instrument.CallbackSink(
+            lambda *args: events.append(args)))
+        [ x for x in client.getUpdateInfo() ]
+        self.failUnless(('nodes', '_Update', 'repodata/updateinfo.xml.gz', 4)
+            in events)
+
     def testDownload(self):
         # Test that file downloads work. We extrapolate that package downloads
         # work too.
@@ -167,6 +353,82 @@ class RepoMDTest(BaseTest):
             client.download, 'blahblah')
         assert 'No such file or directory' in str(e)
 
+    def testLocalDirectory(self):
+        # Plain directory paths are read in place, like file:// urls
+        path = os.path.join(self.archivePath, 'suse-1')
+        client = repomd.Client(path)
+        pkgs = [ x for x in client.getPackageDetail() ]
+        self.failUnlessEqual([ x.name for x in pkgs ], ['arpwatch', '3ddiag'])
+
+        fobj = client.download('repodata/repomd.xml', computeShaDigest=True)
+        self.failUnlessEqual(fobj.sha1sum,
+            '35e108ee39635bd35cdd0793cb22c9b1c8374857')
+        self.failUnlessEqual(len(fobj.read()), 1180)
+
+        e = self.failUnlessRaises(errors.TransportError,
+            client.download, 'blahblah')
+        assert 'No such file or directory' in str(e)
+
+        # A mistyped path is reported as such, not tried as an url
+        for url in (path + '-typo', 'file://' + path + '-typo'):
+            e = self.failUnlessRaises(errors.TransportError, repomd.Client,
+                url)
+            self.failUnlessEqual(str(e), 'Repository directory %s-typo '
+                'does not exist' % path)
+
+    def _readRepository(self, label):
+        root = os.path.join(self.archivePath, label)
+        files = {}
+        for dirPath, _, fileNames in os.walk(root):
+            for fileName in fileNames:
+                path = os.path.join(dirPath, fileName)
+                files[path[len(root) + 1:]] = file(path).read()
+        return files
+
+    def testBufferStorage(self):
+        files = dict((path, memoryview(data)) for path, data in
+                     self._readRepository('suse-1').iteritems())
+        client = repomd.Client('memory:',
+            storage=storage.BufferStorage(files))
+        pkgs = [ x for x in client.getPackageDetail() ]
+        self.failUnlessEqual([ x.name for x in pkgs ], ['arpwatch', '3ddiag'])
+        self.failUnlessEqual(len(list(client.getPatchDetail())), 2)
+
+        fobj = client.download('repodata/repomd.xml', computeShaDigest=True)
+        self.failUnlessEqual(fobj.sha1sum,
+            '35e108ee39635bd35cdd0793cb22c9b1c8374857')
+        self.failUnlessRaises(errors.TransportError, client.download,
+            'blahblah')
+
+    def testTarStorage(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        try:
+            for mode in ('w', 'w:gz'):
+                path = os.path.join(workDir, 'snapshot.tar')
+                tar = tarfile.open(path, mode)
+                tar.add(os.path.join(self.archivePath, 'suse-1'),
+                    'snapshot-20100517')
+                tar.close()
+
+                client = repomd.Client('snapshot',
+                    storage=storage.TarStorage(path))
+                pkgs = [ x for x in client.getPackageDetail() ]
+                self.failUnlessEqual([ x.name for x in pkgs ],
+                    ['arpwatch', '3ddiag'])
+                self.failUnlessEqual(len(list(client.getPatchDetail())), 2)
+
+                fobj = client.download('repodata/repomd.xml',
+                    computeShaDigest=True)
+                self.failUnlessEqual(fobj.sha1sum,
+                    '35e108ee39635bd35cdd0793cb22c9b1c8374857')
+                fobj.seek(0, 2)
+                self.failUnlessEqual(fobj.tell(), 1180)
+                e = self.failUnlessRaises(errors.TransportError,
+                    client.download, 'blahblah')
+                self.failUnless('snapshot.tar' in str(e))
+        finally:
+            shutil.rmtree(workDir)
+
     def skipTestDownloadThroughProxy(self):
         from conary.repository import transport as conarytransport
         def mockedUrlopen(slf, fullurl, data=None):
@@ -0,0 +1,288 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import random
+import shutil
+import tempfile
+import threading
+from testrunner import testhelp
+from conary.lib.http import http_error
+from repodata import repomd, retry, urlopener
+from repodata_test.generator import RepositoryGenerator
+from repodata_test.httpserver import RepositoryServer
+
+
+def _httpError(errcode):
+    return http_error.ResponseError('http://example.com/', None, errcode,
+        'error')
+
+
+class _Failing(object):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class RetryTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.sleeps = []
+        self.now = 1000.0
+
+    def _policy(self, **kwargs):
+        kwargs.setdefault('breaker', retry.CircuitBreaker(
+            clock=lambda: self.now))
+        return retry.RetryPolicy(sleep=self.sleeps.append,
+            rng=random.Random(0), **kwargs)
+
+    def testJitteredBackoff(self):
+        policy = self._policy(baseDelay=1, maxDelay=4)
+        for attempt in range(1, 50):
+            cap = min(4, 2 ** (attempt - 1))
+            delay = policy.getDelay(attempt)
+            self.failUnless(0 <= delay <= cap, (attempt, delay))
+        delays = set(policy.getDelay(3) for _ in range(10))
+        self.failUnlessEqual(len(delays), 10)
+
+    def testRetryable(self):
+        func = _Failing([ _httpError(503), IOError('reset'),
+                          _httpError(429) ])
+        self.failUnlessEqual(self._policy().call(func, 'a'), 'ok')
+        self.failUnlessEqual(func.calls, 4)
+        self.failUnlessEqual(len(self.sleeps), 3)
+
+    def testFatal(self):
+        for errcode in (404, 403, 501):
+            func = _Failing([ _httpError(errcode) ])
+            self.failUnlessRaises(http_error.ResponseError,
+                self._policy().call, func, 'a')
+            self.failUnlessEqual(func.calls, 1)
+        self.failUnlessEqual(self.sleeps, [])
+
+    def testMaxAttempts(self):
+        func = _Failing([ _httpError(500) ] * 10)
+        self.failUnlessRaises(http_error.ResponseError,
+            self._policy(maxAttempts=3).call, func)
+        self.failUnlessEqual(func.calls, 3)
+
+    def testDeadline(self):
+        func = _Failing([ _httpError(500) ] * 10)
+        policy = self._policy(baseDelay=60, maxDelay=60)
+        deadline = retry.Deadline(5)
+        self.failUnlessRaises(http_error.ResponseError, policy.call, func,
+            deadline=deadline)
+        self.failUnlessEqual(func.calls, 1)
+
+        # Nothing is sent once the deadline passed
+        deadline = retry.Deadline(0)
+        self.failUnlessRaises(retry.DeadlineExceededError, policy.call,
+            func, deadline=deadline)
+        self.failUnlessEqual(func.calls, 1)
+        self.failUnless(retry.Deadline.earliest(None, deadline,
+            retry.Deadline(5)) is deadline)
+        self.failUnless(retry.Deadline.earliest(None) is None)
+
+        # The per request budget applies without a sync deadline
+        func = _Failing([ _httpError(500) ] * 10)
+        policy = self._policy(baseDelay=60, maxDelay=60,
+            requestTimeout=0.001)
+        self.failUnlessRaises(http_error.ResponseError, policy.call, func)
+        self.failUnlessEqual(func.calls, 1)
+
+    def testAttemptTimeout(self):
+        timeouts = []
+        policy = self._policy(requestTimeout=0.5)
+        self.failUnlessEqual(policy.call(timeouts.append, passTimeout=True),
+            None)
+        self.failUnless(0 < timeouts[0] <= 0.5, timeouts)
+
+        # Reads fail once the time of the request is up and give back the
+        # host limiter slot
+        released = []
+        class Response(object):
+            closed = False
+            def read(slf, *args):
+                return 'data'
+            def close(slf):
+                slf.closed = True
+        response = Response()
+        fobj = urlopener._LimitedResponse(response,
+            lambda: released.append(1), time.time() + 0.05)
+        self.failUnlessEqual(fobj.read(), 'data')
+        time.sleep(0.1)
+        self.failUnlessRaises(retry.DeadlineExceededError, fobj.read)
+        self.failUnless(response.closed)
+        self.failUnlessEqual(released, [ 1 ])
+
+    def testSyncTimeoutPerCall(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        server = RepositoryServer(workDir).start()
+        try:
+            RepositoryGenerator(packages=2).generate(workDir)
+            client = repomd.Client(server.url, syncTimeout=0.2)
+            self.failUnlessEqual(len(list(client.getPackageDetail())), 2)
+            # Later calls get their own time budget
+            time.sleep(0.3)
+            self.failUnless(client.refresh() is False)
+            self.failUnlessEqual(len(list(client.getUpdateInfo())),
+                len(list(repomd.Client(workDir).getUpdateInfo())))
+        finally:
+            server.stop()
+            shutil.rmtree(workDir)
+
+    def testSyncTimeoutPerThread(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        server = RepositoryServer(workDir, errorCode=503).start()
+        try:
+            RepositoryGenerator(packages=1).generate(workDir)
+            policy = retry.RetryPolicy(maxAttempts=100000, baseDelay=0.01,
+                maxDelay=0.01, requestTimeout=60,
+                breaker=retry.CircuitBreaker(failureThreshold=100000))
+            client = repomd.Client(server.url, retryPolicy=policy,
+                syncTimeout=1.0)
+            elapsed = {}
+            def download(name):
+                start = time.time()
+                self.failUnlessRaises(http_error.TransportError,
+                    client.download, 'repodata/repomd.xml')
+                elapsed[name] = time.time() - start
+            first = threading.Thread(target=download, args=('first', ))
+            second = threading.Thread(target=download, args=('second', ))
+            first.start()
+            time.sleep(0.5)
+            second.start()
+            first.join()
+            second.join()
+            # The call started later does not extend the first one
+            self.failUnless(0.9 < elapsed['first'] < 1.35, elapsed)
+            self.failUnless(0.9 < elapsed['second'] < 1.35, elapsed)
+        finally:
+            server.stop()
+            shutil.rmtree(workDir)
+
+    def testCircuitBreaker(self):
+        breaker = retry.CircuitBreaker(failureThreshold=3, resetTimeout=10,
+            clock=lambda: self.now)
+        policy = self._policy(maxAttempts=1, breaker=breaker)
+
+        for _ in range(3):
+            self.failUnlessRaises(IOError, policy.call,
+                _Failing([ IOError('refused') ]), 'down')
+        self.failUnless(breaker.isOpen('down'))
+        func = _Failing([])
+        self.failUnlessRaises(retry.HostUnavailableError, policy.call, func,
+            'down')
+        self.failUnlessEqual(func.calls, 0)
+        # Other hosts are not affected, client errors do not count
+        self.failUnlessEqual(policy.call(func, 'up'), 'ok')
+        for _ in range(3):
+            self.failUnlessRaises(http_error.ResponseError, policy.call,
+                _Failing([ _httpError(404) ]), 'up')
+        self.failIf(breaker.isOpen('up'))
+
+        # Half open after the reset timeout, one trial request decides
+        self.now += 11
+        self.failUnlessRaises(IOError, policy.call,
+            _Failing([ IOError('refused') ]), 'down')
+        self.failUnlessRaises(retry.HostUnavailableError, policy.call, func,
+            'down')
+        self.now += 11
+        self.failUnlessEqual(policy.call(func, 'down'), 'ok')
+        self.failIf(breaker.isOpen('down'))
+
+    def testURLOpener(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        server = RepositoryServer(workDir, errorCode=503).start()
+        try:
+            RepositoryGenerator(packages=1).generate(workDir)
+            breaker = retry.CircuitBreaker()
+            opener = urlopener.URLOpener(retryPolicy=retry.RetryPolicy(
+                maxAttempts=3, baseDelay=0.01, breaker=breaker))
+            url = server.url + '/repodata/repomd.xml'
+            self.failUnlessRaises(http_error.TransportError, opener.open,
+                url)
+            self.failUnlessEqual(len(server.requests), 3)
+
+            server.errorCode = None
+            self.failUnlessEqual(opener.open(url).read(), file(
+                os.path.join(workDir, 'repodata', 'repomd.xml')).read())
+        finally:
+            server.stop()
+            shutil.rmtree(workDir)
+
+    def testURLOpenerDefaults(self):
+        class Opener(urlopener.URLOpener):
+            RETRIES_ON_ERROR = 2
+            FATAL_ERRORS = set([ 404, 503 ])
+        policy = urlopener.URLOpener().retryPolicy
+        self.failUnlessEqual(policy.maxAttempts, 6)
+        self.failUnlessEqual(policy.backoffFactor, 1.8)
+        self.failUnless(policy._log is urlopener.log)
+        self.failIf(policy.isRetryable(_httpError(404)))
+        self.failUnless(policy.isRetryable(_httpError(503)))
+        policy = Opener().retryPolicy
+        self.failUnlessEqual(policy.maxAttempts, 2)
+        self.failIf(policy.isRetryable(_httpError(503)))
+
+    def testHostLimiter(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        server = RepositoryServer(workDir, delay=0.05).start()
+        try:
+            RepositoryGenerator(packages=1).generate(workDir)
+            url = server.url + '/repodata/repomd.xml'
+            host = server.url[len('http://'):]
+            limiter = retry.HostLimiter(2)
+            peak = []
+
+            class Opener(urlopener.URLOpener):
+                def _open(slf, *args):
+                    peak.append(limiter.getActive(host))
+                    return urlopener.URLOpener._open(slf, *args)
+
+            opener = Opener(hostLimiter=limiter,
+                retryPolicy=retry.RetryPolicy(maxAttempts=3, baseDelay=0.01,
+                    breaker=retry.CircuitBreaker(),
+                    sleep=lambda x: peak.append(limiter.getActive(host))))
+            def fetch():
+                fobj = opener.open(url)
+                fobj.read()
+                fobj.close()
+            threads = [ threading.Thread(target=fetch) for _ in range(6) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.failUnlessEqual(max(peak), 2)
+            self.failUnlessEqual(limiter.getActive(host), 0)
+
+            # Failed attempts give back their slot before the backoff
+            del peak[:]
+            server.errorCode = 503
+            self.failUnlessRaises(http_error.TransportError, opener.open,
+                url)
+            self.failUnlessEqual(peak, [ 1, 0, 1, 0, 1 ])
+            self.failUnlessEqual(limiter.getActive(host), 0)
+        finally:
+            server.stop()
+            shutil.rmtree(workDir)
@@ -0,0 +1,172 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import rpmver
+from repodata.repomd.patchxml import _Patch
+from repodata_test.generator import RepositoryGenerator
+
+# From the rpmvercmp tests in the rpm source tree
+RPMVERCMP_TESTS = """
+1.0 1.0 0
+1.0 2.0 -1
+2.0 1.0 1
+2.0.1 2.0.1 0
+2.0 2.0.1 -1
+2.0.1 2.0 1
+2.0.1a 2.0.1a 0
+2.0.1a 2.0.1 1
+2.0.1 2.0.1a -1
+5.5p1 5.5p1 0
+5.5p1 5.5p2 -1
+5.5p2 5.5p1 1
+5.5p10 5.5p10 0
+5.5p1 5.5p10 -1
+5.5p10 5.5p1 1
+10xyz 10.1xyz -1
+10.1xyz 10xyz 1
+xyz10 xyz10 0
+xyz10 xyz10.1 -1
+xyz10.1 xyz10 1
+xyz.4 xyz.4 0
+xyz.4 8 -1
+8 xyz.4 1
+xyz.4 2 -1
+2 xyz.4 1
+5.5p2 5.6p1 -1
+5.6p1 5.5p2 1
+5.6p1 6.5p1 -1
+6.5p1 5.6p1 1
+6.0.rc1 6.0 1
+6.0 6.0.rc1 -1
+10b2 10a1 1
+10a2 10b2 -1
+1.0aa 1.0aa 0
+1.0a 1.0aa -1
+1.0aa 1.0a 1
+10.0001 10.0001 0
+10.0001 10.1 0
+10.1 10.0001 0
+10.0001 10.0039 -1
+10.0039 10.0001 1
+4.999.9 5.0 -1
+5.0 4.999.9 1
+20101121 20101121 0
+20101121 20101122 -1
+20101122 20101121 1
+2_0 2_0 0
+2.0 2_0 0
+2_0 2.0 0
+a a 0
+a+ a+ 0
+a+ a_ 0
+a_ a+ 0
++a +a 0
++a _a 0
+_a +a 0
++_ +_ 0
+_+ +_ 0
+_+ _+ 0
++ _ 0
+_ + 0
+1.0~rc1 1.0~rc1 0
+1.0~rc1 1.0 -1
+1.0 1.0~rc1 1
+1.0~rc1 1.0~rc2 -1
+1.0~rc2 1.0~rc1 1
+1.0~rc1~git123 1.0~rc1~git123 0
+1.0~rc1~git123 1.0~rc1 -1
+1.0~rc1 1.0~rc1~git123 1
+1.0^ 1.0^ 0
+1.0^ 1.0 1
+1.0 1.0^ -1
+1.0^git1 1.0^git1 0
+1.0^git1 1.0 1
+1.0 1.0^git1 -1
+1.0^git1 1.0^git2 -1
+1.0^git2 1.0^git1 1
+1.0^git1 1.01 -1
+1.01 1.0^git1 1
+1.0^20160101 1.0^20160101 0
+1.0^20160101 1.0.1 -1
+1.0.1 1.0^20160101 1
+1.0^20160101^git1 1.0^20160101^git1 0
+1.0^20160102 1.0^20160101^git1 1
+1.0^20160101^git1 1.0^20160102 -1
+1.0~rc1^git1 1.0~rc1^git1 0
+1.0~rc1^git1 1.0~rc1 1
+1.0~rc1 1.0~rc1^git1 -1
+1.0^git1~pre 1.0^git1~pre 0
+1.0^git1 1.0^git1~pre 1
+1.0^git1~pre 1.0^git1 -1
+"""
+
+
+class RpmVerTest(testhelp.TestCase):
+    def testRpmvercmp(self):
+        for line in RPMVERCMP_TESTS.strip().splitlines():
+            first, second, expected = line.split()
+            self.failUnlessEqual(rpmver.rpmvercmp(first, second),
+                int(expected), line)
+
+    def testEvrcmp(self):
+        self.failUnlessEqual(rpmver.evrcmp(('1', '1.0', '1'),
+            ('0', '2.0', '1')), 1)
+        self.failUnlessEqual(rpmver.evrcmp((None, '1.0', '1'),
+            ('0', '1.0', '1')), 0)
+        self.failUnlessEqual(rpmver.evrcmp(('0', '1.0', '1.2'),
+            ('0', '1.0', '1.10')), -1)
+
+    def testPatchOrder(self):
+        patches = []
+        for version in ('10', '9', '100'):
+            patch = _Patch()
+            patch.version = version
+            patch.release = '0'
+            patches.append(patch)
+        patches.sort()
+        self.failUnlessEqual([ x.version for x in patches ],
+            ['9', '10', '100'])
+
+    def testLatestPackages(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        try:
+            RepositoryGenerator(packages=6).generate(workDir)
+            pkgs = [ x for x in repomd.Client(workDir).getPackageDetail() ]
+            newer = rpmver.getLatestPackages(pkgs + [ self._bump(pkgs[0]) ])
+            self.failUnlessEqual(len(newer), 6)
+            self.failUnlessEqual(newer[(pkgs[0].name, pkgs[0].arch)].release,
+                pkgs[0].release + '.1')
+
+            latest = repomd.Client(workDir).getLatestPackages()
+            self.failUnlessEqual(sorted(latest.keys()),
+                sorted((x.name, x.arch) for x in pkgs))
+        finally:
+            shutil.rmtree(workDir)
+
+    @classmethod
+    def _bump(cls, pkg):
+        newer = pkg.__class__()
+        newer.name = pkg.name
+        newer.arch = pkg.arch
+        newer.epoch = pkg.epoch
+        newer.version = pkg.version
+        newer.release = pkg.release + '.1'
+        return newer
@@ -0,0 +1,188 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import xml.parsers.expat
+from testrunner import testhelp
+from conary.lib.http import http_error
+from repodata import repomd
+from repodata.repomd import storage
+from repodata.repomd.scheduler import RefreshScheduler
+from repodata_test.generator import RepositoryGenerator
+
+DAY = 86400
+
+
+class _RepoMd(object):
+    def __init__(self, revision, timestamp):
+        self.revision = revision
+        self.timestamp = timestamp
+
+    def getFingerprint(self):
+        return (self.revision, ())
+
+    def getTimestamp(self):
+        return self.timestamp
+
+
+class _Client(object):
+    """
+    Stands in for repomd.Client, the repository is changed by setting
+    revision and timestamp.
+    """
+
+    def __init__(self, revision, timestamp):
+        self.revision = revision
+        self.timestamp = timestamp
+        self.error = None
+        self.repomdXml = None
+
+    def refresh(self):
+        if self.error is not None:
+            raise self.error
+        self.repomdXml = _RepoMd(self.revision, self.timestamp)
+
+
+class SchedulerTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.now = 100 * DAY
+
+    def _scheduler(self, budget=1000, **kwargs):
+        return RefreshScheduler(budget, clock=lambda: self.now, **kwargs)
+
+    def testAdaptiveIntervals(self):
+        scheduler = self._scheduler(minInterval=60)
+        busy = _Client(0, self.now - 60)
+        static = _Client(0, self.now - 30 * DAY)
+        scheduler.addClient('busy', busy)
+        scheduler.addClient('static', static)
+
+        changed = []
+        for step in range(2 * DAY / 60):
+            self.now += 60
+            if step % 10 == 0:
+                busy.revision += 1
+                busy.timestamp = self.now
+            changed.extend(scheduler.runOnce())
+
+        busyState = scheduler.getState('busy')
+        staticState = scheduler.getState('static')
+        self.failUnlessEqual(staticState.interval, DAY)
+        self.failUnless(staticState.polls <= 3, staticState.polls)
+        self.failUnlessEqual(staticState.changes, 0)
+
+        self.failUnless(abs(busyState.changeInterval - 600) < 60,
+            busyState.changeInterval)
+        self.failUnlessEqual(busyState.interval, 300)
+        # Every change is seen, at most one poll later than it happened
+        self.failUnless(busyState.changes >= 2 * DAY / 600 - 2)
+        self.failUnlessEqual(changed.count('busy'), busyState.changes)
+        self.failUnlessEqual(len(busyState.history),
+            RefreshScheduler.HISTORY_SIZE)
+        self.failUnlessEqual(busyState.history[-1][1], busy.revision)
+        self.failUnless(0.4 < scheduler.hitRate <= 0.55, scheduler.hitRate)
+
+        schedule = scheduler.getSchedule()
+        self.failUnlessEqual(sorted(x.name for x in schedule),
+            [ 'busy', 'static' ])
+        self.failUnless(schedule[0].nextPoll <= schedule[1].nextPoll)
+        self.failUnlessEqual(scheduler.getNextPollTime(),
+            schedule[0].nextPoll)
+
+    def testBudget(self):
+        scheduler = self._scheduler(budget=10, period=3600)
+        clients = {}
+        for i in range(50):
+            clients[i] = _Client(0, self.now - DAY)
+            scheduler.addClient(i, clients[i])
+
+        scheduler.runOnce()
+        polled = [ x.name for x in scheduler.getSchedule()
+                   if x.lastPoll is not None ]
+        self.failUnlessEqual(len(polled), 10)
+        # Repositories are due, but nothing can be polled before the next
+        # token arrives
+        self.failUnlessEqual(scheduler.getNextPollTime(), self.now + 360)
+        self.now += 180
+        self.failUnlessEqual(scheduler.getNextPollTime(), self.now + 180)
+        self.now -= 180
+
+        # One token refills every 360 seconds, it goes to a repository
+        # that has never been polled
+        self.now += 360
+        scheduler.runOnce()
+        self.failUnlessEqual(len([ x for x in scheduler.getSchedule()
+                                   if x.lastPoll is not None ]), 11)
+        self.failUnlessEqual(sum(x.polls for x in scheduler.getSchedule()),
+            11)
+
+    def testFailure(self):
+        scheduler = self._scheduler()
+        client = _Client(0, self.now - DAY)
+        scheduler.addClient('repo', client)
+        scheduler.runOnce()
+        interval = scheduler.getState('repo').interval
+
+        client.error = http_error.TransportError('connection refused')
+        self.now += interval
+        self.failUnlessEqual(scheduler.runOnce(), [])
+        state = scheduler.getState('repo')
+        self.failUnlessEqual(state.failures, 1)
+        self.failUnlessEqual(state.interval, interval * 2)
+        self.failUnlessEqual(state.nextPoll, self.now + interval * 2)
+
+        # A malformed repomd.xml fails only the poll of its repository
+        other = _Client(0, self.now - DAY)
+        scheduler.addClient('other', other)
+        client.error = xml.parsers.expat.ExpatError('not well-formed')
+        self.now += interval * 2
+        self.failUnlessEqual(scheduler.runOnce(), [])
+        self.failUnlessEqual(state.failures, 2)
+        self.failUnlessEqual(scheduler.getState('other').polls, 1)
+
+    def testClientRefresh(self):
+        workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        try:
+            versions = []
+            for seed in (0, 1):
+                repoDir = os.path.join(workDir, str(seed))
+                RepositoryGenerator(packages=5, seed=seed).generate(repoDir)
+                versions.append(self._readFiles(repoDir))
+
+            files = dict(versions[0])
+            client = repomd.Client('memory:',
+                storage=storage.BufferStorage(files))
+            self.failUnless(client.refresh())
+            self.failIf(client.refresh())
+
+            fingerprint = client.repomdXml.getFingerprint()
+            client._repo._storage = storage.BufferStorage(versions[1])
+            self.failUnless(client.refresh())
+            self.failIfEqual(client.repomdXml.getFingerprint(), fingerprint)
+            self.failUnlessEqual(len(list(client.getPackageDetail())), 5)
+        finally:
+            shutil.rmtree(workDir)
+
+    def _readFiles(self, root):
+        files = {}
+        for dirPath, _, fileNames in os.walk(root):
+            for fileName in fileNames:
+                path = os.path.join(dirPath, fileName)
+                files[path[len(root) + 1:]] = file(path).read()
+        return files
@@ -0,0 +1,175 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import time
+import shutil
+import urllib2
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd.service import MetadataService, QueryError, RepoIndex
+from repodata_test.generator import RepositoryGenerator
+
+
+class ServiceTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        RepositoryGenerator(packages=5).generate(self.workDir)
+        self.service = MetadataService(minInterval=0.01, maxInterval=0.01)
+        self.service.addRepository('repo', repomd.Client(self.workDir))
+
+    def tearDown(self):
+        self.service.stop()
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _get(self, path):
+        fobj = urllib2.urlopen(self.service.url + path)
+        try:
+            return json.loads(fobj.read())
+        finally:
+            fobj.close()
+
+    def _names(self, results):
+        return sorted((x['repo'], x['name']) for x in results)
+
+    def testQueries(self):
+        query = self.service.query
+        pkgs = query('/packages', dict(name='pkg00001'))
+        self.failUnlessEqual(len(pkgs), 1)
+        pkg = pkgs[0]
+        self.failUnlessEqual((pkg['repo'], pkg['version'], pkg['release'],
+            pkg['arch']), ('repo', '1.11.23', '194.8', 'x86_64'))
+        self.failUnlessEqual(query('/packages', dict(name='pkg00001',
+            epoch='0', version='1.11.23', release='194.8',
+            arch='x86_64')), pkgs)
+        self.failUnlessEqual(query('/packages', dict(name='pkg00001',
+            arch='i586')), [])
+
+        self.failUnlessEqual(query('/whatprovides',
+            dict(capability='pkg00002')), query('/packages',
+            dict(name='pkg00002')))
+        # Files only listed in filelists.xml are found
+        self.failUnlessEqual(self._names(query('/fileowner',
+            dict(path='/usr/share/pkg00003/file0003'))),
+            [ ('repo', 'pkg00003') ])
+        self.failUnlessEqual(self._names(query('/whatprovides',
+            dict(capability='/usr/share/pkg00003/file0003'))),
+            [ ('repo', 'pkg00003') ])
+
+        advisories = query('/advisories', dict(cve='CVE-2010-0001'))
+        self.failUnlessEqual([ x['id'] for x in advisories ],
+            [ 'update-00001' ])
+        self.failUnlessEqual(query('/advisories', dict(id='update-00001')),
+            advisories)
+        self.failUnless('update-00000' in [ x['id'] for x in
+            query('/advisories', dict(package='pkg00003', arch='i586')) ])
+
+        repos = query('/repos', {})
+        self.failUnlessEqual([ (x['name'], x['packages']) for x in repos ],
+            [ ('repo', 5) ])
+
+        e = self.failUnlessRaises(QueryError, query, '/packages', {})
+        self.failUnlessEqual(e.status, 400)
+        e = self.failUnlessRaises(QueryError, query, '/packages',
+            dict(name='pkg00001', repo='other'))
+        self.failUnlessEqual(e.status, 404)
+        e = self.failUnlessRaises(QueryError, query, '/nothing', {})
+        self.failUnlessEqual(e.status, 404)
+
+    def testRefresh(self):
+        old = self.service.getIndex('repo')
+        time.sleep(0.02)
+        self.failUnlessEqual(self.service.refresh(), [])
+        self.failUnless(self.service.getIndex('repo') is old)
+
+        RepositoryGenerator(packages=6, seed=1).generate(self.workDir)
+        time.sleep(0.02)
+        self.failUnlessEqual(self.service.refresh(), [ 'repo' ])
+        new = self.service.getIndex('repo')
+        self.failIf(new is old)
+        self.failUnlessEqual(new.packageCount, 6)
+        # The old index stays intact for queries still using it
+        self.failUnlessEqual(old.packageCount, 5)
+        self.failUnlessEqual(old.findPackages('pkg00005'), [])
+
+    def testFailedReload(self):
+        old = self.service.getIndex('repo')
+        time.sleep(0.02)
+        self.service.refresh()
+        RepositoryGenerator(packages=6, seed=1).generate(self.workDir)
+        loads = []
+        def load(name, client):
+            loads.append(name)
+            if len(loads) == 1:
+                raise IOError('primary.xml.gz is gone')
+            return RepoIndex(name, client)
+        self.service.RepoIndexFactory = load
+
+        # The old index stays in service and the change is reloaded on the
+        # next poll, although repomd.xml did not change again
+        time.sleep(0.02)
+        self.failUnlessEqual(self.service.refresh(), [])
+        self.failUnless(self.service.getIndex('repo') is old)
+        time.sleep(0.02)
+        self.failUnlessEqual(self.service.refresh(), [ 'repo' ])
+        self.failUnlessEqual(self.service.getIndex('repo').packageCount, 6)
+        self.failUnlessEqual(self.service.scheduler.getState(
+            'repo').changes, 1)
+        time.sleep(0.02)
+        self.failUnlessEqual(self.service.refresh(), [])
+
+    def testRefreshLoopErrors(self):
+        calls = []
+        def refresh():
+            calls.append(None)
+            if len(calls) == 1:
+                raise ValueError('unexpected')
+            return []
+        self.service.refresh = refresh
+        self.service.CHECK_INTERVAL = 0.01
+        self.service.start()
+        for _ in range(100):
+            if len(calls) > 1:
+                break
+            time.sleep(0.01)
+        self.failUnless(len(calls) > 1)
+
+    def testHttp(self):
+        self.service.start()
+        try:
+            pkgs = self._get('/packages?name=pkg00004')
+            self.failUnlessEqual(self._names(pkgs), [ ('repo', 'pkg00004') ])
+            self.failUnlessEqual(self._get('/repos')[0]['name'], 'repo')
+
+            e = self.failUnlessRaises(urllib2.HTTPError, self._get,
+                '/whatprovides')
+            self.failUnlessEqual(e.code, 400)
+            self.failUnless('capability' in json.loads(e.read())['error'])
+
+            # The refresh thread picks up the change on its own
+            RepositoryGenerator(packages=6, seed=1).generate(self.workDir)
+            for _ in range(100):
+                if self._get('/packages?name=pkg00005'):
+                    break
+                time.sleep(0.05)
+            self.failUnlessEqual(self._names(self._get(
+                '/packages?name=pkg00005&repo=repo')),
+                [ ('repo', 'pkg00005') ])
+        finally:
+            self.service.stop()
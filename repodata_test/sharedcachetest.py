@@ -0,0 +1,196 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import __builtin__
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import sharedcache, checksum
+from repodata_test.generator import RepositoryGenerator
+from repodata_test.httpserver import RepositoryServer
+
+CONTENTS = 'contents of a metadata file\n' * 100
+CHECKSUM = hashlib.sha256(CONTENTS).hexdigest()
+
+
+class SharedCacheTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+        self.cacheDir = os.path.join(self.workDir, 'cache')
+        self.downloads = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _download(self, fobj):
+        self.downloads += 1
+        time.sleep(0.1)
+        fobj.write(CONTENTS)
+
+    def testSingleFlight(self):
+        cache = sharedcache.SharedCache(self.cacheDir)
+        url = 'http://example.com/repodata/primary.xml.gz'
+        paths = []
+        def fetch():
+            paths.append(cache.fetch(url, CHECKSUM, 'sha256',
+                self._download))
+        threads = [ threading.Thread(target=fetch) for _ in range(8) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.failUnlessEqual(self.downloads, 1)
+        self.failUnlessEqual(cache.fills, 1)
+        self.failUnlessEqual(cache.hits, 7)
+        self.failUnlessEqual(set(paths), set([ cache.getPath(url,
+            CHECKSUM) ]))
+        self.failUnlessEqual(file(paths[0]).read(), CONTENTS)
+        self.failUnless(paths[0].endswith('-primary.xml.gz'))
+
+        # A new revision of the file is a new entry
+        self.failIfEqual(cache.getPath(url, 'abc'), paths[0])
+
+    def testChecksumMismatch(self):
+        cache = sharedcache.SharedCache(self.cacheDir)
+        url = 'http://example.com/repodata/primary.xml.gz'
+        self.failUnlessRaises(checksum.ChecksumMismatchError, cache.fetch,
+            url, '0' * 64, 'sha256', self._download)
+        self.failIf(os.path.exists(cache.getPath(url, '0' * 64)))
+        self.failIf([ x for x in os.listdir(self.cacheDir)
+                      if not x.endswith('.lock') ])
+
+    def testPrune(self):
+        cache = sharedcache.SharedCache(self.cacheDir)
+        old = cache.fetch('http://example.com/old', CHECKSUM, 'sha256',
+            self._download)
+        new = cache.fetch('http://example.com/new', CHECKSUM, 'sha256',
+            self._download)
+        os.utime(old, (time.time() - 7200, time.time() - 7200))
+        self.failUnlessEqual(cache.prune(3600), 1)
+        self.failIf(os.path.exists(old))
+        self.failUnless(os.path.exists(new))
+        # The lock file of the removed entry goes with it
+        self.failIf(os.path.exists(old + '.lock'))
+        self.failUnless(os.path.exists(new + '.lock'))
+
+        # Lock files held by a filler are kept
+        held = open(new + '.lock', 'a')
+        fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+        os.unlink(new)
+        try:
+            cache.prune(3600)
+            self.failUnless(os.path.exists(new + '.lock'))
+        finally:
+            held.close()
+        cache.prune(3600)
+        self.failIf(os.path.exists(new + '.lock'))
+
+        # Partial downloads are left to their filler for much longer
+        tmpPath = os.path.join(self.cacheDir, '.tmp-download')
+        file(tmpPath, 'w').write('partial')
+        os.utime(tmpPath, (time.time() - 7200, time.time() - 7200))
+        self.failUnlessEqual(cache.prune(3600), 0)
+        self.failUnlessEqual(cache.prune(3 * 24 * 3600), 0)
+        os.utime(tmpPath, (0, 0))
+        self.failUnlessEqual(cache.prune(3600), 1)
+
+    def testPrunedLockFile(self):
+        # A lock file removed between opening and locking it is not used
+        cache = sharedcache.SharedCache(self.cacheDir)
+        url = 'http://example.com/repodata/primary.xml.gz'
+        lockPath = cache.getPath(url, CHECKSUM) + '.lock'
+        realOpen = __builtin__.open
+        opened = []
+        def prunedOpen(path, mode):
+            fobj = realOpen(path, mode)
+            if path == lockPath and not opened:
+                opened.append(fobj)
+                cache.prune(3600)
+            return fobj
+        sharedcache.open = prunedOpen
+        try:
+            path = cache.fetch(url, CHECKSUM, 'sha256', self._download)
+        finally:
+            del sharedcache.open
+        self.failUnlessEqual(len(opened), 1)
+        self.failUnlessEqual(file(path).read(), CONTENTS)
+        self.failUnless(os.path.exists(lockPath))
+
+    def testThreadsShareDownloads(self):
+        repoDir = os.path.join(self.workDir, 'repo')
+        RepositoryGenerator(packages=1).generate(repoDir)
+        server = RepositoryServer(repoDir, delay=0.1).start()
+        try:
+            repo = repomd.repository.Repository(server.url)
+            contents = []
+            def get():
+                fobj = repo.get('repodata/repomd.xml')
+                contents.append(fobj.read())
+                fobj.close()
+            threads = [ threading.Thread(target=get) for _ in range(6) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.failUnlessEqual(len(server.requests), 1)
+            self.failUnlessEqual(contents, [ file(os.path.join(repoDir,
+                'repodata', 'repomd.xml')).read() ] * 6)
+            self.failUnlessEqual(repo._flights, {})
+
+            # Later gets download the file again
+            repo.get('repodata/repomd.xml').close()
+            self.failUnlessEqual(len(server.requests), 2)
+        finally:
+            server.stop()
+
+    def testProcessesShareDownloads(self):
+        repoDir = os.path.join(self.workDir, 'repo')
+        RepositoryGenerator(packages=20).generate(repoDir)
+        server = RepositoryServer(repoDir, delay=0.1).start()
+        try:
+            pids = []
+            for _ in range(4):
+                pid = os.fork()
+                if pid == 0:
+                    status = 1
+                    try:
+                        client = repomd.Client(server.url,
+                            cacheDir=self.cacheDir)
+                        if len(list(client.getPackageDetail())) == 20:
+                            status = 0
+                    finally:
+                        os._exit(status)
+                pids.append(pid)
+            for pid in pids:
+                self.failUnlessEqual(os.waitpid(pid, 0)[1], 0)
+
+            primary = [ x for x in server.requests if 'primary' in x ]
+            self.failUnlessEqual(len(primary), 1)
+            # repomd.xml has no checksum to key it by and is always fetched
+            self.failUnlessEqual(len([ x for x in server.requests
+                                       if x.endswith('repomd.xml') ]), 4)
+        finally:
+            server.stop()
@@ -0,0 +1,96 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import shutil
+import tempfile
+from repodata import repomd
+from repodata.repomd import updateindex
+from repodata_test import repomdtest
+from repodata_test.generator import RepositoryGenerator
+
+
+class UpdateInfoIndexTest(repomdtest.BaseTest):
+    def setUp(self):
+        repomdtest.BaseTest.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        repomdtest.BaseTest.tearDown(self)
+
+    def testLookups(self):
+        client = repomd.Client(self.getRepositoryUrl('suse-1'))
+        index = client.getUpdateIndex()
+        self.failUnlessEqual(len(index), 4)
+
+        self.failUnlessEqual(index.getAdvisory('slessp0-curl').title,
+            'Security update for curl')
+        self.failUnlessEqual(
+            [ x.id for x in index.findByReference('479606', 'bugzilla') ],
+            ['slessp0-lcms'])
+        self.failUnlessEqual([ x.id for x in index.findByReference('479606') ],
+            ['slessp0-lcms'])
+        self.failUnlessEqual(index.findByReference('479606', 'cve'), [])
+        self.failUnlessEqual([ x.id for x in index.findByPackage('libcurl4') ],
+            ['slessp0-curl'])
+        self.failUnlessEqual(
+            [ x.id for x in index.findByPackage('libcurl4', 'i586') ],
+            ['slessp0-curl'])
+        self.failUnlessEqual(index.findByPackage('libcurl4', 'x86_64'), [])
+
+        self.failUnlessEqual([ x.id for x in index.iterUpdates(
+            issuedAfter=1237334000, issuedBefore=1237378978) ],
+            ['slessp0-curl', 'slessp0-ghostscript-devel'])
+
+    def testCve(self):
+        RepositoryGenerator(packages=10, updates=5).generate(self.workDir)
+        index = repomd.Client(self.workDir).getUpdateIndex()
+        self.failUnlessEqual(
+            [ x.id for x in index.findByCve('CVE-2010-0003') ],
+            ['update-00003'])
+
+    def testPersistence(self):
+        url = self.getRepositoryUrl('suse-1')
+        snapshotDir = os.path.join(self.workDir, 'snapshots')
+        index = repomd.Client(url, snapshotDir=snapshotDir).getUpdateIndex()
+        self.failUnlessEqual(sorted(os.listdir(snapshotDir)),
+            ['updateindex-819e1f3d9bc0263dcfe5942e002cb8364f8aa009.snap',
+             'updateinfo-819e1f3d9bc0263dcfe5942e002cb8364f8aa009.snap'])
+
+        # The stored index is loaded instead of being rebuilt
+        class Index(updateindex.UpdateInfoIndex):
+            def add(self, update):
+                raise AssertionError('index rebuilt')
+        client = repomd.Client(url, snapshotDir=snapshotDir)
+        client.UpdateInfoIndexFactory = Index
+        loaded = client.getUpdateIndex()
+        self.failUnlessEqual(loaded.getTables(), index.getTables())
+        update = loaded.findByPackage('liblcms1')[0]
+        self.failUnlessEqual(update.id, 'slessp0-lcms')
+        self.failUnlessEqual([ (x.name, x.version, x.release)
+            for x in update.pkglist ], [ (x.name, x.version, x.release)
+            for x in index.getAdvisory('slessp0-lcms').pkglist ])
+        self.failUnlessEqual(update.references[0].href,
+            'https://bugzilla.novell.com/show_bug.cgi?id=479606')
+
+    def testParseIssued(self):
+        self.failUnlessEqual(updateindex.parseIssued('1237378978'),
+            1237378978)
+        self.failUnlessEqual(updateindex.parseIssued('2009-03-18 12:22:58'),
+            1237378978)
+        self.failUnlessEqual(updateindex.parseIssued('bogus'), None)
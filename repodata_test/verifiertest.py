@@ -0,0 +1,82 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import hashlib
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import packagexml
+from repodata.repomd.verifier import MirrorVerifier
+from repodata_test.generator import RepositoryGenerator
+
+
+class VerifierTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    def _addPackage(self, location, contents):
+        path = os.path.join(self.workDir, location)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        file(path, 'w').write(contents)
+        pkg = packagexml._Package()
+        pkg.location = location
+        pkg.packageSize = str(len(contents))
+        pkg.checksumType = 'sha'
+        pkg.checksum = hashlib.sha1(contents).hexdigest()
+        return pkg
+
+    def testVerify(self):
+        pkgs = [ self._addPackage('Packages/pkg%02d.rpm' % i, 'rpm %d' % i)
+                 for i in range(40) ]
+
+        # Same size, different contents
+        file(os.path.join(self.workDir, 'Packages/pkg03.rpm'), 'w').write(
+            'rpm 4')
+        # Different size
+        file(os.path.join(self.workDir, 'Packages/pkg05.rpm'), 'a').write(
+            'x')
+        os.unlink(os.path.join(self.workDir, 'Packages/pkg07.rpm'))
+        self._addPackage('Packages/extra.rpm', 'extra')
+        self._addPackage('repodata/repomd.xml', 'ignored')
+
+        report = MirrorVerifier(processes=2).verify(iter(pkgs), self.workDir)
+        self.failUnlessEqual(report.verified, 37)
+        self.failUnlessEqual(report.missing, [ 'Packages/pkg07.rpm' ])
+        self.failUnlessEqual([ x[0] for x in report.corrupt ],
+            [ 'Packages/pkg03.rpm', 'Packages/pkg05.rpm' ])
+        self.failUnless(report.corrupt[1][1].startswith('size 6'))
+        self.failUnlessEqual(report.extra, [ 'Packages/extra.rpm' ])
+        self.failIf(report.isClean())
+        # The file with the wrong size is not hashed
+        self.failUnlessEqual(report.bytes,
+            sum(len('rpm %d' % i) for i in range(40) if i not in (5, 7)))
+
+    def testVerifyMirror(self):
+        repoDir = os.path.join(self.workDir, 'repo')
+        RepositoryGenerator(packages=3).generate(repoDir)
+        client = repomd.Client(repoDir)
+        report = client.verifyMirror(repoDir, processes=1)
+        self.failUnlessEqual(report.missing,
+            sorted(x.location for x in client.getPackageDetail()))
+        self.failUnlessEqual(report.extra, [])
@@ -0,0 +1,147 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import gzip
+import shutil
+import tempfile
+from testrunner import testhelp
+from repodata import repomd
+from repodata.repomd import checksum, packagexml, snapshot
+from repodata.repomd.writer import RepoMdWriter, PackageScanner, \
+    _isPrimaryFile
+from repodata_test.generator import RepositoryGenerator
+
+
+class WriterTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.workDir = tempfile.mkdtemp(prefix='repodata-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.workDir)
+        testhelp.TestCase.tearDown(self)
+
+    @classmethod
+    def _readPackages(cls, client):
+        pkgs = list(client.getPackageDetail())
+        fileLists = dict((x.pkgid, x.files)
+                         for x in client.getFileLists())
+        for pkg in pkgs:
+            pkg.files = fileLists[pkg.pkgid]
+        return pkgs
+
+    @classmethod
+    def _readLines(cls, path):
+        return file(path).read().splitlines()
+
+    def testPrimaryFiles(self):
+        self.failUnlessEqual([ _isPrimaryFile(x) for x in (
+            '/etc/foo.conf', '/usr/bin/foo', '/usr/sbin/foo',
+            '/usr/lib/foo/bin/sub/foo', '/usr/lib/sendmail',
+            '/opt/foobin/x', '/usr/lib/sendmail.cf', '/etcetera/foo',
+            '/usr/bin') ],
+            [ True ] * 5 + [ False ] * 4)
+
+    def testRoundTrip(self):
+        srcDir = os.path.join(self.workDir, 'src')
+        destDir = os.path.join(self.workDir, 'dest')
+        RepositoryGenerator(packages=12, files=3, updates=4,
+            patches=0).generate(srcDir)
+        src = repomd.Client(srcDir)
+        pkgs = self._readPackages(src)
+        updates = list(src.getUpdateInfo())
+
+        writer = RepoMdWriter(destDir, timestamp=1274094576, revision='42')
+        writer.writePackages(iter(pkgs))
+        writer.writeUpdateInfo(iter(updates))
+        writer.finish()
+
+        dest = repomd.Client(destDir)
+        self.failUnlessEqual(dest.repomdXml.revision, '42')
+        self.failUnlessEqual(
+            [ snapshot.packageToRecord(x) for x in self._readPackages(dest) ],
+            [ snapshot.packageToRecord(x) for x in pkgs ])
+        self.failUnlessEqual(
+            [ snapshot.updateToRecord(x) for x in dest.getUpdateInfo() ],
+            [ snapshot.updateToRecord(x) for x in updates ])
+
+        mdDir = os.path.join(destDir, 'repodata')
+        self.failUnlessEqual(sorted(os.listdir(mdDir)), [ 'filelists.xml.gz',
+            'primary.xml.gz', 'repomd.xml', 'updateinfo.xml.gz' ])
+        for node in dest.repomdXml.getRepoData():
+            path = os.path.join(destDir, node.location)
+            self.failUnlessEqual(node.checksumType, 'sha256')
+            self.failUnlessEqual(checksum.fileChecksum(path, 'sha256'),
+                node.checksum)
+            self.failUnlessEqual(int(node.size), os.stat(path).st_size)
+            data = gzip.GzipFile(path).read()
+            self.failUnlessEqual(int(node.openSize), len(data))
+            digest = checksum.getDigest('sha256')
+            digest.update(data)
+            self.failUnlessEqual(node.openChecksum, digest.hexdigest())
+            self.failUnlessEqual(node.timestamp, 1274094576)
+
+    def testIncrementalScan(self):
+        rpmDir = os.path.join(self.workDir, 'repo')
+        os.makedirs(os.path.join(rpmDir, 'x86_64'))
+        for i in range(5):
+            file(os.path.join(rpmDir, 'x86_64', 'pkg%d.rpm' % i), 'w').write(
+                'rpm %d' % i)
+        os.makedirs(os.path.join(rpmDir, 'repodata'))
+        file(os.path.join(rpmDir, 'repodata', 'ignored.rpm'), 'w').write('')
+
+        # Headers are read in the worker processes
+        readLog = os.path.join(self.workDir, 'reads')
+        def readHeader(path):
+            file(readLog, 'a').write(os.path.basename(path) + '\n')
+            pkg = packagexml._Package()
+            pkg.name = os.path.basename(path)[:-4]
+            pkg.arch = 'x86_64'
+            pkg.epoch, pkg.version, pkg.release = '0', '1.0', '1'
+            return pkg
+
+        cachePath = os.path.join(self.workDir, 'scancache')
+        scanner = PackageScanner(readHeader, cachePath=cachePath,
+            processes=2)
+        pkgs = list(scanner.scan(rpmDir))
+        self.failUnlessEqual(len(self._readLines(readLog)), 5)
+        self.failUnlessEqual([ x.location for x in pkgs ],
+            [ 'x86_64/pkg%d.rpm' % i for i in range(5) ])
+        self.failUnlessEqual(pkgs[2].checksum, checksum.fileChecksum(
+            os.path.join(rpmDir, 'x86_64', 'pkg2.rpm'), 'sha256'))
+        self.failUnlessEqual(pkgs[2].packageSize, '5')
+
+        os.unlink(readLog)
+        self.failUnlessEqual(
+            [ snapshot.packageToRecord(x) for x in scanner.scan(rpmDir) ],
+            [ snapshot.packageToRecord(x) for x in pkgs ])
+        self.failIf(os.path.exists(readLog))
+
+        file(os.path.join(rpmDir, 'x86_64', 'pkg3.rpm'), 'w').write(
+            'changed rpm 3')
+        os.unlink(os.path.join(rpmDir, 'x86_64', 'pkg4.rpm'))
+        pkgs = list(scanner.scan(rpmDir))
+        self.failUnlessEqual(self._readLines(readLog), [ 'pkg3.rpm' ])
+        self.failUnlessEqual(len(pkgs), 4)
+        self.failUnlessEqual(pkgs[3].packageSize, '13')
+
+        writer = RepoMdWriter(rpmDir)
+        writer.writePackages(pkgs)
+        writer.finish()
+        self.failUnlessEqual([ x.location for x in
+            repomd.Client(rpmDir).getPackageDetail() ],
+            [ x.location for x in pkgs ])